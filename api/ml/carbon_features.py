@@ -0,0 +1,286 @@
+import json
+
+import numpy as np
+
+from metrics import PREDICTION_ERRORS, PREDICTIONS, STAGE_SECONDS
+
+# Scaler expects these 17 features (order of feature_scaler.pkl)
+SCALER_FEATURE_NAMES = [
+    'product_weight_kg', 'handmade_level', 'material_quantity_kg',
+    'recycled_material_percent', 'organic_material', 'production_time_hours',
+    'units_per_batch', 'energy_used_kwh', 'renewable_energy_percent',
+    'transport_distance_km', 'transport_load_kg', 'local_or_export',
+    'packaging_weight_kg', 'recyclable_packaging', 'material_efficiency',
+    'production_efficiency', 'total_recycled_material_kg'
+]
+
+# Defaults for the scaler inputs the product form does not ask for
+DEFAULT_RECYCLABLE_PACKAGING = 0.494
+DEFAULT_PACKAGING_WEIGHT_KG = 0.5
+DEFAULT_PRODUCTION_TIME_HOURS = 10.0
+DEFAULT_UNITS_PER_BATCH = 100.0
+DEFAULT_RENEWABLE_ENERGY_PERCENT = 20.0
+DEFAULT_TRANSPORT_LOAD_KG = 1000.0
+
+# Request fields that determine a prediction (prediction cache key)
+CATEGORICAL_INPUTS = ['primary_material', 'production_type']
+NUMERIC_INPUTS = ['material_quantity_kg', 'energy_used_kwh', 'transport_distance_km', 'product_weight_kg', 'recycled_material_percent']
+
+ORGANIC_MATERIALS = ['wood', 'cotton', 'jute', 'cane', 'bamboo', 'wool', 'silk', 'paper', 'leather', 'clay', 'canvas', 'palm leaf']
+
+def load_names(path):
+    with open(path, 'r') as f:
+        return [line.strip() for line in f if line.strip()]
+
+def production_types(feature_names_path):
+    """
+    production_type values that have a one-hot column in the model whose
+    feature names are at `feature_names_path`, e.g. 'semi_mechanized'.
+    """
+    prefix = 'production_type_'
+    return [name[len(prefix):] for name in load_names(feature_names_path) if name.startswith(prefix)]
+
+def get_organic_score(material):
+    if not material: return 0.0
+    material = str(material).lower()
+    if any(x in material for x in ORGANIC_MATERIALS):
+        return 1.0
+    return 0.0
+
+def get_handmade_score(prod_type):
+    if not prod_type: return 0.5
+    prod_type = str(prod_type).lower()
+    if 'handmade' in prod_type:
+        return 1.0
+    if 'machine' in prod_type:
+        return 0.0
+    return 0.5
+
+def material_key(value):
+    return str(value).lower().strip()
+
+def production_type_key(value):
+    # 'Semi Mechanized' -> 'semi_mechanized'
+    return str(value).lower().strip().replace(" ", "_")
+
+class CarbonFeatureLayout:
+    """
+    Precompiled column layout of the carbon model input.
+
+    Built once from feature_names.txt, scaler_feature_names.txt and the
+    fitted scaler, then used to write a request straight into a float64 row
+    without any per-request dict or DataFrame construction.
+    """
+
+    def __init__(self, model_feature_names, scaler_feature_names, mean, scale):
+        self.feature_names = list(model_feature_names)
+        self.n_features = len(self.feature_names)
+        self.index = {name: i for i, name in enumerate(self.feature_names)}
+
+        self.scaler_feature_names = list(scaler_feature_names)
+        self.scaler_index = {name: i for i, name in enumerate(self.scaler_feature_names)}
+        self.mean = np.asarray(mean, dtype=np.float64)
+        self.scale = np.asarray(scale, dtype=np.float64)
+
+        # Model column of every scaled value (scaled values the model does
+        # not use are dropped)
+        scaled_positions = []
+        scaled_columns = []
+        for i, name in enumerate(self.scaler_feature_names):
+            if name in self.index:
+                scaled_positions.append(i)
+                scaled_columns.append(self.index[name])
+        self.scaled_positions = np.array(scaled_positions, dtype=np.intp)
+        self.scaled_columns = np.array(scaled_columns, dtype=np.intp)
+
+        # One-hot offsets, keyed by the normalized category value
+        self.material_columns = self._one_hot_columns('primary_material_')
+        self.production_type_columns = self._one_hot_columns('production_type_')
+
+    def _one_hot_columns(self, prefix):
+        return {
+            name[len(prefix):]: i
+            for i, name in enumerate(self.feature_names)
+            if name.startswith(prefix)
+        }
+
+    @classmethod
+    def from_files(cls, feature_names_path, scaler_feature_names_path, scaler):
+        """
+        Builds the layout from the feature name files and a fitted StandardScaler.
+        """
+        scaler_feature_names = load_names(scaler_feature_names_path)
+        n = len(scaler_feature_names)
+        mean = scaler.mean_ if getattr(scaler, 'mean_', None) is not None else np.zeros(n)
+        scale = scaler.scale_ if getattr(scaler, 'scale_', None) is not None else np.ones(n)
+        return cls(load_names(feature_names_path), scaler_feature_names, mean, scale)
+
+    def raw_values(self, data, out):
+        """
+        Writes the unscaled scaler inputs for one request into `out` (scaler order).
+        """
+        pos = self.scaler_index
+        material_quantity = float(data.get('material_quantity_kg', 0))
+        product_weight = float(data.get('product_weight_kg', 0))
+        recycled_percent = float(data.get('recycled_material_percent', 0))
+        distance = float(data.get('transport_distance_km', 0))
+
+        out[pos['material_quantity_kg']] = material_quantity
+        out[pos['energy_used_kwh']] = float(data.get('energy_used_kwh', 0))
+        out[pos['transport_distance_km']] = distance
+        out[pos['product_weight_kg']] = product_weight
+        out[pos['recycled_material_percent']] = recycled_percent
+        out[pos['organic_material']] = get_organic_score(data.get('primary_material', ''))
+        out[pos['handmade_level']] = get_handmade_score(data.get('production_type', ''))
+        out[pos['local_or_export']] = 1.0 if distance > 1000 else 0.0
+
+        out[pos['recyclable_packaging']] = DEFAULT_RECYCLABLE_PACKAGING
+        out[pos['packaging_weight_kg']] = DEFAULT_PACKAGING_WEIGHT_KG
+        out[pos['production_time_hours']] = DEFAULT_PRODUCTION_TIME_HOURS
+        out[pos['units_per_batch']] = DEFAULT_UNITS_PER_BATCH
+        out[pos['renewable_energy_percent']] = DEFAULT_RENEWABLE_ENERGY_PERCENT
+        out[pos['transport_load_kg']] = DEFAULT_TRANSPORT_LOAD_KG
+
+        if material_quantity > 0:
+            out[pos['material_efficiency']] = product_weight / material_quantity
+        else:
+            out[pos['material_efficiency']] = 0.0
+
+        if DEFAULT_PRODUCTION_TIME_HOURS > 0:
+            out[pos['production_efficiency']] = DEFAULT_UNITS_PER_BATCH / DEFAULT_PRODUCTION_TIME_HOURS
+        else:
+            out[pos['production_efficiency']] = 0.0
+
+        out[pos['total_recycled_material_kg']] = material_quantity * (recycled_percent / 100.0)
+        return out
+
+    def one_hot_columns(self, data):
+        """
+        Returns the model columns set to 1.0 for the request's categorical values.
+        """
+        columns = []
+        p_mat = material_key(data.get('primary_material', ''))
+        if p_mat and p_mat in self.material_columns:
+            columns.append(self.material_columns[p_mat])
+        p_type = production_type_key(data.get('production_type', ''))
+        if p_type and p_type in self.production_type_columns:
+            columns.append(self.production_type_columns[p_type])
+        return columns
+
+    def fill_row(self, data, out):
+        """
+        Writes the full model input for one request into the preallocated
+        float64 row `out` (length n_features).
+        """
+        raw = self.raw_values(data, np.empty(len(self.scaler_feature_names), dtype=np.float64))
+        scaled = (raw - self.mean) / self.scale
+
+        out[:] = 0.0
+        out[self.scaled_columns] = scaled[self.scaled_positions]
+        for col in self.one_hot_columns(data):
+            out[col] = 1.0
+        # 'product_id' columns stay 0 for new products
+        return out
+
+    def transform(self, data):
+        """
+        Returns a (1, n_features) model input for one request.
+        """
+        X = np.empty((1, self.n_features), dtype=np.float64)
+        self.fill_row(data, X[0])
+        return X
+
+    def transform_many(self, records):
+        """
+        Builds the model input for a batch of requests as a sparse CSR matrix.
+
+        Returns (X, row_index, errors): X has one row per valid record,
+        row_index maps those rows back to positions in `records` and errors
+        maps the position of every rejected record to its error message.
+        """
+        from scipy.sparse import csr_matrix
+
+        n_scaled = len(self.scaler_feature_names)
+        raw = np.empty((len(records), n_scaled), dtype=np.float64)
+        row_index = []
+        errors = {}
+        hot_rows = []
+        hot_cols = []
+        for i, data in enumerate(records):
+            try:
+                if not isinstance(data, dict):
+                    raise ValueError("Each record must be a JSON object")
+                self.raw_values(data, raw[len(row_index)])
+                cols = self.one_hot_columns(data)
+            except (TypeError, ValueError) as e:
+                errors[i] = str(e)
+                continue
+            hot_rows.extend([len(row_index)] * len(cols))
+            hot_cols.extend(cols)
+            row_index.append(i)
+
+        n_rows = len(row_index)
+        scaled = (raw[:n_rows] - self.mean) / self.scale
+
+        # Dense block of scaled values + the few one-hot columns per row;
+        # the ~1000 product_id columns are never materialized
+        n_cols = len(self.scaled_columns)
+        rows = np.concatenate([np.repeat(np.arange(n_rows), n_cols), np.array(hot_rows, dtype=np.intp)])
+        cols = np.concatenate([np.tile(self.scaled_columns, n_rows), np.array(hot_cols, dtype=np.intp)])
+        values = np.concatenate([scaled[:, self.scaled_positions].ravel(), np.ones(len(hot_cols))])
+        X = csr_matrix((values, (rows, cols)), shape=(n_rows, self.n_features))
+        return X, row_index, errors
+
+def parse_records(text):
+    """
+    Parses request text as a single JSON object, a JSON array or newline
+    delimited JSON. Returns (records, is_batch); unparseable JSONL lines are
+    kept as exceptions so they can be reported per row.
+    """
+    text = text.strip()
+    if text.startswith('['):
+        return json.loads(text), True
+    try:
+        return [json.loads(text)], False
+    except json.JSONDecodeError:
+        pass
+
+    records = []
+    for line in text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            records.append(json.loads(line))
+        except json.JSONDecodeError as e:
+            records.append(e)
+    return records, True
+
+def predict_batch(model, layout, records):
+    """
+    Scores a batch of records with a single model.predict call. Returns one
+    result dict per record, in input order.
+    """
+    results = [None] * len(records)
+    valid = []
+    for i, data in enumerate(records):
+        if isinstance(data, Exception):
+            results[i] = {"index": i, "error": f"Invalid JSON: {data}"}
+        else:
+            valid.append(i)
+
+    with STAGE_SECONDS.time('carbon', 'features'):
+        X, row_index, errors = layout.transform_many([records[i] for i in valid])
+    for pos, message in errors.items():
+        i = valid[pos]
+        results[i] = {"index": i, "error": message}
+    if len(records) > X.shape[0]:
+        PREDICTION_ERRORS.inc('carbon', amount=len(records) - X.shape[0])
+
+    if X.shape[0]:
+        with STAGE_SECONDS.time('carbon', 'predict'):
+            predictions = model.predict(X)
+        PREDICTIONS.inc('carbon', amount=X.shape[0])
+        for pos, value in zip(row_index, predictions):
+            i = valid[pos]
+            results[i] = {"index": i, "carbon_emission": float(value)}
+    return results
@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# In-process counters, gauges and histograms rendered in the Prometheus text
+# exposition format (served on /metrics by app.py and api/carbon.py).
+#
+# Every observation is a bisect plus a few additions under a lock (a timed
+# block costs ~3us), so the stage timers stay on in production. ML_METRICS=0
+# turns them into no-ops. Metrics are per process: behind gunicorn each
+# worker keeps its own, and a scrape sees whichever worker answered it.
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+ENABLED = os.environ.get('ML_METRICS', '1') != '0'
+
+# Seconds; sub-millisecond buckets because single-row stages are that fast
+DEFAULT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _labels(names, values, extra=()):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)] + list(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _check(self, labels):
+        if len(labels) != len(self.labelnames):
+            raise ValueError(f"{self.name} takes labels {self.labelnames}, got {labels}")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for labels, value in items:
+            lines.extend(self._render_value(labels, value))
+        return lines
+
+    def _render_value(self, labels, value):
+        return [f"{self.name}{_labels(self.labelnames, labels)} {_number(value)}"]
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, *labels, amount=1):
+        if not ENABLED:
+            return
+        with self._lock:
+            if labels not in self._values:
+                self._check(labels)
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, *labels):
+        if not ENABLED:
+            return
+        self._check(labels)
+        with self._lock:
+            self._values[labels] = value
+
+class _Timer:
+    __slots__ = ('histogram', 'labels', 'start')
+
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.start, *self.labels)
+        return False
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, *labels):
+        if not ENABLED:
+            return
+        # Per label set: [count per bucket (+Inf last), sum, count]
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                self._check(labels)
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def time(self, *labels):
+        """
+        with histogram.time('price', 'predict'): ...
+        """
+        return _Timer(self, labels)
+
+    def _render_value(self, labels, state):
+        counts, total, count = state
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float('inf'),), counts):
+            cumulative += n
+            le = _labels(self.labelnames, labels, [f'le="{_number(bound)}"'])
+            lines.append(f"{self.name}_bucket{le} {cumulative}")
+        lines.append(f"{self.name}_sum{_labels(self.labelnames, labels)} {_number(total)}")
+        lines.append(f"{self.name}_count{_labels(self.labelnames, labels)} {count}")
+        return lines
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name, help, labelnames, **kwargs):
+        # Get-or-create, so modules imported into one process share metrics
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help, labelnames, **kwargs)
+            elif not isinstance(metric, cls) or metric.labelnames != tuple(labelnames):
+                raise ValueError(f"Metric {name} already registered with a different type or labels")
+            return metric
+
+    def counter(self, name, help, labelnames=()):
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name, help, labelnames=()):
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+REGISTRY = Registry()
+
+# Shared metrics of the inference paths
+STAGE_SECONDS = REGISTRY.histogram(
+    'ml_stage_seconds', "Time spent per inference stage", ['model', 'stage'])
+PREDICTIONS = REGISTRY.counter(
+    'ml_predictions_total', "Rows scored by the model", ['model'])
+PREDICTION_ERRORS = REGISTRY.counter(
+    'ml_prediction_errors_total', "Rows or requests that failed to score", ['model'])
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    'ml_model_load_seconds', "Time taken to load the model artifacts", ['model'])
+REQUESTS = REGISTRY.counter(
+    'ml_requests_total', "HTTP requests by endpoint and status code", ['endpoint', 'status'])
+REQUEST_SECONDS = REGISTRY.histogram(
+    'ml_request_seconds', "HTTP request latency by endpoint", ['endpoint'])
+
+def render():
+    return REGISTRY.render()
@@ -0,0 +1,326 @@
+import hashlib
+import json
+import mmap
+import os
+import struct
+import sys
+import time
+
+import numpy as np
+
+from compiled_forest import CompiledForest, compiled_path, source_matches, source_record
+
+# Single-file model bundle: compiled forests, scaler parameters, feature
+# layouts and encoder vocabularies in one versioned file.
+#
+# Layout (little endian):
+#   8 bytes   magic b'GTCBNDL\0'
+#   4 bytes   format version (uint32)
+#   4 bytes   header length (uint32)
+#   32 bytes  sha256 of the header
+#   header    JSON: bundle version, metadata, array table, data sha256
+#   data      raw arrays, each aligned to ALIGNMENT bytes
+#
+# Each section's metadata records the artifacts it was built from (size,
+# mtime, sha256; paths relative to the bundle). A section whose sources
+# changed since, e.g. after a retrain, is not served: open_bundle falls back
+# to the artifacts themselves, or refuses with ML_INFERENCE_ONLY=1.
+#
+# Arrays are returned as read-only views into an mmap of the file, so opening
+# a bundle only reads the header. Pages are loaded on first use and shared
+# between all processes that map the same file.
+
+MAGIC = b'GTCBNDL\0'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+PREAMBLE = struct.Struct('<8sII32s')
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_BUNDLE_PATH = os.environ.get('MODEL_BUNDLE_PATH', os.path.join(BASE_DIR, 'models', 'model_bundle.bin'))
+
+# ML_INFERENCE_ONLY=1 serves from the bundle alone: startup imports NumPy and
+# this module, and a missing bundle is an error instead of a fallback to
+# unpickling the sklearn artifacts (which imports joblib and sklearn).
+INFERENCE_ONLY = os.environ.get('ML_INFERENCE_ONLY') == '1'
+
+class BundleError(ValueError):
+    pass
+
+def _aligned(n):
+    return (n + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+def write_bundle(path, arrays, meta, version):
+    """
+    Writes `arrays` ({name: ndarray}) and JSON-serialisable `meta` to `path`.
+    The file is written next to the target and renamed into place, so
+    readers never see a partial bundle.
+    """
+    # Source paths relative to the bundle, so they survive moving the
+    # directory (a registry version is built in a staging directory)
+    base = os.path.dirname(os.path.abspath(path))
+    meta = dict(meta)
+    for section, m in meta.items():
+        if isinstance(m, dict) and 'sources' in m:
+            relative = {os.path.relpath(os.path.abspath(p), base): r for p, r in m['sources'].items()}
+            meta[section] = dict(m, sources=relative)
+    table = {}
+    offset = 0
+    for name, arr in arrays.items():
+        arr = np.asarray(arr, order='C')
+        table[name] = {'dtype': arr.dtype.str, 'shape': list(arr.shape), 'offset': offset, 'nbytes': arr.nbytes}
+        offset = _aligned(offset + arr.nbytes)
+
+    digest = hashlib.sha256()
+    for name, arr in arrays.items():
+        digest.update(np.asarray(arr, order='C').tobytes())
+
+    header = json.dumps({
+        'version': version,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'meta': meta,
+        'arrays': table,
+        'data_sha256': digest.hexdigest(),
+    }).encode('utf-8')
+    data_start = _aligned(PREAMBLE.size + len(header))
+
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(PREAMBLE.pack(MAGIC, FORMAT_VERSION, len(header), hashlib.sha256(header).digest()))
+        f.write(header)
+        for name, arr in arrays.items():
+            f.seek(data_start + table[name]['offset'])
+            f.write(np.asarray(arr, order='C').tobytes())
+        f.truncate(data_start + offset)
+    os.replace(tmp_path, path)
+
+class ModelBundle:
+    """
+    Read-only, memory-mapped view of a bundle file.
+    """
+
+    def __init__(self, path, verify=False):
+        self.path = path
+        with open(path, 'rb') as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        if len(self._mmap) < PREAMBLE.size:
+            raise BundleError(f"{path} is not a model bundle")
+        magic, format_version, header_len, header_sha = PREAMBLE.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            raise BundleError(f"{path} is not a model bundle")
+        if format_version != FORMAT_VERSION:
+            raise BundleError(f"Unsupported bundle format {format_version} (expected {FORMAT_VERSION})")
+        header = self._mmap[PREAMBLE.size:PREAMBLE.size + header_len]
+        if hashlib.sha256(header).digest() != header_sha:
+            raise BundleError(f"{path}: header checksum mismatch")
+
+        header = json.loads(header)
+        self.version = header['version']
+        self.created = header['created']
+        self.meta = header['meta']
+        self._table = header['arrays']
+        self._data_sha256 = header['data_sha256']
+        self._data_start = _aligned(PREAMBLE.size + header_len)
+        if verify:
+            self.verify()
+
+    def verify(self):
+        """
+        Recomputes the data checksum (reads every page of the file).
+        """
+        digest = hashlib.sha256()
+        for entry in self._table.values():
+            start = self._data_start + entry['offset']
+            digest.update(self._mmap[start:start + entry['nbytes']])
+        if digest.hexdigest() != self._data_sha256:
+            raise BundleError(f"{self.path}: data checksum mismatch")
+
+    def stale_sources(self, section):
+        """
+        Source artifacts of `section` that changed after the bundle was built.
+        """
+        base = os.path.dirname(os.path.abspath(self.path))
+        sources = self.meta.get(section, {}).get('sources', {})
+        return [p for p, record in sources.items() if not source_matches(record, os.path.join(base, p))]
+
+    def names(self):
+        return list(self._table)
+
+    def has(self, prefix):
+        return any(name.startswith(prefix + '/') for name in self._table)
+
+    def array(self, name):
+        entry = self._table[name]
+        dtype = np.dtype(entry['dtype'])
+        count = int(np.prod(entry['shape'], dtype=np.int64))
+        arr = np.frombuffer(self._mmap, dtype=dtype, count=count, offset=self._data_start + entry['offset'])
+        return arr.reshape(tuple(entry['shape']))
+
+    def arrays(self, prefix):
+        start = prefix + '/'
+        return {name[len(start):]: self.array(name) for name in self._table if name.startswith(start)}
+
+    def forest(self, prefix):
+        return CompiledForest(self.arrays(prefix + '/forest'))
+
+    def carbon_layout(self, section='carbon'):
+        # section: 'carbon' or 'carbon_pruned'
+        from carbon_features import CarbonFeatureLayout
+        return CarbonFeatureLayout(
+            self.meta[section]['feature_names'],
+            self.meta[section]['scaler_feature_names'],
+            self.array(f'{section}/scaler_mean'),
+            self.array(f'{section}/scaler_scale'),
+        )
+
+    def price_artifacts(self):
+        """
+        (feature_names, {column: [classes in code order]}, {column: most
+        frequent training label}) of the price model.
+        """
+        meta = self.meta['price']
+        return meta['feature_names'], meta['labels'], meta.get('most_frequent', {})
+
+def open_bundle(path=DEFAULT_BUNDLE_PATH, section=None):
+    """
+    Opens the bundle at `path` if it exists (and has a current `section`),
+    else None. MODEL_BUNDLE_VERIFY=1 checks the data checksum on open.
+    """
+    if not os.path.exists(path):
+        return None
+    bundle = ModelBundle(path, verify=os.environ.get('MODEL_BUNDLE_VERIFY') == '1')
+    if section and not bundle.has(section):
+        return None
+    stale = bundle.stale_sources(section) if section else []
+    if stale:
+        message = f"{path}: '{section}' was built from older {', '.join(stale)}; rebuild it with model_bundle.py build"
+        if INFERENCE_ONLY:
+            raise BundleError(message)
+        print(f"Warning: {message}; loading the artifacts instead", file=sys.stderr)
+        return None
+    return bundle
+
+def require_bundle(path, section):
+    """
+    Called before falling back to the pickled artifacts; raises in
+    inference-only mode.
+    """
+    if INFERENCE_ONLY:
+        raise FileNotFoundError(f"ML_INFERENCE_ONLY=1 but {path} has no '{section}' section")
+
+def sources(paths):
+    # Source records of the artifacts that exist, for a section's metadata
+    return {p: source_record(p) for p in dict.fromkeys(paths) if os.path.exists(p)}
+
+def carbon_section(model_path, scaler_path, feature_names_path, scaler_feature_names_path, section='carbon'):
+    import joblib
+    from carbon_features import CarbonFeatureLayout
+    from compiled_forest import load_model
+
+    model = load_model(model_path)
+    if not isinstance(model, CompiledForest):
+        model = CompiledForest.from_model(model)
+    layout = CarbonFeatureLayout.from_files(feature_names_path, scaler_feature_names_path, joblib.load(scaler_path))
+
+    arrays = {f'{section}/forest/{k}': v for k, v in model.to_arrays().items()}
+    arrays[f'{section}/scaler_mean'] = layout.mean
+    arrays[f'{section}/scaler_scale'] = layout.scale
+    meta = {
+        'feature_names': layout.feature_names,
+        'scaler_feature_names': layout.scaler_feature_names,
+        'sources': sources([model_path, compiled_path(model_path), scaler_path, feature_names_path,
+                            scaler_feature_names_path]),
+    }
+    return arrays, meta
+
+def price_section(model_path, encoders_path, feature_names_path):
+    import joblib
+    from compiled_forest import load_model
+
+    model = load_model(model_path)
+    if not isinstance(model, CompiledForest):
+        model = CompiledForest.from_model(model)
+    encoders = joblib.load(encoders_path)
+
+    arrays = {f'price/forest/{k}': v for k, v in model.to_arrays().items()}
+    meta = {
+        'feature_names': list(joblib.load(feature_names_path)),
+        'labels': {col: [str(c) for c in le.classes_] for col, le in encoders.items()},
+        'most_frequent': {col: le.most_frequent_ for col, le in encoders.items() if hasattr(le, 'most_frequent_')},
+        'sources': sources([model_path, compiled_path(model_path), encoders_path, feature_names_path]),
+    }
+    return arrays, meta
+
+def replace_section(path, section, arrays, meta, version=None):
+    """
+    Rewrites the bundle at `path` with `section` replaced by `arrays` and
+    `meta` (from price_section/carbon_section); other sections are copied.
+    """
+    old = ModelBundle(path)
+    base = os.path.dirname(os.path.abspath(path))
+    kept_arrays = {name: old.array(name) for name in old.names() if not name.startswith(section + '/')}
+    kept_meta = {}
+    for name, m in old.meta.items():
+        if name == section:
+            continue
+        if isinstance(m, dict) and 'sources' in m:
+            # write_bundle makes them relative again
+            m = dict(m, sources={os.path.join(base, p): r for p, r in m['sources'].items()})
+        kept_meta[name] = m
+    write_bundle(path, {**kept_arrays, **arrays}, {**kept_meta, section: meta}, version or time.strftime('%Y%m%d%H%M%S'))
+
+def build(out_path, sections, version):
+    import custom_price_model
+    import predict_carbon
+
+    arrays, meta = {}, {}
+    if 'carbon' in sections:
+        a, m = carbon_section(predict_carbon.MODEL_PATH, predict_carbon.SCALER_PATH,
+                              predict_carbon.FEATURE_NAMES_PATH, predict_carbon.SCALER_FEATURE_NAMES_PATH)
+        arrays.update(a)
+        meta['carbon'] = m
+    if 'carbon_pruned' in sections:
+        # prune_carbon.py output; served with CARBON_MODEL_VARIANT=pruned
+        a, m = carbon_section(predict_carbon.PRUNED_MODEL_PATH, predict_carbon.SCALER_PATH,
+                              predict_carbon.PRUNED_FEATURE_NAMES_PATH, predict_carbon.SCALER_FEATURE_NAMES_PATH,
+                              section='carbon_pruned')
+        arrays.update(a)
+        meta['carbon_pruned'] = m
+    if 'price' in sections:
+        a, m = price_section(custom_price_model.MODEL_PATH, custom_price_model.ENCODERS_PATH,
+                             custom_price_model.FEATURE_NAMES_PATH)
+        arrays.update(a)
+        meta['price'] = m
+
+    write_bundle(out_path, arrays, meta, version)
+    size_mb = os.path.getsize(out_path) / 1e6
+    print(f"Wrote {out_path} ({', '.join(meta)}; {len(arrays)} arrays, {size_mb:.1f} MB, version {version})")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Build or check a model bundle")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_build = sub.add_parser('build', help="Pack the current model artifacts into one bundle")
+    p_build.add_argument('--out', default=DEFAULT_BUNDLE_PATH)
+    p_build.add_argument('--sections', nargs='+', choices=['carbon', 'carbon_pruned', 'price'],
+                         help="Default: carbon and price, plus carbon_pruned when prune_carbon.py has been run")
+    p_build.add_argument('--version', default=time.strftime('%Y%m%d%H%M%S'))
+    p_check = sub.add_parser('check', help="Verify a bundle's version and checksums")
+    p_check.add_argument('path', nargs='?', default=DEFAULT_BUNDLE_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        sections = args.sections
+        if sections is None:
+            import predict_carbon
+            sections = ['carbon', 'price'] + (['carbon_pruned'] if os.path.exists(predict_carbon.PRUNED_MODEL_PATH) else [])
+        build(args.out, sections, args.version)
+    else:
+        try:
+            bundle = ModelBundle(args.path, verify=True)
+        except (BundleError, OSError) as e:
+            print(f"Invalid bundle: {e}")
+            sys.exit(1)
+        sections = sorted(bundle.meta)
+        print(f"{args.path}: version {bundle.version}, created {bundle.created}, sections {sections}, checksum OK")
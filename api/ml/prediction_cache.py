@@ -0,0 +1,150 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# In-process memoization of model predictions. Sellers re-open the price and
+# carbon forms with identical inputs, so repeated requests are answered from
+# a bounded LRU instead of re-running the forest.
+
+def cache_settings():
+    """
+    (maxsize, ttl_seconds, precision) from the environment. A maxsize of 0
+    disables caching.
+    """
+    return (
+        int(os.environ.get('PREDICTION_CACHE_SIZE', 1024)),
+        float(os.environ.get('PREDICTION_CACHE_TTL', 300)),
+        int(os.environ.get('PREDICTION_CACHE_PRECISION', 2)),
+    )
+
+def normalize_categorical(value):
+    if value is None:
+        return ''
+    return str(value).strip().lower()
+
+def normalize_number(value, precision):
+    try:
+        return round(float(value), precision)
+    except (TypeError, ValueError):
+        # Left as text so the model call reports the bad input itself
+        return normalize_categorical(value)
+
+class PredictionCache:
+    """
+    Bounded LRU cache with a per-entry TTL.
+
+    Entries are dropped automatically when any of `artifact_paths` changes
+    on disk (mtime or size), so a retrained model never serves stale
+    predictions.
+    """
+
+    def __init__(self, maxsize=1024, ttl=300.0, precision=2, artifact_paths=(), check_interval=1.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.precision = precision
+        self.artifact_paths = list(artifact_paths)
+        self.check_interval = check_interval
+
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._signature = self._artifact_signature()
+        self._last_check = time.monotonic()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    @classmethod
+    def from_env(cls, artifact_paths=()):
+        maxsize, ttl, precision = cache_settings()
+        return cls(maxsize=maxsize, ttl=ttl, precision=precision, artifact_paths=artifact_paths)
+
+    @property
+    def enabled(self):
+        return self.maxsize > 0
+
+    def _artifact_signature(self):
+        signature = []
+        for path in self.artifact_paths:
+            try:
+                st = os.stat(path)
+                signature.append((path, st.st_mtime_ns, st.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def _check_artifacts(self, now):
+        # Called with the lock held; stat() at most once per check_interval
+        if now - self._last_check < self.check_interval:
+            return
+        self._last_check = now
+        signature = self._artifact_signature()
+        if signature != self._signature:
+            self._signature = signature
+            self._entries.clear()
+            self.invalidations += 1
+
+    def make_key(self, data, categorical_fields=(), numeric_fields=(), extra=()):
+        """
+        Builds a hashable key from the normalized input fields.
+        """
+        return (
+            tuple(normalize_categorical(data.get(f)) for f in categorical_fields)
+            + tuple(normalize_number(data.get(f, 0), self.precision) for f in numeric_fields)
+            + tuple(extra)
+        )
+
+    def get(self, key):
+        """
+        Returns (hit, value).
+        """
+        if not self.enabled:
+            return False, None
+        now = time.monotonic()
+        with self._lock:
+            self._check_artifacts(now)
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+            value, expires_at = entry
+            if expires_at < now:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return True, value
+
+    def put(self, key, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'maxsize': self.maxsize,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
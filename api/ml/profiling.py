@@ -0,0 +1,297 @@
+import atexit
+import os
+import random
+import re
+import sys
+import threading
+import time
+
+# Opt-in request profiling and memory reports for the inference services.
+#
+#   ML_PROFILE_SAMPLE_RATE=0.05 gunicorn app:app    profile 5% of requests
+#   ML_TRACEMALLOC=1 python app.py                  trace allocations from startup
+#
+#   GET  /debug/profiling     sampling status and samples per endpoint (app.py)
+#   POST /debug/profiling     {"sample_rate": 0.1, "tracemalloc": true, "flush": true}
+#   GET  /debug/memory        RSS, per-request allocations, top allocation sites;
+#                             ?artifacts=1 also loads a fresh copy of each model
+#                             and reports what it takes
+#
+# The debug endpoints (and app.py's write endpoints) answer only when
+# ML_ADMIN_TOKEN is set, to requests sending it as X-Admin-Token.
+#
+# Sampled requests run under cProfile and are aggregated per endpoint into
+# PROFILE_DIR/<endpoint>.<pid>.pstats (rewritten every FLUSH_EVERY samples
+# and at exit); read them with `python -m pstats`. One request per process
+# is profiled at a time, so a sampled request that overlaps another is
+# simply not profiled. Nothing is imported or measured while sampling is off.
+#
+# With tracemalloc on, every request records how much it allocated (net and
+# peak). The peak is process-wide, so concurrent requests inflate each
+# other's. Memory-mapped model bundles are not Python allocations: for those
+# the artifact report's RSS delta is the number to read.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PROFILE_DIR = os.environ.get('ML_PROFILE_DIR', os.path.join(BASE_DIR, 'profiles'))
+SAMPLE_RATE = float(os.environ.get('ML_PROFILE_SAMPLE_RATE', 0))
+FLUSH_EVERY = int(os.environ.get('ML_PROFILE_FLUSH_EVERY', 20))
+TRACEMALLOC_FRAMES = int(os.environ.get('ML_TRACEMALLOC_FRAMES', 1))
+ADMIN_TOKEN = os.environ.get('ML_ADMIN_TOKEN')
+
+if os.environ.get('ML_TRACEMALLOC') == '1':
+    # Started at import so the models loaded afterwards are traced too
+    import tracemalloc
+    tracemalloc.start(TRACEMALLOC_FRAMES)
+
+def rss_bytes():
+    """
+    Current resident set size of this process (0 where /proc is missing).
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        return 0
+
+def _tracing():
+    # tracemalloc is not even imported unless someone turned it on
+    return 'tracemalloc' in sys.modules and sys.modules['tracemalloc'].is_tracing()
+
+class RequestProfiler:
+    def __init__(self, sample_rate=SAMPLE_RATE, out_dir=PROFILE_DIR, flush_every=FLUSH_EVERY):
+        self.sample_rate = sample_rate
+        self.out_dir = out_dir
+        self.flush_every = flush_every
+        # endpoint -> pstats.Stats aggregated over its sampled requests
+        self._stats = {}
+        self._samples = {}
+        self._unflushed = {}
+        # endpoint -> [requests, net bytes, largest net, largest peak]
+        self._allocations = {}
+        self._lock = threading.Lock()
+        self._profiling = threading.Lock()
+
+    def configure(self, sample_rate=None, tracemalloc_on=None):
+        if sample_rate is not None:
+            if not 0 <= sample_rate <= 1:
+                raise ValueError("sample_rate must be between 0 and 1")
+            self.sample_rate = sample_rate
+        if tracemalloc_on is not None:
+            import tracemalloc
+            if tracemalloc_on and not tracemalloc.is_tracing():
+                tracemalloc.start(TRACEMALLOC_FRAMES)
+            elif not tracemalloc_on and tracemalloc.is_tracing():
+                tracemalloc.stop()
+                with self._lock:
+                    self._allocations.clear()
+
+    def start(self, name):
+        """
+        Starts measuring one request; pass the result to stop(). Returns None
+        when the request is neither sampled nor traced.
+        """
+        profile = None
+        if self.sample_rate and random.random() < self.sample_rate and self._profiling.acquire(blocking=False):
+            import cProfile
+            profile = cProfile.Profile()
+            profile.enable()
+        traced = None
+        if _tracing():
+            import tracemalloc
+            traced = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        if profile is None and traced is None:
+            return None
+        return name, profile, traced
+
+    def stop(self, token):
+        if token is None:
+            return
+        name, profile, traced = token
+        if traced is not None and _tracing():
+            import tracemalloc
+            current, peak = tracemalloc.get_traced_memory()
+            with self._lock:
+                entry = self._allocations.setdefault(name, [0, 0, 0, 0])
+                entry[0] += 1
+                entry[1] += current - traced
+                entry[2] = max(entry[2], current - traced)
+                entry[3] = max(entry[3], peak - traced)
+        if profile is None:
+            return
+        profile.disable()
+        self._profiling.release()
+        import pstats
+        with self._lock:
+            if name in self._stats:
+                self._stats[name].add(profile)
+            else:
+                self._stats[name] = pstats.Stats(profile)
+            self._samples[name] = self._samples.get(name, 0) + 1
+            self._unflushed[name] = self._unflushed.get(name, 0) + 1
+            due = self._unflushed[name] >= self.flush_every
+        if due:
+            self.flush(name)
+
+    def profile_path(self, name):
+        slug = re.sub(r'[^A-Za-z0-9]+', '_', name).strip('_') or 'root'
+        return os.path.join(self.out_dir, f"{slug}.{os.getpid()}.pstats")
+
+    def flush(self, name=None):
+        """
+        Writes the aggregated profile of `name` (default: every endpoint).
+        Returns the paths written.
+        """
+        written = []
+        with self._lock:
+            names = [name] if name else [n for n, count in self._unflushed.items() if count]
+            if names:
+                os.makedirs(self.out_dir, exist_ok=True)
+            for n in names:
+                path = self.profile_path(n)
+                tmp_path = f"{path}.tmp"
+                self._stats[n].dump_stats(tmp_path)
+                os.replace(tmp_path, path)
+                self._unflushed[n] = 0
+                written.append(path)
+        return written
+
+    def status(self):
+        with self._lock:
+            return {
+                'sample_rate': self.sample_rate,
+                'tracemalloc': _tracing(),
+                'profile_dir': self.out_dir,
+                'samples': dict(self._samples),
+                'files': {n: self.profile_path(n) for n in self._samples},
+            }
+
+    def memory_report(self, top=10):
+        report = {'rss_bytes': rss_bytes(), 'tracemalloc': _tracing()}
+        if not report['tracemalloc']:
+            return report
+        import tracemalloc
+        report['traced_bytes'] = tracemalloc.get_traced_memory()[0]
+        with self._lock:
+            report['requests'] = {
+                name: {'requests': n, 'mean_net_bytes': round(net / n), 'max_net_bytes': max_net, 'max_peak_bytes': max_peak}
+                for name, (n, net, max_net, max_peak) in self._allocations.items()
+            }
+        stats = tracemalloc.take_snapshot().statistics('filename')
+        report['top_files'] = [{'file': s.traceback[0].filename, 'bytes': s.size, 'blocks': s.count} for s in stats[:top]]
+        return report
+
+PROFILER = RequestProfiler()
+atexit.register(PROFILER.flush)
+
+def array_bytes(obj, depth=4):
+    """
+    (total, memory-mapped) bytes of the NumPy arrays reachable from `obj`
+    through attributes, dicts and sequences. Arrays in a mapped bundle
+    only count towards RSS once their pages are read.
+    """
+    import mmap
+    import numpy as np
+
+    seen = set()
+    total = mapped = 0
+    stack = [(obj, depth)]
+    while stack:
+        item, level = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        if isinstance(item, np.ndarray):
+            total += item.nbytes
+            base = item
+            while isinstance(base, np.ndarray) and base.base is not None:
+                base = base.base
+            if isinstance(base, memoryview):
+                base = base.obj
+            if isinstance(base, (mmap.mmap, np.memmap)):
+                mapped += item.nbytes
+            continue
+        if level == 0:
+            continue
+        if isinstance(item, dict):
+            children = item.values()
+        elif isinstance(item, (list, tuple)):
+            children = item
+        else:
+            children = getattr(item, '__dict__', {}).values()
+        stack.extend((child, level - 1) for child in children)
+    return total, mapped
+
+def measure_load(loader, top=5):
+    """
+    Calls `loader()` under tracemalloc and returns what the object it
+    loads takes: traced Python allocations still held, peak while loading,
+    RSS growth, the size of its arrays and the files that allocated most.
+    The loaded object is dropped afterwards.
+    """
+    import gc
+    import tracemalloc
+
+    was_tracing = tracemalloc.is_tracing()
+    if not was_tracing:
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    gc.collect()
+    before = tracemalloc.take_snapshot()
+    traced_before = tracemalloc.get_traced_memory()[0]
+    tracemalloc.reset_peak()
+    rss_before = rss_bytes()
+    start = time.perf_counter()
+    try:
+        loaded = loader()
+        seconds = time.perf_counter() - start
+        current, peak = tracemalloc.get_traced_memory()
+        rss_after = rss_bytes()
+        diff = tracemalloc.take_snapshot().compare_to(before, 'filename')
+        arrays, mapped = array_bytes(loaded)
+        del loaded
+    finally:
+        if not was_tracing:
+            tracemalloc.stop()
+    return {
+        'traced_bytes': current - traced_before,
+        'peak_bytes': peak - traced_before,
+        'rss_delta_bytes': rss_after - rss_before,
+        'array_bytes': arrays,
+        'mapped_array_bytes': mapped,
+        'load_seconds': round(seconds, 3),
+        'top_files': [{'file': d.traceback[0].filename, 'bytes': d.size_diff} for d in diff[:top]],
+    }
+
+def artifact_report():
+    """
+    measure_load for each model artifact this process can load.
+    """
+    import custom_price_model
+    import predict_carbon
+
+    loaders = {
+        'price': custom_price_model.load_artifacts,
+        'carbon': predict_carbon._load,
+    }
+    report = {}
+    for name, loader in loaders.items():
+        try:
+            report[name] = measure_load(loader)
+        except (FileNotFoundError, OSError, ValueError) as e:
+            report[name] = {'error': str(e)}
+    return report
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="Memory taken by each model artifact, or a summary of a pstats file")
+    parser.add_argument('pstats', nargs='?', help="Aggregated profile to summarize instead")
+    parser.add_argument('--sort', default='cumulative')
+    parser.add_argument('--limit', type=int, default=25)
+    args = parser.parse_args()
+    if args.pstats:
+        import pstats
+        pstats.Stats(args.pstats).strip_dirs().sort_stats(args.sort).print_stats(args.limit)
+    else:
+        print(json.dumps(artifact_report(), indent=2))
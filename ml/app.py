@@ -1,7 +1,14 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
-import pandas as pd
 import os
+import threading
+import time
+
+import file_lock
+import metrics
+from metrics import REQUEST_SECONDS, REQUESTS, STAGE_SECONDS
+# Before the models, so ML_TRACEMALLOC=1 traces their loading
+import profiling
 # import xgboost as xgb # Uncomment when installed
 # from prophet import Prophet # Uncomment when installed
 
@@ -13,6 +20,9 @@ except ImportError:
     print("Custom model not found. Using mock logic.")
     custom_price_model = None
 
+import recommender
+import trends
+
 app = Flask(__name__)
 CORS(app)
 
@@ -21,6 +31,8 @@ DATA_PATH = os.path.join(os.path.dirname(__file__), 'data', 'products.csv')
 
 def train_mock_model():
     if os.path.exists(DATA_PATH):
+        # Imported here so serving predictions never loads pandas
+        import pandas as pd
         df = pd.read_csv(DATA_PATH)
         print(f"Loaded {len(df)} products for training.")
     else:
@@ -28,13 +40,75 @@ def train_mock_model():
 
 train_mock_model()
 
+@app.before_request
+def start_timer():
+    g.request_start = time.perf_counter()
+    if request.url_rule and not request.url_rule.rule.startswith('/debug/'):
+        g.profile = profiling.PROFILER.start(request.url_rule.rule)
+
+@app.teardown_request
+def stop_profile(exc):
+    # Runs even when the view raised, so a sampled request always ends
+    profiling.PROFILER.stop(g.pop('profile', None))
+
+@app.after_request
+def record_request(response):
+    # Route pattern rather than the raw path, to keep label values bounded
+    endpoint = request.url_rule.rule if request.url_rule else 'unmatched'
+    REQUESTS.inc(endpoint, str(response.status_code))
+    if 'request_start' in g:
+        REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint)
+    return response
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    # Stage histograms, request/error counts and model load time (this process)
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+def admin_denied():
+    # Debug and write endpoints exist only when an admin token is configured
+    token = profiling.ADMIN_TOKEN
+    if not token:
+        return jsonify({'error': 'Not found'}), 404
+    if request.headers.get('X-Admin-Token') != token:
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@app.route('/debug/profiling', methods=['GET', 'POST'])
+def debug_profiling():
+    denied = admin_denied()
+    if denied:
+        return denied
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            sample_rate = data.get('sample_rate')
+            profiling.PROFILER.configure(None if sample_rate is None else float(sample_rate), data.get('tracemalloc'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        if data.get('flush'):
+            profiling.PROFILER.flush()
+    return jsonify(profiling.PROFILER.status())
+
+@app.route('/debug/memory', methods=['GET'])
+def debug_memory():
+    denied = admin_denied()
+    if denied:
+        return denied
+    report = profiling.PROFILER.memory_report(top=request.args.get('top', 10, type=int))
+    if request.args.get('artifacts') == '1':
+        # Loads a second copy of every model; slow and briefly doubles memory
+        report['artifacts'] = profiling.artifact_report()
+    return jsonify(report)
+
 @app.route('/')
 def home():
     return "Green Thread Connect ML Service is Running!"
 
 @app.route('/predict-price', methods=['POST'])
 def predict_price():
-    data = request.json
+    with STAGE_SECONDS.time('price', 'parse'):
+        data = request.json
     
     # Extract fields
     product_name = data.get('product_name')
@@ -49,10 +123,14 @@ def predict_price():
         try:
             # Pass the entire data dict to the custom model
             predicted_price = custom_price_model.predict(data)
-            return jsonify({
-                'predicted_price': round(float(predicted_price), 2),
-                'currency': 'INR'
-            })
+            with STAGE_SECONDS.time('price', 'serialize'):
+                return jsonify({
+                    'predicted_price': round(float(predicted_price), 2),
+                    'currency': 'INR'
+                })
+        except custom_price_model.UnseenLabelError as e:
+            # UNSEEN_LABEL_POLICY=reject
+            return jsonify({'error': str(e)}), 400
         except Exception as e:
             print(f"Error in custom model: {e}")
             return jsonify({'error': str(e)}), 500
@@ -70,23 +148,219 @@ def predict_price():
         'currency': 'INR'
     })
 
-@app.route('/recommend', methods=['POST'])
-def recommend():
-    # Mock Recommendation
+@app.route('/predict-price/batch', methods=['POST'])
+def predict_price_batch():
+    # Body: {"records": [{...}, ...]} (or a bare list of records)
+    if not custom_price_model or custom_price_model.model is None:
+        return jsonify({'error': 'Price model not available'}), 503
+
+    with STAGE_SECONDS.time('price', 'parse'):
+        data = request.json
+    records = data.get('records') if isinstance(data, dict) else data
+    if not isinstance(records, list):
+        return jsonify({'error': "Expected a list of records"}), 400
+
+    valid = [i for i, r in enumerate(records) if isinstance(r, dict)]
+    try:
+        prices, errors = custom_price_model.predict_many([records[i] for i in valid], return_errors=True)
+    except Exception as e:
+        print(f"Error in custom model: {e}")
+        return jsonify({'error': str(e)}), 500
+
+    predictions = [{'error': 'Each record must be a JSON object'} for _ in records]
+    for pos, i in enumerate(valid):
+        if pos in errors:
+            predictions[i] = {'error': errors[pos]}
+        else:
+            predictions[i] = {'predicted_price': round(float(prices[pos]), 2)}
+
+    with STAGE_SECONDS.time('price', 'serialize'):
+        return jsonify({
+            'predictions': predictions,
+            'currency': 'INR'
+        })
+
+@app.route('/predict-price/sweep', methods=['POST'])
+def predict_price_sweep():
+    # Body: {"base": {...}, "axes": [{"field": "material", "values": "all"},
+    #                                 {"field": "weight_g", "start": 100, "stop": 2000, "num": 20}]}
+    if not custom_price_model or custom_price_model.model is None:
+        return jsonify({'error': 'Price model not available'}), 503
+
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    base = data.get('base', {})
+    axes = data.get('axes', [])
+    if not isinstance(base, dict) or not isinstance(axes, list) or not all(isinstance(a, dict) for a in axes):
+        return jsonify({'error': "Expected 'base' object and 'axes' list"}), 400
+
+    try:
+        axis_values, prices = custom_price_model.sweep(base, axes)
+    except (TypeError, ValueError) as e:
+        # Bad axis spec, oversized grid or (policy=reject) unseen label
+        return jsonify({'error': str(e)}), 400
+
     return jsonify({
-        'recommendations': [
-            {'id': 101, 'name': 'Bamboo Basket', 'score': 0.95},
-            {'id': 204, 'name': 'Jute Bag', 'score': 0.88}
-        ]
+        'axes': [{'field': a['field'], 'values': v} for a, v in zip(axes, axis_values)],
+        'predicted_prices': prices.round(2).tolist(),
+        'currency': 'INR'
     })
 
+@app.route('/model-versions', methods=['GET'])
+def model_versions():
+    # Registry version serving, the one kept for rollback and shadow stats
+    if custom_price_model:
+        return jsonify({'price': custom_price_model.version_info()})
+    return jsonify({})
+
+@app.route('/cache-stats', methods=['GET'])
+def cache_stats():
+    # Hit/miss/eviction counters of the price prediction cache
+    if custom_price_model:
+        return jsonify({'price': custom_price_model.prediction_cache.stats()})
+    return jsonify({})
+
+# Built (or loaded) on the first /recommend request rather than at startup,
+# and reloaded when another worker or `recommender.py add` saves the index
+product_index = None
+product_index_mtime = None
+product_index_lock = threading.Lock()
+
+def index_mtime():
+    path = recommender.INDEX_PATH
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+def get_product_index():
+    global product_index, product_index_mtime
+    mtime = index_mtime()
+    if product_index is None or mtime != product_index_mtime:
+        with product_index_lock:
+            if product_index is None or mtime != product_index_mtime:
+                product_index = recommender.load_or_build()
+                product_index_mtime = mtime
+                print(f"Recommendation index ready: {product_index.size} products.")
+    return product_index
+
+@app.route('/recommend', methods=['POST'])
+def recommend():
+    # Body: {"product_id": "42", "k": 5}, or product attributes
+    # ({"name", "description", "material", "category", "region", "dimensions", "weight_g"})
+    data = request.json or {}
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object'}), 400
+    try:
+        k = int(data.get('k', 5))
+    except (TypeError, ValueError):
+        return jsonify({'error': "'k' must be an integer"}), 400
+    k = max(1, min(k, 100))
+
+    index = get_product_index()
+    product_id = data.get('product_id')
+    if product_id is not None:
+        product = index.get(product_id)
+        if product is None:
+            return jsonify({'error': f"Unknown product_id {product_id}"}), 404
+        exclude = [product_id]
+    else:
+        try:
+            product = recommender.product_record(data)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        exclude = [product['id']] if data.get('_id') or data.get('id') else []
+
+    with STAGE_SECONDS.time('recommend', 'predict'):
+        results = index.query(product, k, exclude_ids=exclude)
+    return jsonify({'recommendations': recommender.format_results(results)})
+
+@app.route('/recommend/products', methods=['POST'])
+def add_recommend_products():
+    # Body: {"products": [{...}, ...]} (or a bare list) of Product documents;
+    # inserted into the index without a rebuild and saved. Admin token only,
+    # since it changes the catalogue every worker serves
+    global product_index, product_index_mtime
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.json
+    products = data.get('products') if isinstance(data, dict) else data
+    if not isinstance(products, list) or not all(isinstance(p, dict) for p in products):
+        return jsonify({'error': 'Expected a list of product objects'}), 400
+    if not all(p.get('_id') or p.get('id') for p in products):
+        return jsonify({'error': "Each product needs an '_id'"}), 400
+
+    try:
+        records = [recommender.product_record(p) for p in products]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Merged into the saved index under its file lock, then served here
+    index = recommender.add_and_save(records)
+    with product_index_lock:
+        product_index, product_index_mtime = index, index_mtime()
+    return jsonify({'indexed': len(products), 'total': index.size})
+
+# Pre-aggregated order trends; reloaded when another worker or
+# `trends.py ingest` rewrites the state
+trend_store = None
+trend_store_mtime = None
+trend_store_lock = threading.Lock()
+
+def trend_state_mtime():
+    path = trends.STATE_PATH
+    return os.stat(path).st_mtime_ns if os.path.exists(path) else None
+
+def get_trend_store():
+    global trend_store, trend_store_mtime
+    mtime = trend_state_mtime()
+    if trend_store is None or mtime != trend_store_mtime:
+        with trend_store_lock:
+            if trend_store is None or mtime != trend_store_mtime:
+                trend_store = trends.load_store()
+                trend_store_mtime = mtime
+    return trend_store
+
 @app.route('/trends', methods=['GET'])
-def trends():
-    # Mock Trend Forecast
-    return jsonify({
-        'category': 'Textiles',
-        'forecast': [120, 135, 150, 140, 160]
-    })
+def get_trends():
+    # /trends?category=Home%20Decor -> series, rolling windows and forecast;
+    # without a category, the categories that have orders
+    store = get_trend_store()
+    category = request.args.get('category')
+    if not category:
+        return jsonify({'categories': store.categories()})
+    summary = store.get(category)
+    if summary is None:
+        return jsonify({'error': f"No orders for category {category}"}), 404
+    return jsonify(summary)
+
+@app.route('/trends/orders', methods=['POST'])
+def ingest_trend_orders():
+    # Body: {"orders": [{...}, ...]} (or a bare list) of Order documents whose
+    # items carry a category or a populated product. Admin token only, since
+    # the orders feed every worker's trends and forecasts
+    global trend_store_mtime
+    denied = admin_denied()
+    if denied:
+        return denied
+    data = request.json
+    orders = data.get('orders') if isinstance(data, dict) else data
+    if not isinstance(orders, list) or not all(isinstance(o, dict) for o in orders):
+        return jsonify({'error': 'Expected a list of order objects'}), 400
+
+    # Under the state's file lock, the store is re-read if another process
+    # saved since, so concurrent ingests merge instead of the last one winning
+    with file_lock.locked(trends.STATE_PATH + '.lock'):
+        store = get_trend_store()
+        try:
+            # Validates every order before applying any
+            changed = store.ingest(orders)
+        except (TypeError, ValueError) as e:
+            return jsonify({'error': str(e)}), 400
+        if changed:
+            store.save()
+            with trend_store_lock:
+                trend_store_mtime = trend_state_mtime()
+    return jsonify({'ingested': changed, 'categories': len(store.categories())})
 
 if __name__ == '__main__':
     app.run(host='0.0.0.0', port=5000)
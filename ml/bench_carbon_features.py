@@ -0,0 +1,104 @@
+import os
+import sys
+import time
+import warnings
+warnings.filterwarnings("ignore")
+
+import joblib
+import numpy as np
+import pandas as pd
+
+from carbon_features import CarbonFeatureLayout, SCALER_FEATURE_NAMES, get_organic_score, get_handmade_score, load_names
+
+# Per-row latency of building the carbon model input: the original
+# dict/DataFrame construction vs the precompiled CarbonFeatureLayout.
+#   python bench_carbon_features.py [iterations]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SCALER_PATH = os.path.join(BASE_DIR, 'feature_scaler.pkl')
+FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'feature_names.txt')
+SCALER_FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'scaler_feature_names.txt')
+
+SAMPLE = {
+    'material_quantity_kg': 1.8,
+    'energy_used_kwh': 5.5,
+    'transport_distance_km': 300.0,
+    'product_weight_kg': 2.0,
+    'recycled_material_percent': 60.0,
+    'primary_material': 'wood',
+    'production_type': 'handmade'
+}
+
+def legacy_build(data, scaler, model_feature_names):
+    """
+    The feature construction predict_carbon.predict() used before the layout.
+    """
+    features = {}
+    features['material_quantity_kg'] = float(data.get('material_quantity_kg', 0))
+    features['energy_used_kwh'] = float(data.get('energy_used_kwh', 0))
+    features['transport_distance_km'] = float(data.get('transport_distance_km', 0))
+    features['product_weight_kg'] = float(data.get('product_weight_kg', 0))
+    features['recycled_material_percent'] = float(data.get('recycled_material_percent', 0))
+    features['organic_material'] = get_organic_score(data.get('primary_material', ''))
+    features['handmade_level'] = get_handmade_score(data.get('production_type', ''))
+    features['local_or_export'] = 1.0 if features['transport_distance_km'] > 1000 else 0.0
+    features['recyclable_packaging'] = 0.494
+    features['packaging_weight_kg'] = 0.5
+    features['production_time_hours'] = 10.0
+    features['units_per_batch'] = 100.0
+    features['renewable_energy_percent'] = 20.0
+    features['transport_load_kg'] = 1000.0
+    if features['material_quantity_kg'] > 0:
+        features['material_efficiency'] = features['product_weight_kg'] / features['material_quantity_kg']
+    else:
+        features['material_efficiency'] = 0.0
+    features['production_efficiency'] = features['units_per_batch'] / features['production_time_hours']
+    features['total_recycled_material_kg'] = features['material_quantity_kg'] * (features['recycled_material_percent'] / 100.0)
+
+    df_scaler = pd.DataFrame([features])[SCALER_FEATURE_NAMES]
+    X_scaled_all = scaler.transform(df_scaler)
+    scaled_values = dict(zip(SCALER_FEATURE_NAMES, X_scaled_all[0]))
+
+    final_input_dict = {name: 0.0 for name in model_feature_names}
+    for name in SCALER_FEATURE_NAMES:
+        if name in final_input_dict:
+            final_input_dict[name] = scaled_values[name]
+    col_name = f"primary_material_{str(data.get('primary_material', '')).lower().strip()}"
+    if col_name in final_input_dict:
+        final_input_dict[col_name] = 1.0
+    col_name = f"production_type_{str(data.get('production_type', '')).lower().strip()}".replace(" ", "_")
+    if col_name in final_input_dict:
+        final_input_dict[col_name] = 1.0
+    return np.array([[final_input_dict[name] for name in model_feature_names]])
+
+def time_per_row(fn, iterations):
+    fn()  # warm up
+    start = time.perf_counter()
+    for _ in range(iterations):
+        fn()
+    return (time.perf_counter() - start) / iterations
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+
+    scaler = joblib.load(SCALER_PATH)
+    model_feature_names = load_names(FEATURE_NAMES_PATH)
+    layout = CarbonFeatureLayout.from_files(FEATURE_NAMES_PATH, SCALER_FEATURE_NAMES_PATH, scaler)
+
+    expected = legacy_build(SAMPLE, scaler, model_feature_names)
+    actual = layout.transform(SAMPLE)
+    if not np.array_equal(expected, actual):
+        print("Layout output differs from the legacy feature builder!")
+        sys.exit(1)
+
+    row = np.empty(layout.n_features, dtype=np.float64)
+    before = time_per_row(lambda: legacy_build(SAMPLE, scaler, model_feature_names), iterations)
+    after = time_per_row(lambda: layout.fill_row(SAMPLE, row), iterations)
+
+    print(f"Features per row: {layout.n_features}")
+    print(f"Before (dict + DataFrame): {before * 1e6:.1f} us/row")
+    print(f"After (CarbonFeatureLayout): {after * 1e6:.1f} us/row")
+    print(f"Speedup: {before / after:.1f}x")
+
+if __name__ == "__main__":
+    main()
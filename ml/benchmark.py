@@ -0,0 +1,340 @@
+import csv
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from carbon_features import production_types
+
+# Offline benchmark suite for the inference paths:
+#   carbon  predict_carbon.predict_one / predict_many
+#   price   custom_price_model.predict / predict_many
+#   api     the api/carbon.py handler, served on a local HTTPServer
+#   flask   the ml/app.py routes, through Flask's test client
+#
+# Every target runs in a fresh interpreter and reports
+#   cold_start_ms         process start to first prediction (median of --cold-runs)
+#   latency_p50_ms/p99    warm single-row latency
+#   throughput_rows_per_s batch throughput at each --batch-sizes size
+#   peak_rss_mb           peak resident memory of the benchmark process
+#
+# Payloads are derived from data/artisan_dataset_10000_final.csv with a fixed
+# seed, and the prediction caches are disabled, so runs are comparable across
+# commits:
+#
+#   python benchmark.py --out before.json
+#   ... change something ...
+#   python benchmark.py --out after.json --baseline before.json --threshold 0.25
+#
+# With --baseline the run fails (exit 1) when any metric is worse than the
+# baseline by more than --threshold (a fraction).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BASE_DIR), 'api')
+DATA_PATH = os.path.join(BASE_DIR, 'data', 'artisan_dataset_10000_final.csv')
+DEFAULT_OUT = os.path.join(BASE_DIR, 'benchmark_results.json')
+
+TARGETS = ['carbon', 'price', 'api', 'flask']
+DEFAULT_BATCH_SIZES = [1, 100, 10000]
+SEED = 42
+
+# The carbon model's one-hot production types plus one it has no column for
+PRODUCTION_TYPES = production_types(os.path.join(BASE_DIR, 'feature_names.txt')) + ['machine made']
+
+# Metrics where a larger value is an improvement; everything else is a cost
+HIGHER_IS_BETTER = ('throughput_rows_per_s',)
+
+def sample_payloads(n, seed=SEED):
+    """
+    (price_payloads, carbon_payloads): n fixed input dicts each, built from
+    the rows of the training CSV (repeated when n exceeds its size).
+    """
+    with open(DATA_PATH, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    rng = np.random.default_rng(seed)
+    picks = rng.integers(len(rows), size=n)
+    distances = rng.uniform(5, 2500, size=n).round(1)
+    recycled = rng.uniform(0, 100, size=n).round(1)
+    production = rng.integers(len(PRODUCTION_TYPES), size=n)
+
+    price, carbon = [], []
+    for i, row_index in enumerate(picks):
+        row = rows[row_index]
+        price.append({
+            'product_name': row['Product_Name'],
+            'material': row['Material'],
+            'category': row['Category'],
+            'region': row['Region'],
+            'size_cm': row['Size(cm)'],
+            'weight_g': float(row['Weight(g)']),
+        })
+        weight_kg = float(row['Weight(g)']) / 1000
+        try:
+            volume_l = float(np.prod([float(v) for v in row['Size(cm)'].split('x')])) / 1000
+        except ValueError:
+            volume_l = 1.0
+        carbon.append({
+            'material_quantity_kg': round(weight_kg * 1.15, 3),
+            'energy_used_kwh': round(0.5 + volume_l * 0.05, 3),
+            'transport_distance_km': float(distances[i]),
+            'product_weight_kg': round(weight_kg, 3),
+            'recycled_material_percent': float(recycled[i]),
+            'primary_material': row['Material'].lower(),
+            'production_type': PRODUCTION_TYPES[production[i]],
+        })
+    return price, carbon
+
+# Each target is set up inside the benchmark process and returns
+# (predict_one(payload), predict_batch(payloads)).
+
+def setup_carbon(price_payloads, carbon_payloads):
+    import predict_carbon
+    return (
+        lambda i: predict_carbon.predict_one(carbon_payloads[i]),
+        lambda start, n: predict_carbon.predict_many(carbon_payloads[start:start + n]),
+    )
+
+def setup_price(price_payloads, carbon_payloads):
+    import custom_price_model
+    return (
+        lambda i: custom_price_model.predict(price_payloads[i]),
+        lambda start, n: custom_price_model.predict_many(price_payloads[start:start + n]),
+    )
+
+def setup_api(price_payloads, carbon_payloads):
+    import http.client
+    import threading
+    from http.server import ThreadingHTTPServer
+
+    sys.path.insert(0, API_DIR)
+    import carbon
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), carbon.handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_address[1]
+
+    def post(body):
+        conn = http.client.HTTPConnection('127.0.0.1', port)
+        conn.request('POST', '/api/carbon', body=json.dumps(body), headers={'Content-Type': 'application/json'})
+        response = conn.getresponse()
+        payload = response.read()
+        conn.close()
+        if response.status != 200:
+            raise RuntimeError(f"api/carbon returned {response.status}: {payload[:200]}")
+        return payload
+
+    return (
+        lambda i: post(carbon_payloads[i]),
+        lambda start, n: post(carbon_payloads[start:start + n]),
+    )
+
+def setup_flask(price_payloads, carbon_payloads):
+    import app as flask_app
+    client = flask_app.app.test_client()
+
+    def post(path, body):
+        response = client.post(path, json=body)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}: {response.data[:200]}")
+        return response.data
+
+    return (
+        lambda i: post('/predict-price', price_payloads[i]),
+        lambda start, n: post('/predict-price/batch', {'records': price_payloads[start:start + n]}),
+    )
+
+SETUPS = {'carbon': setup_carbon, 'price': setup_price, 'api': setup_api, 'flask': setup_flask}
+
+def child_env():
+    # Measure the models, not the memoization in front of them
+    return dict(os.environ, PREDICTION_CACHE_SIZE='0')
+
+def run_cold(target):
+    """
+    Child mode: set up `target` and make one prediction, then exit.
+    """
+    price, carbon = sample_payloads(1)
+    predict_one, _ = SETUPS[target](price, carbon)
+    predict_one(0)
+
+def run_warm(target, iterations, batch_sizes, out_path):
+    """
+    Child mode: warm latency, batch throughput and peak RSS of `target`.
+    """
+    n = max([iterations] + batch_sizes)
+    price, carbon = sample_payloads(n)
+    predict_one, predict_batch = SETUPS[target](price, carbon)
+    predict_one(0)
+
+    latencies = np.empty(iterations)
+    for i in range(iterations):
+        start = time.perf_counter()
+        predict_one(i)
+        latencies[i] = time.perf_counter() - start
+
+    throughput = {}
+    for size in batch_sizes:
+        # Repeat small batches for at least ~0.5s so the rate is stable
+        calls, elapsed = 0, 0.0
+        while calls < 3 or (elapsed < 0.5 and calls < 1000):
+            start = time.perf_counter()
+            predict_batch((calls * size) % (n - size + 1), size)
+            elapsed += time.perf_counter() - start
+            calls += 1
+        throughput[str(size)] = round(calls * size / elapsed, 1)
+
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    rss_mb = rss / 1e6 if sys.platform == 'darwin' else rss / 1024
+    result = {
+        'latency_p50_ms': round(float(np.percentile(latencies, 50)) * 1000, 3),
+        'latency_p99_ms': round(float(np.percentile(latencies, 99)) * 1000, 3),
+        'throughput_rows_per_s': throughput,
+        'peak_rss_mb': round(rss_mb, 1),
+    }
+    with open(out_path, 'w') as f:
+        json.dump(result, f)
+
+def spawn(args):
+    # Model loading prints to stdout; keep it out of the report
+    return subprocess.run([sys.executable, os.path.abspath(__file__)] + args, cwd=BASE_DIR, env=child_env(),
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+
+def benchmark_target(target, iterations, batch_sizes, cold_runs):
+    cold = []
+    for _ in range(cold_runs):
+        start = time.perf_counter()
+        proc = spawn(['--child-cold', target])
+        elapsed = time.perf_counter() - start
+        if proc.returncode != 0:
+            return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'cold start failed'}
+        cold.append(elapsed)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        out_path = os.path.join(tmp, 'result.json')
+        proc = spawn(['--child-warm', target, '--iterations', str(iterations),
+                      '--batch-sizes'] + [str(s) for s in batch_sizes] + ['--out', out_path])
+        if proc.returncode != 0:
+            return {'error': proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else 'benchmark failed'}
+        with open(out_path) as f:
+            result = json.load(f)
+    result = {'cold_start_ms': round(float(np.median(cold)) * 1000, 1), **result}
+    return result
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BASE_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def flatten(results):
+    """
+    {'carbon.latency_p99_ms': ..., 'carbon.throughput_rows_per_s.100': ...}
+    """
+    flat = {}
+    for target, metrics in results.items():
+        for name, value in metrics.items():
+            if isinstance(value, dict):
+                for key, v in value.items():
+                    flat[f"{target}.{name}.{key}"] = v
+            elif isinstance(value, (int, float)):
+                flat[f"{target}.{name}"] = value
+    return flat
+
+def compare(results, baseline, threshold):
+    """
+    Returns a list of human-readable regressions against `baseline`. A
+    target that now fails, or a metric the baseline has but this run lacks,
+    counts as one; targets not run this time are ignored.
+    """
+    current, previous = flatten(results), flatten(baseline['results'])
+    regressions = []
+    for target, metrics in results.items():
+        old = baseline['results'].get(target)
+        if not old or 'error' in old:
+            continue
+        if 'error' in metrics:
+            regressions.append(f"{target}: failed ({metrics['error']})")
+            continue
+        regressions += [f"{key}: {previous[key]} -> missing" for key in previous
+                        if key.startswith(target + '.') and key not in current]
+    for key, value in current.items():
+        old = previous.get(key)
+        if not old:
+            continue
+        change = (value - old) / old
+        worse = -change if any(m in key for m in HIGHER_IS_BETTER) else change
+        if worse > threshold:
+            regressions.append(f"{key}: {old} -> {value} ({change:+.0%})")
+    return regressions
+
+def print_report(results):
+    for target, metrics in results.items():
+        if 'error' in metrics:
+            print(f"{target:<7} skipped: {metrics['error']}")
+            continue
+        rates = ', '.join(f"{size}: {rate:,.0f}/s" for size, rate in metrics['throughput_rows_per_s'].items())
+        print(f"{target:<7} cold {metrics['cold_start_ms']:7.1f} ms | "
+              f"p50 {metrics['latency_p50_ms']:7.3f} ms  p99 {metrics['latency_p99_ms']:7.3f} ms | "
+              f"batch {rates} | rss {metrics['peak_rss_mb']:.0f} MB")
+
+def main(args):
+    results = {}
+    for target in args.targets:
+        results[target] = benchmark_target(target, args.iterations, args.batch_sizes, args.cold_runs)
+
+    report = {
+        'commit': git_commit(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'iterations': args.iterations,
+        'batch_sizes': args.batch_sizes,
+        'results': results,
+    }
+    with open(args.out, 'w') as f:
+        json.dump(report, f, indent=2)
+    print_report(results)
+    print(f"Wrote {args.out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) over {args.threshold:.0%} vs {args.baseline} ({baseline.get('commit')}):")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"No regressions over {args.threshold:.0%} vs {args.baseline} ({baseline.get('commit')})")
+    return 0
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmark the carbon and price inference paths")
+    parser.add_argument('--targets', nargs='+', choices=TARGETS, default=TARGETS)
+    parser.add_argument('--iterations', type=int, default=1000, help="Warm single-row predictions per target")
+    parser.add_argument('--batch-sizes', nargs='+', type=int, default=DEFAULT_BATCH_SIZES)
+    parser.add_argument('--cold-runs', type=int, default=3, help="Fresh processes timed for the cold start")
+    parser.add_argument('--out', default=DEFAULT_OUT)
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    parser.add_argument('--threshold', type=float, default=0.25, help="Allowed fractional regression per metric")
+    parser.add_argument('--child-cold', help=argparse.SUPPRESS)
+    parser.add_argument('--child-warm', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_cold:
+        run_cold(args.child_cold)
+    elif args.child_warm:
+        run_warm(args.child_warm, args.iterations, args.batch_sizes, args.out)
+    else:
+        sys.exit(main(args))
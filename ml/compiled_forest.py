@@ -0,0 +1,309 @@
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+
+# Flattened tree ensembles: every estimator's tree_ is exported into one set
+# of contiguous arrays so inference only needs NumPy (no sklearn import, no
+# per-estimator predict dispatch).
+
+FORMAT_VERSION = 1
+
+# Rows evaluated at once; bounds the (n_trees, rows) node index matrix
+CHUNK_ROWS = 4096
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CARBON_MODEL_PATH = os.path.join(BASE_DIR, 'carbon_emission_model.pkl')
+PRICE_MODEL_PATH = os.path.join(BASE_DIR, 'models', 'price_prediction_model.joblib')
+
+def compiled_path(model_path):
+    """
+    Where the compiled copy of a pickled model lives (same name, .npz).
+    """
+    return os.path.splitext(model_path)[0] + '.npz'
+
+def file_sha256(path, block_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def source_record(path):
+    """
+    Size, mtime and sha256 of the file a compiled artifact was made from.
+    """
+    st = os.stat(path)
+    return {'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'sha256': file_sha256(path)}
+
+def source_matches(record, path):
+    """
+    Whether `path` still holds what `record` describes. The stat is checked
+    first; the file is only hashed when its mtime moved (a copy, a checkout).
+    A missing file matches: deployments may ship only the compiled copy.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return True
+    if st.st_size != record['size']:
+        return False
+    if st.st_mtime_ns == record['mtime_ns']:
+        return True
+    return file_sha256(path) == record['sha256']
+
+def flatten_estimators(model):
+    """
+    Flattens a fitted RandomForest/ExtraTrees regressor or a single
+    DecisionTreeRegressor into a dict of arrays.
+
+    Children of leaves point back at the leaf itself, so a walk of
+    max_depth steps always ends on a leaf without per-row bookkeeping.
+    """
+    estimators = list(model.estimators_) if hasattr(model, 'estimators_') else [model]
+
+    features, thresholds, lefts, rights, values, missing_left, roots = [], [], [], [], [], [], []
+    offset = 0
+    max_depth = 0
+    for est in estimators:
+        tree = est.tree_
+        n = tree.node_count
+        node_ids = np.arange(n)
+        is_leaf = tree.children_left == -1
+
+        left = np.where(is_leaf, node_ids, tree.children_left) + offset
+        right = np.where(is_leaf, node_ids, tree.children_right) + offset
+        if tree.value.shape[1] != 1 or tree.value.shape[2] != 1:
+            raise ValueError("Only single-output regression trees can be compiled")
+
+        features.append(np.where(is_leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(left)
+        rights.append(right)
+        values.append(tree.value[:, 0, 0])
+        if hasattr(tree, 'missing_go_to_left'):
+            missing_left.append(np.asarray(tree.missing_go_to_left, dtype=bool))
+        else:
+            missing_left.append(np.zeros(n, dtype=bool))
+        roots.append(offset)
+        offset += n
+        max_depth = max(max_depth, tree.max_depth)
+
+    return {
+        'version': np.array(FORMAT_VERSION),
+        'feature': np.concatenate(features).astype(np.int32),
+        'threshold': np.concatenate(thresholds).astype(np.float64),
+        'left': np.concatenate(lefts).astype(np.int32),
+        'right': np.concatenate(rights).astype(np.int32),
+        'value': np.concatenate(values).astype(np.float64),
+        'missing_go_to_left': np.concatenate(missing_left),
+        'roots': np.array(roots, dtype=np.int32),
+        'max_depth': np.array(max_depth),
+        'n_features': np.array(model.n_features_in_),
+        # Forests average their trees; a single tree is returned as-is
+        'average': np.array(hasattr(model, 'estimators_')),
+    }
+
+def export_forest(model, path, source_path=None):
+    """
+    Writes the compiled forest; with `source_path` (the pickle it came
+    from) load_model can tell when the pickle was retrained since.
+    """
+    arrays = flatten_estimators(model)
+    if source_path:
+        arrays['source'] = np.array(json.dumps(source_record(source_path)))
+    # np.savez appends .npz to a name without it
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, **arrays)
+    os.replace(tmp_path, path)
+
+def compiled_is_current(model_path):
+    """
+    False when the pickle at `model_path` changed after its .npz was
+    exported (or the .npz does not say what it was exported from).
+    """
+    npz_path = compiled_path(model_path)
+    if npz_path == model_path or not os.path.exists(model_path):
+        return True
+    with np.load(npz_path) as arrays:
+        if 'source' not in arrays.files:
+            return False
+        record = json.loads(str(arrays['source']))
+    return source_matches(record, model_path)
+
+class CompiledForest:
+    """
+    NumPy evaluator for a flattened tree ensemble.
+
+    Reproduces sklearn's predict exactly: inputs are cast to float32 before
+    the threshold comparisons and tree outputs are summed in estimator order
+    before dividing by the number of trees.
+    """
+
+    def __init__(self, arrays):
+        version = int(arrays['version'])
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported compiled forest version {version}")
+        self.feature = np.asarray(arrays['feature'])
+        self.threshold = np.asarray(arrays['threshold'])
+        self.left = np.asarray(arrays['left'])
+        self.right = np.asarray(arrays['right'])
+        self.value = np.asarray(arrays['value'])
+        self.missing_go_to_left = np.asarray(arrays['missing_go_to_left'])
+        self.roots = np.asarray(arrays['roots'])
+        self.max_depth = int(arrays['max_depth'])
+        self.n_features_in_ = int(arrays['n_features'])
+        self.average = bool(arrays['average'])
+        self.n_trees = len(self.roots)
+        self.has_missing_left = bool(self.missing_go_to_left.any())
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls({key: arrays[key] for key in arrays.files})
+
+    @classmethod
+    def from_model(cls, model):
+        return cls(flatten_estimators(model))
+
+    def to_arrays(self):
+        return {
+            'version': np.array(FORMAT_VERSION),
+            'feature': self.feature,
+            'threshold': self.threshold,
+            'left': self.left,
+            'right': self.right,
+            'value': self.value,
+            'missing_go_to_left': self.missing_go_to_left,
+            'roots': self.roots,
+            'max_depth': np.array(self.max_depth),
+            'n_features': np.array(self.n_features_in_),
+            'average': np.array(self.average),
+        }
+
+    def _predict_dense(self, X):
+        n = X.shape[0]
+        rows = np.arange(n)[np.newaxis, :]
+        nodes = np.repeat(self.roots[:, np.newaxis], n, axis=1)
+        for _ in range(self.max_depth):
+            x = X[rows, self.feature[nodes]]
+            go_left = x <= self.threshold[nodes]
+            if self.has_missing_left:
+                go_left |= np.isnan(x) & self.missing_go_to_left[nodes]
+            nodes = np.where(go_left, self.left[nodes], self.right[nodes])
+
+        leaf_values = self.value[nodes]
+        out = np.zeros(n, dtype=np.float64)
+        for t in range(self.n_trees):
+            out += leaf_values[t]
+        if self.average:
+            out /= self.n_trees
+        return out
+
+    def predict(self, X):
+        """
+        Predicts for a 2-D array, DataFrame or scipy sparse matrix.
+        """
+        sparse = hasattr(X, 'toarray')
+        if not sparse:
+            X = np.asarray(X, dtype=np.float32)
+        if X.ndim != 2 or X.shape[1] != self.n_features_in_:
+            raise ValueError(f"Expected {self.n_features_in_} features, got shape {X.shape}")
+
+        out = np.empty(X.shape[0], dtype=np.float64)
+        for start in range(0, X.shape[0], CHUNK_ROWS):
+            chunk = X[start:start + CHUNK_ROWS]
+            if sparse:
+                chunk = chunk.toarray().astype(np.float32)
+            out[start:start + CHUNK_ROWS] = self._predict_dense(chunk)
+        return out
+
+def load_model(model_path):
+    """
+    Returns the compiled forest next to `model_path` when one exists and
+    was exported from the current pickle, otherwise unpickles the sklearn
+    model itself.
+    """
+    npz_path = compiled_path(model_path)
+    if os.path.exists(npz_path):
+        if compiled_is_current(model_path):
+            return CompiledForest.load(npz_path)
+        print(f"Warning: {npz_path} is older than {model_path}; loading the pickle "
+              f"(re-export with compiled_forest.py)", file=sys.stderr)
+    import joblib
+    return joblib.load(model_path)
+
+def verify_price_model(model, compiled):
+    """
+    Compares sklearn and compiled predictions over the training CSV.
+    """
+    import joblib
+    import pandas as pd
+
+    import custom_price_model
+    from train_model import DATA_PATH
+
+    df = pd.read_csv(DATA_PATH)
+    encoders = joblib.load(custom_price_model.ENCODERS_PATH)
+    feature_names = joblib.load(custom_price_model.FEATURE_NAMES_PATH)
+    sizes = df['Size(cm)'].astype(str).map(custom_price_model.parse_size)
+    df['Size_L'], df['Size_W'], df['Size_H'] = zip(*sizes)
+    for col, le in encoders.items():
+        df[col] = le.transform(df[col].astype(str))
+    X = df[feature_names]
+    return model.predict(X), compiled.predict(X.to_numpy())
+
+def verify_carbon_model(model, compiled, n_rows=10000, seed=0):
+    """
+    Compares sklearn and compiled predictions over random carbon inputs.
+    """
+    import joblib
+
+    import predict_carbon
+    from carbon_features import CarbonFeatureLayout
+
+    scaler = joblib.load(predict_carbon.SCALER_PATH)
+    layout = CarbonFeatureLayout.from_files(predict_carbon.FEATURE_NAMES_PATH, predict_carbon.SCALER_FEATURE_NAMES_PATH, scaler)
+    rng = np.random.default_rng(seed)
+    materials = list(layout.material_columns) + ['jute', '']
+    production_types = list(layout.production_type_columns) + ['machine made', '']
+    records = [{
+        'material_quantity_kg': float(rng.uniform(0.1, 8)),
+        'energy_used_kwh': float(rng.uniform(0.1, 12)),
+        'transport_distance_km': float(rng.uniform(1, 2000)),
+        'product_weight_kg': float(rng.uniform(0.1, 8)),
+        'recycled_material_percent': float(rng.uniform(0, 100)),
+        'primary_material': materials[rng.integers(len(materials))],
+        'production_type': production_types[rng.integers(len(production_types))],
+    } for _ in range(n_rows)]
+    X, _, _ = layout.transform_many(records)
+    return model.predict(X), compiled.predict(X)
+
+def export_and_verify(model_path, verify):
+    import joblib
+
+    if not os.path.exists(model_path):
+        print(f"Skipping {model_path}: not found")
+        return True
+    model = joblib.load(model_path)
+    npz_path = compiled_path(model_path)
+    export_forest(model, npz_path, model_path)
+    compiled = CompiledForest.load(npz_path)
+    print(f"Exported {compiled.n_trees} trees ({len(compiled.value)} nodes) to {npz_path}")
+
+    expected, actual = verify(model, compiled)
+    mismatches = int(np.sum(expected != actual))
+    print(f"Verified {len(expected)} rows: {mismatches} mismatches")
+    return mismatches == 0
+
+if __name__ == "__main__":
+    # python compiled_forest.py [carbon|price ...]
+    targets = sys.argv[1:] or ['carbon', 'price']
+    ok = True
+    if 'carbon' in targets:
+        ok &= export_and_verify(CARBON_MODEL_PATH, verify_carbon_model)
+    if 'price' in targets:
+        ok &= export_and_verify(PRICE_MODEL_PATH, verify_price_model)
+    sys.exit(0 if ok else 1)
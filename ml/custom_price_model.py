@@ -1,8 +1,17 @@
+import math
 import os
-import joblib
-import pandas as pd
+import random
+import sys
+import threading
+import time
 import numpy as np
 
+import model_registry
+from compiled_forest import compiled_path, load_model
+from metrics import MODEL_LOAD_SECONDS, PREDICTION_ERRORS, PREDICTIONS, REGISTRY, STAGE_SECONDS
+from model_bundle import DEFAULT_BUNDLE_PATH as BUNDLE_PATH, open_bundle, require_bundle
+from prediction_cache import PredictionCache, normalize_categorical
+
 # Define paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_DIR = os.path.join(BASE_DIR, 'models')
@@ -10,17 +19,311 @@ MODEL_PATH = os.path.join(MODEL_DIR, 'price_prediction_model.joblib')
 ENCODERS_PATH = os.path.join(MODEL_DIR, 'label_encoders.joblib')
 FEATURE_NAMES_PATH = os.path.join(MODEL_DIR, 'feature_names.joblib')
 
-# Load artifacts globally to avoid reloading on every request
+# Map input keys to training column names
+CATEGORICAL_FIELDS = {
+    'product_name': 'Product_Name',
+    'material': 'Material',
+    'category': 'Category',
+    'region': 'Region'
+}
+
+# What to do with a categorical value the encoder has never seen:
+#   'zero'          - use code 0 (the historical behaviour)
+#   'most_frequent' - use the code of the most frequent training class
+#                     (recorded with the encoders by train_model.py)
+#   'reject'        - raise UnseenLabelError
+UNSEEN_LABEL_POLICIES = ('zero', 'most_frequent', 'reject')
+UNSEEN_LABEL_POLICY = os.environ.get('UNSEEN_LABEL_POLICY', 'zero')
+
+class UnseenLabelError(ValueError):
+    pass
+
+class ModelNotLoadedError(RuntimeError):
+    pass
+
+def build_vocabularies(labels):
+    """
+    Turns {column: [classes in code order]} into plain {normalized label:
+    code} dicts. Lookups are case/whitespace-insensitive, so 'silk ' and
+    'Silk' encode (and cache) identically. Classes that differ only in case
+    or spacing keep their own codes: their normalized label maps to an
+    {exact class: code} dict instead (see lookup_code), with a warning.
+    """
+    vocabularies = {}
+    for col, classes in labels.items():
+        vocab = {}
+        for code, c in enumerate(classes):
+            key = normalize_categorical(c)
+            if key not in vocab:
+                vocab[key] = code
+                continue
+            if not isinstance(vocab[key], dict):
+                vocab[key] = {classes[vocab[key]]: vocab[key]}
+            vocab[key][c] = code
+            print(f"Warning: {col} classes {sorted(vocab[key])} differ only in case or spacing; "
+                  f"they are matched exactly", file=sys.stderr)
+        vocabularies[col] = vocab
+    return vocabularies
+
+def lookup_code(vocab, value):
+    """
+    Code of `value` in a build_vocabularies dict, or None when unseen.
+    """
+    code = vocab.get(normalize_categorical(value))
+    if isinstance(code, dict):
+        code = code.get('' if value is None else str(value))
+    return code
+
+def build_unseen_codes(vocabularies, policy, most_frequent):
+    """
+    Code used for unseen labels in each column (None when rejected).
+    `most_frequent` is {column: label}, recorded at training time.
+    """
+    if policy not in UNSEEN_LABEL_POLICIES:
+        raise ValueError(f"Unknown unseen label policy '{policy}'")
+    if policy == 'reject':
+        return {col: None for col in vocabularies}
+    codes = {col: 0 for col in vocabularies}
+    if policy == 'most_frequent':
+        missing = [col for col in vocabularies if col not in most_frequent]
+        if missing:
+            print(f"No most frequent label recorded for {', '.join(missing)} (retrain to record it); "
+                  f"unseen labels there use code 0.", file=sys.stderr)
+        for col, label in most_frequent.items():
+            code = lookup_code(vocabularies[col], label) if col in vocabularies else None
+            if code is not None:
+                codes[col] = code
+    return codes
+
+class PriceArtifacts:
+    """
+    One loaded price model: forest, feature order and encoder vocabularies.
+    Requests take a reference once, so a hot reload never mixes versions
+    within a request.
+    """
+
+    def __init__(self, model, feature_names, labels, encoders=None, version=None, most_frequent=None):
+        self.model = model
+        self.encoders = encoders
+        self.feature_names = list(feature_names)
+        self.labels = labels
+        self.vocabularies = build_vocabularies(labels)
+        # Inputs whose column has classes matched exactly; cached on the raw value
+        self.exact_fields = [key for key, col in CATEGORICAL_FIELDS.items()
+                             if any(isinstance(c, dict) for c in self.vocabularies.get(col, {}).values())]
+        self.unseen_codes = build_unseen_codes(self.vocabularies, UNSEEN_LABEL_POLICY, most_frequent or {})
+        self.version = version
+
+def load_artifacts(bundle_path=BUNDLE_PATH, model_path=MODEL_PATH, encoders_path=ENCODERS_PATH,
+                   feature_names_path=FEATURE_NAMES_PATH, version=None):
+    """
+    The model bundle (see model_bundle.py) when it has a price section, then
+    a compiled price_prediction_model.npz (see compiled_forest.py), then the
+    pickled forest.
+    """
+    bundle = open_bundle(bundle_path, 'price')
+    if bundle is not None:
+        feature_names, labels, most_frequent = bundle.price_artifacts()
+        return PriceArtifacts(bundle.forest('price'), feature_names, labels, version=version, most_frequent=most_frequent)
+    require_bundle(bundle_path, 'price')
+    import joblib
+    encoders = joblib.load(encoders_path)
+    labels = {col: [str(c) for c in le.classes_] for col, le in encoders.items()}
+    most_frequent = {col: le.most_frequent_ for col, le in encoders.items() if hasattr(le, 'most_frequent_')}
+    return PriceArtifacts(load_model(model_path), joblib.load(feature_names_path), labels, encoders, version,
+                          most_frequent)
+
+def load_version(version):
+    """
+    A version published to the model registry (see model_registry.py).
+    """
+    path = model_registry.version_dir('price', version)
+    return load_artifacts(
+        os.path.join(path, model_registry.BUNDLE_NAME),
+        os.path.join(path, 'price_prediction_model.joblib'),
+        os.path.join(path, 'label_encoders.joblib'),
+        os.path.join(path, 'feature_names.joblib'),
+        version=version,
+    )
+
+def _set_active(artifacts):
+    # Module-level names are kept for callers that read them directly
+    global active, model, encoders, feature_names, labels, vocabularies, unseen_codes
+    active = artifacts
+    model = artifacts.model if artifacts else None
+    encoders = artifacts.encoders if artifacts else None
+    feature_names = artifacts.feature_names if artifacts else None
+    labels = artifacts.labels if artifacts else None
+    vocabularies = artifacts.vocabularies if artifacts else None
+    unseen_codes = artifacts.unseen_codes if artifacts else None
+
+# Load artifacts globally to avoid reloading on every request: the CURRENT
+# registry version when there is one, else the files in models/.
+_load_start = time.perf_counter()
 try:
-    model = joblib.load(MODEL_PATH)
-    encoders = joblib.load(ENCODERS_PATH)
-    feature_names = joblib.load(FEATURE_NAMES_PATH)
+    _version = model_registry.current_version('price')
+    _set_active(load_version(_version) if _version else load_artifacts())
+    MODEL_LOAD_SECONDS.set(time.perf_counter() - _load_start, 'price')
     print("Model and artifacts loaded successfully.")
 except Exception as e:
     print(f"Error loading model artifacts: {e}")
-    model = None
-    encoders = None
-    feature_names = None
+    _set_active(None)
+
+# Hot reload: the registry pointers are re-read at most every
+# MODEL_RELOAD_INTERVAL seconds (0 = never) from the request path. A new
+# version is loaded on a background thread and swapped in with a single
+# assignment; requests already running finish on the version they started
+# with. The replaced version stays loaded, so rolling back to it is instant.
+RELOAD_INTERVAL = float(os.environ.get('MODEL_RELOAD_INTERVAL', 5))
+previous = None
+# (PriceArtifacts, percent) of the shadow candidate
+shadow = None
+_reload_lock = threading.Lock()
+_last_reload_check = time.monotonic()
+_loading = set()
+# version -> mtime of the pointer naming it when its load failed; retried
+# once the pointer is written again
+_failed = {}
+
+SHADOW_ROWS = REGISTRY.counter(
+    'ml_shadow_rows_total', "Rows also scored by the shadow candidate", ['model', 'version'])
+SHADOW_DIFF = REGISTRY.histogram(
+    'ml_shadow_relative_diff', "|candidate - current| / current per shadowed row", ['model', 'version'],
+    buckets=(0.001, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0))
+# Shadow batches waiting for the comparison thread; more are dropped
+MAX_SHADOW_BACKLOG = 8
+_shadow_executor = None
+_shadow_backlog = 0
+shadow_stats = {}
+
+def _swap(artifacts):
+    global previous
+    with _reload_lock:
+        old = active
+        _set_active(artifacts)
+        if old is not None and old.version != artifacts.version:
+            previous = old
+    print(f"Price model now serving version {artifacts.version}")
+
+def _set_shadow(artifacts, percent):
+    global shadow
+    shadow = (artifacts, percent)
+    shadow_stats.clear()
+    print(f"Shadowing {percent:g}% of price traffic to version {artifacts.version}")
+
+def _load_in_background(version, on_loaded, pointer_mtime=None):
+    with _reload_lock:
+        if version in _loading or (version in _failed and _failed[version] == pointer_mtime):
+            return
+        _failed.pop(version, None)
+        _loading.add(version)
+
+    def run():
+        start = time.perf_counter()
+        try:
+            artifacts = load_version(version)
+            # Fault the model pages in before it takes traffic
+            _predict_matrix(np.zeros((1, len(artifacts.feature_names))), artifacts)
+            MODEL_LOAD_SECONDS.set(time.perf_counter() - start, 'price')
+            on_loaded(artifacts)
+        except Exception as e:
+            print(f"Could not load price version {version}: {e}")
+            with _reload_lock:
+                _failed[version] = pointer_mtime
+        finally:
+            with _reload_lock:
+                _loading.discard(version)
+
+    threading.Thread(target=run, name=f"load-price-{version}", daemon=True).start()
+
+def check_for_updates(force=False):
+    """
+    Follows the registry's CURRENT and CANDIDATE pointers. Cheap enough to
+    call on every request.
+    """
+    global _last_reload_check, shadow
+    now = time.monotonic()
+    if not force and (RELOAD_INTERVAL <= 0 or now - _last_reload_check < RELOAD_INTERVAL):
+        return
+    _last_reload_check = now
+    try:
+        wanted = model_registry.current_version('price')
+        wanted_mtime = model_registry.pointer_mtime('price', 'CURRENT')
+        spec = model_registry.candidate('price')
+        spec_mtime = model_registry.pointer_mtime('price', 'CANDIDATE')
+    except (OSError, ValueError, KeyError) as e:
+        print(f"Could not read the model registry: {e}")
+        return
+
+    if wanted and (active is None or wanted != active.version):
+        if previous is not None and previous.version == wanted:
+            _swap(previous)
+        else:
+            _load_in_background(wanted, _swap, wanted_mtime)
+
+    if spec is None:
+        shadow = None
+    elif shadow is None or shadow[0].version != spec[0]:
+        _load_in_background(spec[0], lambda artifacts: _set_shadow(artifacts, spec[1]), spec_mtime)
+    elif shadow[1] != spec[1]:
+        shadow = (shadow[0], spec[1])
+
+def _compare_shadow(candidate, records, expected):
+    global _shadow_backlog
+    try:
+        X, rejected = encode_many(records, candidate)
+        ok = [j for j in range(len(records)) if j not in rejected]
+        if not ok:
+            return
+        actual = _predict_matrix(X[ok], candidate)
+        expected = np.asarray(expected)[ok]
+        diff = np.abs(actual - expected)
+        relative = diff / np.maximum(np.abs(expected), 1e-9)
+        for value in relative:
+            SHADOW_DIFF.observe(float(value), 'price', candidate.version)
+        SHADOW_ROWS.inc('price', candidate.version, amount=len(ok))
+        with _reload_lock:
+            n = shadow_stats.get('rows', 0)
+            shadow_stats['version'] = candidate.version
+            shadow_stats['rows'] = n + len(ok)
+            shadow_stats['mean_abs_diff'] = (shadow_stats.get('mean_abs_diff', 0.0) * n + float(diff.sum())) / (n + len(ok))
+            shadow_stats['max_abs_diff'] = max(shadow_stats.get('max_abs_diff', 0.0), float(diff.max()))
+    except Exception as e:
+        print(f"Shadow comparison with version {candidate.version} failed: {e}")
+    finally:
+        with _reload_lock:
+            _shadow_backlog -= 1
+
+def _submit_shadow(candidate, records, expected):
+    """
+    Scores the rows with the candidate on a background thread; the caller
+    never waits for it.
+    """
+    global _shadow_executor, _shadow_backlog
+    from concurrent.futures import ThreadPoolExecutor
+
+    with _reload_lock:
+        if _shadow_backlog >= MAX_SHADOW_BACKLOG:
+            return
+        _shadow_backlog += 1
+        if _shadow_executor is None:
+            _shadow_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='price-shadow')
+    _shadow_executor.submit(_compare_shadow, candidate, records, expected)
+
+def version_info():
+    spec = shadow
+    return {
+        'version': active.version if active else None,
+        'previous': previous.version if previous else None,
+        'candidate': {'version': spec[0].version, 'percent': spec[1]} if spec else None,
+        'shadow': dict(shadow_stats),
+    }
+
+# Memoized predictions keyed on normalized inputs (see prediction_cache.py);
+# dropped automatically when any artifact file changes
+prediction_cache = PredictionCache.from_env(
+    artifact_paths=[BUNDLE_PATH, MODEL_PATH, compiled_path(MODEL_PATH), ENCODERS_PATH, FEATURE_NAMES_PATH]
+)
 
 def parse_size(size_str):
     try:
@@ -33,6 +336,123 @@ def parse_size(size_str):
     except:
         return 0.0, 0.0, 0.0
 
+def parse_weight(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+def cache_key(data, version=None, exact_fields=()):
+    size = tuple(round(v, prediction_cache.precision) for v in parse_size(data.get('size_cm', '')))
+    return prediction_cache.make_key(
+        data,
+        categorical_fields=list(CATEGORICAL_FIELDS),
+        numeric_fields=['weight_g'],
+        # Entries of a replaced registry version are never served again
+        extra=size + (version,) + tuple(str(data.get(f)) for f in exact_fields),
+    )
+
+def encode_many(records, artifacts=None):
+    """
+    Builds the model input matrix (columns in feature_names order) for a
+    list of input dicts. Returns (X, errors) where errors maps the index of
+    every rejected record to its message.
+    """
+    artifacts = artifacts or active
+    n = len(records)
+    X = np.zeros((n, len(artifacts.feature_names)), dtype=np.float64)
+    columns = {name: i for i, name in enumerate(artifacts.feature_names)}
+    errors = {}
+
+    # 1. Numerical features
+    if 'Weight(g)' in columns:
+        X[:, columns['Weight(g)']] = [parse_weight(r.get('weight_g', 0)) for r in records]
+    sizes = np.array([parse_size(r.get('size_cm', '')) for r in records], dtype=np.float64).reshape(n, 3)
+    for i, col in enumerate(['Size_L', 'Size_W', 'Size_H']):
+        if col in columns:
+            X[:, columns[col]] = sizes[:, i]
+
+    # 2. Categorical features
+    for input_key, col_name in CATEGORICAL_FIELDS.items():
+        if col_name not in columns:
+            continue
+        vocab = artifacts.vocabularies.get(col_name)
+        if vocab is None:
+            continue
+        default = artifacts.unseen_codes[col_name]
+        codes = X[:, columns[col_name]]
+        for i, r in enumerate(records):
+            val = r.get(input_key, '')
+            code = lookup_code(vocab, val)
+            if code is None:
+                if default is None:
+                    errors.setdefault(i, f"Unseen {col_name} '{val}'")
+                    continue
+                code = default
+            codes[i] = code
+    return X, errors
+
+def _predict_matrix(X, artifacts=None):
+    artifacts = artifacts or active
+    if hasattr(artifacts.model, 'feature_names_in_'):
+        # Pickled sklearn forest fitted on a DataFrame: keep the column names
+        import pandas as pd
+        X = pd.DataFrame(X, columns=artifacts.feature_names)
+    return artifacts.model.predict(X)
+
+def predict_many(records, return_errors=False, use_cache=True):
+    """
+    Predicts prices for a list of input dicts with a single model call.
+
+    Cached records are answered from prediction_cache unless use_cache is
+    False (large sweeps would only evict the hot entries). With the
+    'reject' unseen label policy a rejected record raises UnseenLabelError,
+    or, when return_errors is True, is returned as NaN alongside an
+    {index: message} dict.
+    """
+    check_for_updates()
+    # One version for the whole call, even if a reload swaps it meanwhile
+    artifacts = active
+    if artifacts is None:
+        raise ModelNotLoadedError("Price model is not loaded")
+    n = len(records)
+    prices = np.full(n, np.nan)
+    keys = [cache_key(r, artifacts.version, artifacts.exact_fields) for r in records] if use_cache else None
+
+    pending = []
+    for i in range(n):
+        hit, price = prediction_cache.get(keys[i]) if use_cache else (False, None)
+        if hit:
+            prices[i] = price
+        else:
+            pending.append(i)
+
+    errors = {}
+    if pending:
+        with STAGE_SECONDS.time('price', 'features'):
+            X, rejected = encode_many([records[i] for i in pending], artifacts)
+        if rejected:
+            PREDICTION_ERRORS.inc('price', amount=len(rejected))
+            if not return_errors:
+                raise UnseenLabelError(next(iter(rejected.values())))
+        ok = [j for j in range(len(pending)) if j not in rejected]
+        if ok:
+            with STAGE_SECONDS.time('price', 'predict'):
+                predicted = _predict_matrix(X[ok], artifacts)
+            PREDICTIONS.inc('price', amount=len(ok))
+            candidate = shadow
+            if candidate is not None and random.random() * 100 < candidate[1]:
+                _submit_shadow(candidate[0], [records[pending[j]] for j in ok], predicted)
+            for j, price in zip(ok, predicted):
+                prices[pending[j]] = price
+                if use_cache:
+                    prediction_cache.put(keys[pending[j]], float(price))
+        errors = {pending[j]: message for j, message in rejected.items()}
+
+    if return_errors:
+        return prices, errors
+    return prices
+
 def predict(data):
     """
     Predicts the price based on the input data.
@@ -42,62 +462,88 @@ def predict(data):
         return 100.0
 
     try:
-        # Prepare input dictionary
-        input_data = {}
-        
-        # 1. Handle Numerical Features
-        # Weight
-        try:
-            input_data['Weight(g)'] = float(data.get('weight_g', 0))
-        except:
-            input_data['Weight(g)'] = 0.0
-            
-        # Size
-        l, w, h = parse_size(data.get('size_cm', ''))
-        input_data['Size_L'] = l
-        input_data['Size_W'] = w
-        input_data['Size_H'] = h
-        
-        # 2. Handle Categorical Features
-        # Map input keys to training column names
-        cat_map = {
-            'product_name': 'Product_Name',
-            'material': 'Material',
-            'category': 'Category',
-            'region': 'Region'
-        }
-        
-        for input_key, col_name in cat_map.items():
-            val = data.get(input_key, '')
-            le = encoders.get(col_name)
-            if le:
-                try:
-                    # Try to transform
-                    input_data[col_name] = le.transform([str(val)])[0]
-                except ValueError:
-                    # Handle unseen label - assign to first class or a default
-                    # print(f"Warning: Unseen label '{val}' for column '{col_name}'. Using default.")
-                    input_data[col_name] = 0 # Default to 0
-            else:
-                input_data[col_name] = 0
-
-        # 3. Create DataFrame with correct column order
-        df_input = pd.DataFrame([input_data])
-        
-        # Ensure all features are present (fill missing with 0)
-        for col in feature_names:
-            if col not in df_input.columns:
-                df_input[col] = 0
-                
-        # Reorder columns to match training
-        df_input = df_input[feature_names]
-        
-        # 4. Predict
-        prediction = model.predict(df_input)[0]
-        
-        return float(prediction)
-        
+        return float(predict_many([data])[0])
+    except UnseenLabelError:
+        raise
     except Exception as e:
+        PREDICTION_ERRORS.inc('price')
         print(f"Error during prediction: {e}")
         return 100.0
 
+# Largest grid /predict-price/sweep will score in one call
+MAX_SWEEP_POINTS = 10000
+NUMERIC_SWEEP_FIELDS = ['weight_g']
+
+def known_labels(input_key):
+    """
+    Training classes of a categorical input field, e.g. every Material.
+    """
+    return list(active.labels[CATEGORICAL_FIELDS[input_key]])
+
+def sweep_values(axis):
+    """
+    Expands one sweep axis spec into its list of values:
+      {"field": "material", "values": "all"}            every known class
+      {"field": "material", "values": ["Silk", "Jute"]}
+      {"field": "weight_g", "start": 100, "stop": 2000, "num": 20}
+      {"field": "weight_g", "start": 100, "stop": 2000, "step": 100}
+    """
+    field = axis.get('field')
+    if field not in CATEGORICAL_FIELDS and field not in NUMERIC_SWEEP_FIELDS:
+        raise ValueError(f"Cannot sweep over '{field}'")
+
+    values = axis.get('values')
+    if values == 'all':
+        if field not in CATEGORICAL_FIELDS:
+            raise ValueError(f"'all' is only valid for categorical fields, not '{field}'")
+        return known_labels(field)
+    if isinstance(values, list):
+        return values
+    if field in NUMERIC_SWEEP_FIELDS and 'start' in axis and 'stop' in axis:
+        start, stop = float(axis['start']), float(axis['stop'])
+        if not (math.isfinite(start) and math.isfinite(stop)):
+            raise ValueError("'start' and 'stop' must be finite")
+        # Point count is checked before any array is built
+        if 'step' in axis:
+            step = float(axis['step'])
+            if not step > 0:
+                raise ValueError("'step' must be positive")
+            # Same points as np.arange(start, stop + step / 2, step)
+            span = (stop - start) / step + 0.5
+            num = max(0, math.floor(span) + 1) if math.isfinite(span) else math.inf
+        else:
+            num = float(axis.get('num', 10))
+            if not num >= 1:
+                raise ValueError("'num' must be at least 1")
+        if num > MAX_SWEEP_POINTS:
+            raise ValueError(f"Axis '{field}' has {num:.0f} points, more than {MAX_SWEEP_POINTS}")
+        num = int(num)
+        if 'step' in axis:
+            return (start + step * np.arange(num)).tolist()
+        return np.linspace(start, stop, num).tolist()
+    raise ValueError(f"Axis '{field}' needs 'values' or a start/stop range")
+
+def sweep(base, axes):
+    """
+    Scores a what-if grid: `base` with one or two fields varied over `axes`.
+    Returns (axis_values, prices) where prices has one dimension per axis.
+    """
+    if not 1 <= len(axes) <= 2:
+        raise ValueError("A sweep takes one or two axes")
+    axis_values = [sweep_values(axis) for axis in axes]
+    shape = tuple(len(v) for v in axis_values)
+    if int(np.prod(shape)) > MAX_SWEEP_POINTS:
+        raise ValueError(f"Sweep grid of {int(np.prod(shape))} points exceeds {MAX_SWEEP_POINTS}")
+
+    fields = [axis['field'] for axis in axes]
+    records = []
+    for index in np.ndindex(*shape):
+        record = dict(base)
+        for field, values, i in zip(fields, axis_values, index):
+            record[field] = values[i]
+        records.append(record)
+
+    prices, errors = predict_many(records, return_errors=True, use_cache=False)
+    if errors:
+        raise UnseenLabelError(next(iter(errors.values())))
+    return axis_values, prices.reshape(shape)
@@ -1,41 +1,226 @@
-import pandas as pd
-import random
+import json
 import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from carbon_features import production_types
+
+# Synthetic artisan listings in the training schema of
+# data/artisan_dataset_10000_final.csv (the columns train_model.py and
+# custom_price_model read), for load and scale testing:
+#
+#   python data_generator.py --rows 20000000 --out data/synthetic_products.csv
+#   python data_generator.py --rows 1000000 --out data/synthetic_products.parquet    (needs pyarrow)
+#   python data_generator.py --rows 100000 --carbon-payloads data/carbon_payloads.jsonl
+#
+# Rows are generated NumPy-vectorized, CHUNK_ROWS at a time, and appended to
+# the output, so memory stays bounded whatever --rows is. The same --seed and
+# --chunk-rows always produce the same file. Value ranges follow the
+# distribution of the reference dataset.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+# Not data/products.csv: app.py reads that file with pandas at startup
+DEFAULT_OUT = os.path.join(BASE_DIR, 'data', 'synthetic_products.csv')
+FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'feature_names.txt')
+CHUNK_ROWS = 200000
+
+COLUMNS = ['Product_Name', 'Material', 'Category', 'Region', 'Size(cm)', 'Weight(g)',
+           'Description_Keywords', 'Price(INR)', 'Image_URL']
+
+PRODUCT_NAMES = [
+    'Bamboo Basket', 'Bamboo Pen Stand', 'Banarasi Silk Saree', 'Bandhani Dupatta', 'Block Print Bedsheet',
+    'Blue Pottery Plate', 'Brass Idol', 'Brass Puja Thali', 'Cane Chair Miniature', 'Channapatna Toy',
+    'Clay Diya Set', 'Clay Water Bottle', 'Copper Bottle', 'Copper Mug', 'Dhokra Figurine',
+    'Hand-painted Kettle', 'Handcrafted Wind Chime', 'Handloom Kurta', 'Handloom Scarf', 'Handmade Diary',
+    'Handwoven Basket', 'Handwoven Carpet', 'Jute Handbag', 'Jute Table Mat', 'Kalamkari Saree',
+    'Kantha Stitch Saree', 'Kolhapuri Chappal', 'Lippan Art Frame', 'Macrame Wall Hanging', 'Madhubani Painting',
+    'Marble Coaster Set', 'Palm Leaf Box', 'Paper Mache Box', 'Pashmina Shawl', 'Phulkari Dupatta',
+    'Rattan Lamp', 'Sheesham Wood Bowl', 'Stone Carved Ganesha', 'Terracotta Jewellery', 'Terracotta Planter',
+    'Terracotta Pot', 'Tribal Art Mask', 'Warli Art Canvas', 'Wood Carved Elephant', 'Wooden Keychain',
+    'Wooden Spice Box', 'Woolen Muffler', 'Woolen Shawl', 'Zari Work Blouse',
+]
+MATERIALS = [
+    'Bamboo', 'Brass', 'Cane', 'Canvas', 'Clay', 'Copper', 'Cotton', 'Cotton Rope', 'Handmade Paper', 'Jute',
+    'Leather', 'Marble', 'Organic Cotton', 'Palm Leaf', 'Paper Mache', 'Pashmina Wool', 'Quartz', 'Silk',
+    'Stone', 'Wood', 'Wool',
+]
+CATEGORIES = [
+    'Accessories', 'Bags', 'Clothing', 'Decor', 'Festive Item', 'Footwear', 'Furniture Miniature',
+    'Home Decor', 'Jewellery', 'Kids Toy', 'Kitchenware', 'Spiritual Item', 'Stationery', 'Wall Art',
+]
+REGIONS = [
+    'Assam', 'Bihar', 'Chhattisgarh', 'Delhi', 'Goa', 'Gujarat', 'Haryana', 'Karnataka', 'Kashmir', 'Kerala',
+    'Madhya Pradesh', 'Maharashtra', 'Odisha', 'Punjab', 'Rajasthan', 'Tamil Nadu', 'Uttar Pradesh', 'West Bengal',
+]
+KEYWORDS = [
+    'artisan made', 'boho style', 'classic finish', 'cultural', 'durable', 'eco-friendly', 'embroidery',
+    'hand-painted', 'handcrafted', 'heritage craft', 'lacquered', 'minimal design', 'natural dyes', 'premium',
+    'sustainable', 'traditional', 'tribal', 'unique design', 'vibrant', 'woven',
+]
+KEYWORDS_PER_ROW = 3
+IMAGE_URL = 'https://dummyimage.com/600x600/cccccc/000000.jpg&text={}'
+
+# Inclusive ranges of the reference dataset
+WEIGHT_G = (100, 5000)
+PRICE_INR = (101, 15000)
+SIZE_L_CM = (10, 100)
+SIZE_W_CM = (10, 100)
+SIZE_H_CM = (5, 60)
+
+# Every production_type with a one-hot column in the carbon model, plus one
+# without (scored through handmade_level only)
+PRODUCTION_TYPES = production_types(FEATURE_NAMES_PATH) + ['machine made']
+
+def _labels(values):
+    return np.array(values, dtype=object)
+
+def _join(parts, sep):
+    """
+    Elementwise sep.join over equal-length object arrays.
+    """
+    out = parts[0].astype(str).astype(object)
+    for part in parts[1:]:
+        out = out + sep + part.astype(str).astype(object)
+    return out
+
+def generate_chunk(rng, n):
+    """
+    One DataFrame of n listings in COLUMNS order.
+    """
+    names = rng.integers(len(PRODUCT_NAMES), size=n)
+    dims = np.stack([
+        rng.integers(SIZE_L_CM[0], SIZE_L_CM[1] + 1, size=n),
+        rng.integers(SIZE_W_CM[0], SIZE_W_CM[1] + 1, size=n),
+        rng.integers(SIZE_H_CM[0], SIZE_H_CM[1] + 1, size=n),
+    ])
+    # KEYWORDS_PER_ROW distinct keywords: the smallest of a row of random keys
+    keys = rng.random((n, len(KEYWORDS)), dtype=np.float32)
+    keyword_idx = np.argpartition(keys, KEYWORDS_PER_ROW, axis=1)[:, :KEYWORDS_PER_ROW]
+    keywords = _labels(KEYWORDS)
+
+    return pd.DataFrame({
+        'Product_Name': _labels(PRODUCT_NAMES)[names],
+        'Material': _labels(MATERIALS)[rng.integers(len(MATERIALS), size=n)],
+        'Category': _labels(CATEGORIES)[rng.integers(len(CATEGORIES), size=n)],
+        'Region': _labels(REGIONS)[rng.integers(len(REGIONS), size=n)],
+        'Size(cm)': _join(list(dims), 'x'),
+        'Weight(g)': rng.integers(WEIGHT_G[0], WEIGHT_G[1] + 1, size=n, dtype=np.int32),
+        'Description_Keywords': _join([keywords[keyword_idx[:, i]] for i in range(KEYWORDS_PER_ROW)], ', '),
+        'Price(INR)': rng.integers(PRICE_INR[0], PRICE_INR[1] + 1, size=n, dtype=np.int32),
+        'Image_URL': _labels([IMAGE_URL.format(name.replace(' ', '+')) for name in PRODUCT_NAMES])[names],
+    }, columns=COLUMNS)
+
+def carbon_payloads(rng, chunk):
+    """
+    Carbon model inputs (predict_carbon / api/carbon.py) for the listings in
+    `chunk`, derived from their weight, size and material.
+    """
+    n = len(chunk)
+    weight_kg = chunk['Weight(g)'].to_numpy(dtype=np.float64) / 1000
+    dims = chunk['Size(cm)'].str.split('x', expand=True).astype(np.float64).to_numpy()
+    volume_l = dims.prod(axis=1) / 1000
+    return pd.DataFrame({
+        'material_quantity_kg': (weight_kg * 1.15).round(3),
+        'energy_used_kwh': (0.5 + volume_l * 0.05).round(3),
+        'transport_distance_km': rng.uniform(5, 2500, size=n).round(1),
+        'product_weight_kg': weight_kg.round(3),
+        'recycled_material_percent': rng.uniform(0, 100, size=n).round(1),
+        'primary_material': chunk['Material'].str.lower().to_numpy(),
+        'production_type': _labels(PRODUCTION_TYPES)[rng.integers(len(PRODUCTION_TYPES), size=n)],
+    })
+
+class CsvWriter:
+    def __init__(self, path):
+        self.f = open(path, 'w', newline='', encoding='utf-8')
+        self.header = True
+
+    def write(self, chunk):
+        chunk.to_csv(self.f, header=self.header, index=False)
+        self.header = False
+
+    def close(self):
+        self.f.close()
+
+class ParquetWriter:
+    def __init__(self, path):
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise RuntimeError("Parquet output needs pyarrow (pip install pyarrow)")
+        self.pa = pa
+        self.pq = pq
+        self.path = path
+        self.writer = None
+
+    def write(self, chunk):
+        table = self.pa.Table.from_pandas(chunk, preserve_index=False)
+        if self.writer is None:
+            self.writer = self.pq.ParquetWriter(self.path, table.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+def open_writer(path, fmt=None):
+    fmt = fmt or ('parquet' if path.endswith('.parquet') else 'csv')
+    return ParquetWriter(path) if fmt == 'parquet' else CsvWriter(path)
+
+def generate(out_path, rows, seed=42, chunk_rows=CHUNK_ROWS, fmt=None, payloads_path=None, payload_rows=None):
+    """
+    Streams `rows` listings to `out_path` and, optionally, carbon payloads
+    for the first `payload_rows` of them (default: all) to `payloads_path`
+    as JSON lines.
+    """
+    os.makedirs(os.path.dirname(os.path.abspath(out_path)), exist_ok=True)
+    rng = np.random.default_rng(seed)
+    # Payload randomness is drawn separately so it never shifts the listings
+    payload_rng = np.random.default_rng([seed, 1])
+    payload_rows = rows if payload_rows is None else min(payload_rows, rows)
+
+    writer = open_writer(out_path, fmt)
+    payloads = open(payloads_path, 'w', encoding='utf-8') if payloads_path else None
+    start = time.perf_counter()
+    written = 0
+    try:
+        while written < rows:
+            n = min(chunk_rows, rows - written)
+            chunk = generate_chunk(rng, n)
+            writer.write(chunk)
+            if payloads and written < payload_rows:
+                wanted = chunk.iloc[:payload_rows - written]
+                for record in carbon_payloads(payload_rng, wanted).to_dict('records'):
+                    payloads.write(json.dumps(record) + "\n")
+            written += n
+            elapsed = time.perf_counter() - start
+            print(f"  {written:,}/{rows:,} rows ({written / elapsed:,.0f} rows/s)")
+    finally:
+        writer.close()
+        if payloads:
+            payloads.close()
+
+    print(f"Generated {written:,} products in {out_path}")
+    if payloads_path:
+        print(f"Wrote {payload_rows:,} carbon payloads to {payloads_path}")
+
+if __name__ == "__main__":
+    import argparse
 
-# Ensure data directory exists
-os.makedirs('data', exist_ok=True)
-
-categories = ['Textiles', 'Pottery', 'Woodwork', 'Jewelry', 'Home Decor']
-materials = ['Cotton', 'Silk', 'Bamboo', 'Jute', 'Clay', 'Wood', 'Silver', 'Brass']
-regions = ['India', 'Vietnam', 'Peru', 'Kenya', 'Mexico']
-
-def generate_product(id):
-    category = random.choice(categories)
-    material = random.choice(materials)
-    region = random.choice(regions)
-    
-    # Base price logic for some realism
-    base_price = 20
-    if material in ['Silk', 'Silver']: base_price += 50
-    if material in ['Wood', 'Brass']: base_price += 30
-    if region == 'Peru': base_price += 10 # Shipping/Import factor mock
-    
-    price = base_price + random.uniform(-10, 20)
-    
-    return {
-        'Product_ID': id,
-        'Name': f"{material} {category} Item {id}",
-        'Category': category,
-        'Material': material,
-        'Region': region,
-        'Weight_kg': round(random.uniform(0.1, 5.0), 2),
-        'Sustainability_Rating': random.randint(3, 5),
-        'Price': round(price, 2)
-    }
-
-# Generate 200 products
-data = [generate_product(i) for i in range(1, 201)]
-
-df = pd.DataFrame(data)
-df.to_csv('data/products.csv', index=False)
-print(f"Generated {len(df)} products in data/products.csv")
+    parser = argparse.ArgumentParser(description="Generate synthetic artisan listings in the training schema")
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--out', default=DEFAULT_OUT, help="Output .csv or .parquet")
+    parser.add_argument('--format', choices=['csv', 'parquet'], help="Default: from the --out extension")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS, help="Rows generated and written at a time")
+    parser.add_argument('--carbon-payloads', help="Also write carbon model inputs to this JSONL file")
+    parser.add_argument('--payload-rows', type=int, help="Carbon payloads to write (default: one per row)")
+    args = parser.parse_args()
+    try:
+        generate(args.out, args.rows, args.seed, args.chunk_rows, args.format, args.carbon_payloads, args.payload_rows)
+    except RuntimeError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -0,0 +1,23 @@
+import fcntl
+from contextlib import contextmanager
+
+# Advisory lock shared by every process (gunicorn workers, CLI runs) that
+# read-modify-writes the same state file, e.g.
+#
+#   with locked(INDEX_PATH + '.lock'):
+#       index = ProductIndex.load(INDEX_PATH)
+#       ...
+#       index.save(INDEX_PATH)
+
+@contextmanager
+def locked(path):
+    """
+    Holds an exclusive flock on `path` (created if missing). Threads of one
+    process exclude each other too, since each call opens its own handle.
+    """
+    with open(path, 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
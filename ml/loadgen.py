@@ -0,0 +1,294 @@
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import time
+from urllib.parse import urlsplit
+
+import numpy as np
+
+# Load generator for the ML services. Replays JSONL payloads (one request
+# body per line) or synthetic ones against a running ml/app.py (Flask dev
+# server or gunicorn) or against api/carbon.handler served locally:
+#
+#   python loadgen.py --url http://127.0.0.1:5000/predict-price --mode closed --concurrency 1 4 16
+#   python loadgen.py --serve-api --mode open --rate 100 200 400 800 --duration 15
+#   python loadgen.py --url http://127.0.0.1:5000/predict-price --payloads data/requests.jsonl
+#
+# closed  N clients, each sending its next request as soon as the previous
+#         one completes (throughput follows the service)
+# open    requests start at a fixed rate whether or not earlier ones have
+#         finished; latency is measured from the scheduled start, so queueing
+#         in an overloaded service shows up in the percentiles
+#
+# Several --concurrency/--rate values run one step each, which makes the
+# saturation point visible in the summary: achieved throughput stops
+# following the offered load while p99 and errors climb.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BASE_DIR), 'api')
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BOUNDS_MS = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, float('inf')]
+SYNTHETIC_PAYLOADS = 10000
+
+def load_payloads(path):
+    with open(path, encoding='utf-8') as f:
+        payloads = [json.loads(line) for line in f if line.strip()]
+    if not payloads:
+        raise ValueError(f"{path} has no payloads")
+    return payloads
+
+def synthetic_payloads(kind, n=SYNTHETIC_PAYLOADS, seed=42):
+    """
+    Price (/predict-price) or carbon (api/carbon) request bodies from
+    data_generator.py.
+    """
+    from data_generator import carbon_payloads, generate_chunk
+
+    rng = np.random.default_rng(seed)
+    chunk = generate_chunk(rng, n)
+    if kind == 'carbon':
+        return carbon_payloads(rng, chunk).to_dict('records')
+    return [{
+        'product_name': row['Product_Name'],
+        'material': row['Material'],
+        'category': row['Category'],
+        'region': row['Region'],
+        'size_cm': row['Size(cm)'],
+        'weight_g': int(row['Weight(g)']),
+    } for row in chunk.to_dict('records')]
+
+async def post(host, port, path, body, timeout):
+    """
+    One HTTP/1.1 POST on a fresh connection. Returns the status code.
+    """
+    async def exchange():
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            writer.write(
+                f"POST {path} HTTP/1.1\r\nHost: {host}:{port}\r\nContent-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+            status_line = await reader.readline()
+            await reader.read()
+        finally:
+            writer.close()
+        parts = status_line.split()
+        if len(parts) < 2:
+            raise ConnectionError("Malformed response")
+        return int(parts[1])
+    return await asyncio.wait_for(exchange(), timeout)
+
+class StepResult:
+    def __init__(self, label):
+        self.label = label
+        self.latencies = []
+        self.errors = {}
+        self.dropped = 0
+        self.elapsed = 0.0
+
+    def record(self, latency, error=None):
+        if error is None:
+            self.latencies.append(latency)
+        else:
+            self.errors[error] = self.errors.get(error, 0) + 1
+
+    def summary(self):
+        ok = len(self.latencies)
+        failed = sum(self.errors.values()) + self.dropped
+        lat = np.array(self.latencies) * 1000
+        counts = np.histogram(lat, bins=[0] + HISTOGRAM_BOUNDS_MS)[0] if ok else np.zeros(len(HISTOGRAM_BOUNDS_MS))
+        pct = lambda q: round(float(np.percentile(lat, q)), 2) if ok else None
+        return {
+            'step': self.label,
+            'requests': ok + failed,
+            'ok': ok,
+            'errors': dict(self.errors, **({'dropped': self.dropped} if self.dropped else {})),
+            'error_rate': round(failed / (ok + failed), 4) if ok + failed else 0.0,
+            'throughput_rps': round(ok / self.elapsed, 1) if self.elapsed else 0.0,
+            'latency_ms': {'p50': pct(50), 'p90': pct(90), 'p99': pct(99), 'p999': pct(99.9),
+                           'max': round(float(lat.max()), 2) if ok else None},
+            'histogram_ms': {('inf' if b == float('inf') else str(b)): int(c) for b, c in zip(HISTOGRAM_BOUNDS_MS, counts)},
+        }
+
+class LoadGenerator:
+    def __init__(self, url, payloads, timeout=10.0):
+        parts = urlsplit(url)
+        self.host = parts.hostname
+        self.port = parts.port or 80
+        self.path = parts.path or '/'
+        self.bodies = [json.dumps(p).encode() for p in payloads]
+        self.timeout = timeout
+        self._next = 0
+
+    def next_body(self):
+        body = self.bodies[self._next % len(self.bodies)]
+        self._next += 1
+        return body
+
+    async def _request(self, result, started):
+        try:
+            status = await post(self.host, self.port, self.path, self.next_body(), self.timeout)
+            error = None if status == 200 else f"http_{status}"
+        except asyncio.TimeoutError:
+            error = 'timeout'
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            # Refused or dropped connection, malformed status line, body cut short
+            error = type(e).__name__
+        result.record(time.perf_counter() - started, error)
+
+    async def closed_loop(self, concurrency, duration):
+        result = StepResult(f"closed c={concurrency}")
+        start = time.perf_counter()
+        deadline = start + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                await self._request(result, time.perf_counter())
+
+        await asyncio.gather(*(client() for _ in range(concurrency)))
+        result.elapsed = time.perf_counter() - start
+        return result
+
+    async def open_loop(self, rate, duration, max_inflight):
+        result = StepResult(f"open rate={rate:g}/s")
+        start = time.perf_counter()
+        inflight = set()
+        for i in range(int(rate * duration)):
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if len(inflight) >= max_inflight:
+                # The client itself is saturated; count instead of queueing
+                result.dropped += 1
+                continue
+            task = asyncio.ensure_future(self._request(result, scheduled))
+            inflight.add(task)
+            task.add_done_callback(inflight.discard)
+        if inflight:
+            await asyncio.wait(inflight)
+        result.elapsed = time.perf_counter() - start
+        return result
+
+def print_step(summary, histogram=True):
+    lat = summary['latency_ms']
+    errors = ', '.join(f"{k}: {v}" for k, v in summary['errors'].items()) or 'none'
+    print(f"{summary['step']}: {summary['requests']} requests, {summary['throughput_rps']} ok/s, "
+          f"error rate {summary['error_rate']:.2%} ({errors})")
+    print(f"  latency ms  p50 {lat['p50']}  p90 {lat['p90']}  p99 {lat['p99']}  p99.9 {lat['p999']}  max {lat['max']}")
+    if histogram and summary['ok']:
+        peak = max(summary['histogram_ms'].values())
+        for bound, count in summary['histogram_ms'].items():
+            if count:
+                print(f"  <= {bound:>5} ms {count:8d} {'#' * max(1, round(40 * count / peak))}")
+
+def print_table(summaries):
+    print(f"{'step':<22} {'ok/s':>9} {'p50 ms':>9} {'p99 ms':>9} {'errors':>8}")
+    for s in summaries:
+        lat = s['latency_ms']
+        print(f"{s['step']:<22} {s['throughput_rps']:>9} {str(lat['p50']):>9} {str(lat['p99']):>9} {s['error_rate']:>8.2%}")
+
+def serve_api(port):
+    """
+    Runs api/carbon.handler on a local HTTP server (used in a subprocess).
+    """
+    from http.server import ThreadingHTTPServer
+
+    sys.path.insert(0, API_DIR)
+    import carbon
+
+    class Server(ThreadingHTTPServer):
+        # Listen backlog large enough for open-loop bursts
+        request_queue_size = 1024
+
+    class QuietHandler(carbon.handler):
+        def log_message(self, format, *args):
+            pass
+
+    Server(('127.0.0.1', port), QuietHandler).serve_forever()
+
+def start_api_server(port):
+    proc = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child-serve-api', str(port)],
+                            cwd=BASE_DIR, stdout=subprocess.DEVNULL)
+    deadline = time.time() + 30
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("api/carbon server exited during startup")
+        try:
+            asyncio.run(post('127.0.0.1', port, '/', b'{}', 1.0))
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.terminate()
+    raise RuntimeError("api/carbon server did not start")
+
+async def run_steps(generator, args):
+    summaries = []
+    steps = args.concurrency if args.mode == 'closed' else args.rate
+    for value in steps:
+        if args.mode == 'closed':
+            result = await generator.closed_loop(value, args.duration)
+        else:
+            result = await generator.open_loop(value, args.duration, args.max_inflight)
+        summary = result.summary()
+        print_step(summary, histogram=not args.no_histogram)
+        summaries.append(summary)
+    return summaries
+
+def main(args):
+    server = None
+    url = args.url
+    if args.serve_api:
+        server = start_api_server(args.port)
+        url = f"http://127.0.0.1:{args.port}/api/carbon"
+    if not url:
+        print("Error: give --url or --serve-api")
+        return 1
+
+    kind = args.synthetic or ('carbon' if 'carbon' in url else 'price')
+    payloads = load_payloads(args.payloads) if args.payloads else synthetic_payloads(kind)
+    print(f"Target {url}: {len(payloads)} {'payloads from ' + args.payloads if args.payloads else kind + ' synthetic payloads'}")
+
+    try:
+        summaries = asyncio.run(run_steps(LoadGenerator(url, payloads, args.timeout), args))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if len(summaries) > 1:
+        print_table(summaries)
+    if args.out:
+        with open(args.out, 'w') as f:
+            json.dump({'url': url, 'mode': args.mode, 'duration': args.duration, 'steps': summaries}, f, indent=2)
+        print(f"Wrote {args.out}")
+    return 0
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Replay JSONL or synthetic payloads against the ML services")
+    parser.add_argument('--url', help="Endpoint to load, e.g. http://127.0.0.1:5000/predict-price")
+    parser.add_argument('--serve-api', action='store_true', help="Serve api/carbon.handler locally and load it")
+    parser.add_argument('--port', type=int, default=8765, help="Port for --serve-api")
+    parser.add_argument('--payloads', help="JSONL file, one request body per line")
+    parser.add_argument('--synthetic', choices=['price', 'carbon'], help="Synthetic payload kind (default: from the URL)")
+    parser.add_argument('--mode', choices=['closed', 'open'], default='closed')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[8], help="Closed-loop clients per step")
+    parser.add_argument('--rate', type=float, nargs='+', default=[50.0], help="Open-loop requests/s per step")
+    parser.add_argument('--duration', type=float, default=10.0, help="Seconds per step")
+    parser.add_argument('--timeout', type=float, default=10.0, help="Per-request timeout in seconds")
+    parser.add_argument('--max-inflight', type=int, default=1000, help="Open-loop cap on outstanding requests")
+    parser.add_argument('--no-histogram', action='store_true')
+    parser.add_argument('--out', help="Write the step summaries to this JSON file")
+    parser.add_argument('--child-serve-api', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child_serve_api:
+        serve_api(args.child_serve_api)
+    else:
+        sys.exit(main(args))
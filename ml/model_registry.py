@@ -0,0 +1,269 @@
+import itertools
+import json
+import os
+import shutil
+import sys
+import time
+
+# Versioned model registry. Every published model is an immutable directory
+# and small pointer files say which version serves:
+#
+#   models/registry/price/
+#       versions/20260101120000/   artifacts + model_bundle.bin + meta.json
+#       CURRENT                    version serving traffic
+#       PREVIOUS                   version CURRENT replaced (rollback target)
+#       CANDIDATE                  {"version": ..., "percent": ...} shadow traffic
+#
+#   python model_registry.py list
+#   python model_registry.py publish models/ [--candidate-percent 10]
+#   python model_registry.py activate 20260101120000
+#   python model_registry.py rollback
+#   python model_registry.py shadow 20260101120000 --percent 5 | shadow --off
+#
+# Pointers are replaced with os.replace, so a reader sees the old or the new
+# version, never a partial write. Serving processes poll CURRENT and
+# CANDIDATE (see custom_price_model.py) and load new versions in the
+# background.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR = os.environ.get('MODEL_REGISTRY_DIR', os.path.join(BASE_DIR, 'models', 'registry'))
+
+# Versions kept on disk per model (CURRENT, PREVIOUS and CANDIDATE always are)
+KEEP_VERSIONS = int(os.environ.get('MODEL_REGISTRY_KEEP', 5))
+
+# Artifacts copied into a price version (the bundle holds the compiled forest)
+PRICE_ARTIFACTS = ['price_prediction_model.joblib', 'label_encoders.joblib', 'feature_names.joblib']
+BUNDLE_NAME = 'model_bundle.bin'
+
+class RegistryError(ValueError):
+    pass
+
+def model_dir(name, root=None):
+    return os.path.join(root or REGISTRY_DIR, name)
+
+def version_dir(name, version, root=None):
+    return os.path.join(model_dir(name, root), 'versions', version)
+
+def _write_atomic(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def read_pointer(name, pointer, root=None):
+    """
+    Contents of a pointer file (stripped), or None when it is not set.
+    """
+    try:
+        with open(os.path.join(model_dir(name, root), pointer)) as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+def pointer_mtime(name, pointer, root=None):
+    """
+    When a pointer file was last written (ns), or None when it is not set.
+    """
+    try:
+        return os.stat(os.path.join(model_dir(name, root), pointer)).st_mtime_ns
+    except FileNotFoundError:
+        return None
+
+def current_version(name, root=None):
+    return read_pointer(name, 'CURRENT', root)
+
+def candidate(name, root=None):
+    """
+    (version, percent) of the shadow candidate, or None.
+    """
+    value = read_pointer(name, 'CANDIDATE', root)
+    if value is None:
+        return None
+    spec = json.loads(value)
+    return spec['version'], float(spec['percent'])
+
+def list_versions(name, root=None):
+    path = os.path.join(model_dir(name, root), 'versions')
+    if not os.path.isdir(path):
+        return []
+    return sorted(v for v in os.listdir(path) if not v.endswith('.staging'))
+
+def read_meta(name, version, root=None):
+    with open(os.path.join(version_dir(name, version, root), 'meta.json')) as f:
+        return json.load(f)
+
+def _require_version(name, version, root):
+    if not os.path.isdir(version_dir(name, version, root)):
+        raise RegistryError(f"{name} has no version {version}")
+
+def activate(name, version, root=None):
+    """
+    Points CURRENT at `version`; the version it replaces becomes PREVIOUS.
+    """
+    _require_version(name, version, root)
+    current = current_version(name, root)
+    # Re-activating the serving version still rewrites CURRENT, which makes
+    # servers that failed to load it try again
+    if current is not None and current != version:
+        _write_atomic(os.path.join(model_dir(name, root), 'PREVIOUS'), current)
+    _write_atomic(os.path.join(model_dir(name, root), 'CURRENT'), version)
+
+def rollback(name, root=None):
+    """
+    Swaps CURRENT and PREVIOUS. Returns the version now serving.
+    """
+    previous = read_pointer(name, 'PREVIOUS', root)
+    if previous is None:
+        raise RegistryError(f"{name} has no previous version to roll back to")
+    activate(name, previous, root)
+    return previous
+
+def set_candidate(name, version, percent, root=None):
+    if not 0 < percent <= 100:
+        raise RegistryError("Shadow percent must be in (0, 100]")
+    _require_version(name, version, root)
+    _write_atomic(os.path.join(model_dir(name, root), 'CANDIDATE'), json.dumps({'version': version, 'percent': percent}))
+
+def clear_candidate(name, root=None):
+    try:
+        os.unlink(os.path.join(model_dir(name, root), 'CANDIDATE'))
+    except FileNotFoundError:
+        pass
+
+def prune(name, keep=KEEP_VERSIONS, root=None):
+    """
+    Deletes the oldest versions beyond `keep`, never one a pointer names.
+    """
+    pinned = {current_version(name, root), read_pointer(name, 'PREVIOUS', root)}
+    spec = candidate(name, root)
+    if spec:
+        pinned.add(spec[0])
+    versions = list_versions(name, root)
+    removed = []
+    for version in versions[:max(0, len(versions) - keep)]:
+        if version not in pinned:
+            shutil.rmtree(version_dir(name, version, root))
+            removed.append(version)
+    return removed
+
+def _claim_version(name, root=None):
+    """
+    A new version named after the current time (with a -NN suffix when
+    that second is taken), whose staging directory is created here so a
+    concurrent publish cannot claim the same name.
+    """
+    os.makedirs(os.path.join(model_dir(name, root), 'versions'), exist_ok=True)
+    stamp = time.strftime('%Y%m%d%H%M%S')
+    for n in itertools.count():
+        version = stamp if n == 0 else f"{stamp}-{n:02d}"
+        target = version_dir(name, version, root)
+        try:
+            os.mkdir(target + '.staging')
+        except FileExistsError:
+            continue
+        # Checked after the mkdir: a publish that renamed its staging
+        # directory away has already created the version
+        if os.path.exists(target):
+            os.rmdir(target + '.staging')
+            continue
+        return version
+
+def publish_price(src_dir, version=None, meta=None, activate_version=True, candidate_percent=None, root=None):
+    """
+    Copies the price artifacts in `src_dir` (train_model.py output) into a
+    new version with a price model bundle, then activates it or makes it
+    the shadow candidate. Returns the version.
+    """
+    from model_bundle import price_section, write_bundle
+
+    missing = [f for f in PRICE_ARTIFACTS if not os.path.exists(os.path.join(src_dir, f))]
+    if missing:
+        raise RegistryError(f"{src_dir} is missing {', '.join(missing)}")
+    if version and os.path.exists(version_dir('price', version, root)):
+        raise RegistryError(f"price version {version} already exists")
+
+    # Built next to the final directory and renamed into place, so pollers
+    # never see a half-copied version
+    if version:
+        staging = version_dir('price', version, root) + '.staging'
+        shutil.rmtree(staging, ignore_errors=True)
+        os.makedirs(staging)
+    else:
+        version = _claim_version('price', root)
+        staging = version_dir('price', version, root) + '.staging'
+    target = version_dir('price', version, root)
+    for name in PRICE_ARTIFACTS:
+        shutil.copy2(os.path.join(src_dir, name), staging)
+    arrays, bundle_meta = price_section(os.path.join(staging, 'price_prediction_model.joblib'),
+                                        os.path.join(staging, 'label_encoders.joblib'),
+                                        os.path.join(staging, 'feature_names.joblib'))
+    write_bundle(os.path.join(staging, BUNDLE_NAME), arrays, {'price': bundle_meta}, version)
+    with open(os.path.join(staging, 'meta.json'), 'w') as f:
+        json.dump({'version': version, 'published': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+                   **(meta or {})}, f, indent=2)
+    os.rename(staging, target)
+
+    if candidate_percent:
+        set_candidate('price', version, candidate_percent, root)
+    elif activate_version:
+        activate('price', version, root)
+    prune('price', root=root)
+    return version
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Manage published model versions")
+    parser.add_argument('--model', default='price')
+    parser.add_argument('--root', default=REGISTRY_DIR)
+    sub = parser.add_subparsers(dest='command', required=True)
+    sub.add_parser('list', help="Versions and pointers")
+    p_publish = sub.add_parser('publish', help="Publish train_model.py output (price only)")
+    p_publish.add_argument('src_dir')
+    p_publish.add_argument('--version')
+    p_publish.add_argument('--no-activate', action='store_true')
+    p_publish.add_argument('--candidate-percent', type=float, help="Shadow this share of traffic instead of activating")
+    p_activate = sub.add_parser('activate', help="Serve a published version")
+    p_activate.add_argument('version')
+    sub.add_parser('rollback', help="Swap CURRENT and PREVIOUS")
+    p_shadow = sub.add_parser('shadow', help="Mirror a share of traffic to a candidate version")
+    p_shadow.add_argument('version', nargs='?')
+    p_shadow.add_argument('--percent', type=float, default=10.0)
+    p_shadow.add_argument('--off', action='store_true')
+    args = parser.parse_args()
+
+    try:
+        if args.command == 'list':
+            spec = candidate(args.model, args.root)
+            pointers = {
+                'current': current_version(args.model, args.root),
+                'previous': read_pointer(args.model, 'PREVIOUS', args.root),
+                f"candidate({spec[1]:g}%)" if spec else 'candidate': spec[0] if spec else None,
+            }
+            for version in list_versions(args.model, args.root):
+                marks = [p for p, v in pointers.items() if v == version]
+                meta = read_meta(args.model, version, args.root)
+                extra = ', '.join(f"{k}={meta[k]}" for k in ('mae', 'rmse', 'rows') if k in meta)
+                print(f"{version}  {' '.join(marks):<18} {extra}")
+        elif args.command == 'publish':
+            if args.model != 'price':
+                raise RegistryError("Only the price model can be published")
+            version = publish_price(args.src_dir, args.version, activate_version=not args.no_activate,
+                                    candidate_percent=args.candidate_percent, root=args.root)
+            print(f"Published price version {version}")
+        elif args.command == 'activate':
+            activate(args.model, args.version, args.root)
+            print(f"{args.model} now serves {args.version}")
+        elif args.command == 'rollback':
+            print(f"{args.model} rolled back to {rollback(args.model, args.root)}")
+        elif args.off:
+            clear_candidate(args.model, args.root)
+            print(f"Shadow traffic for {args.model} stopped")
+        else:
+            if not args.version:
+                raise RegistryError("shadow needs a version (or --off)")
+            set_candidate(args.model, args.version, args.percent, args.root)
+            print(f"Shadowing {args.percent:g}% of {args.model} traffic to {args.version}")
+    except RegistryError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
@@ -1,43 +1,109 @@
 import sys
 import json
 import os
-import numpy as np
+import time
 import warnings
 warnings.filterwarnings("ignore")
 
-import joblib
-import pandas as pd
+from compiled_forest import compiled_path, load_model
+from carbon_features import CarbonFeatureLayout, parse_records, predict_batch, CATEGORICAL_INPUTS, NUMERIC_INPUTS
+from metrics import MODEL_LOAD_SECONDS, PREDICTION_ERRORS, PREDICTIONS, STAGE_SECONDS, render as render_metrics
+from model_bundle import DEFAULT_BUNDLE_PATH as BUNDLE_PATH, open_bundle, require_bundle
+from prediction_cache import PredictionCache
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 MODEL_PATH = os.path.join(BASE_DIR, 'carbon_emission_model.pkl')
 SCALER_PATH = os.path.join(BASE_DIR, 'feature_scaler.pkl')
 FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'feature_names.txt')
+SCALER_FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'scaler_feature_names.txt')
+# Written by prune_carbon.py
+PRUNED_MODEL_PATH = os.path.join(BASE_DIR, 'carbon_emission_model_pruned.npz')
+PRUNED_FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'feature_names_pruned.txt')
 
-def load_feature_names():
-    if not os.path.exists(FEATURE_NAMES_PATH):
-        raise FileNotFoundError("feature_names.txt not found.")
-    with open(FEATURE_NAMES_PATH, 'r') as f:
-        return [line.strip() for line in f.readlines()]
-
-def get_organic_score(material):
-    # This might still be needed for 'organic_material' feature in Scaler
-    if not material: return 0.0
-    material = str(material).lower()
-    organic_list = ['wood', 'cotton', 'jute', 'cane', 'bamboo', 'wool', 'silk', 'paper', 'leather', 'clay', 'canvas', 'palm leaf']
-    if any(x in material for x in organic_list):
-        return 1.0
-    return 0.0
-
-def get_handmade_score(prod_type):
-    # This might still be needed for 'handmade_level' feature in Scaler
-    if not prod_type: return 0.5
-    prod_type = str(prod_type).lower()
-    if 'handmade' in prod_type:
-        return 1.0
-    if 'machine' in prod_type:
-        return 0.0
-    return 0.5
+# 'full' or 'pruned' (the model without inputs that are constant at inference)
+MODEL_VARIANT = os.environ.get('CARBON_MODEL_VARIANT', 'full')
+# Bundle section and (model, feature names) files of each variant
+VARIANTS = {
+    'full': ('carbon', MODEL_PATH, FEATURE_NAMES_PATH),
+    'pruned': ('carbon_pruned', PRUNED_MODEL_PATH, PRUNED_FEATURE_NAMES_PATH),
+}
+
+# Artifacts are loaded once and reused by every predict() in this process
+_artifacts = None
+
+# Memoized single-row predictions (see prediction_cache.py)
+prediction_cache = PredictionCache.from_env(
+    artifact_paths=[BUNDLE_PATH, MODEL_PATH, compiled_path(MODEL_PATH), PRUNED_MODEL_PATH, SCALER_PATH, FEATURE_NAMES_PATH]
+)
+
+def _load(variant=None):
+    variant = variant or MODEL_VARIANT
+    if variant not in VARIANTS:
+        raise ValueError(f"Unknown CARBON_MODEL_VARIANT '{variant}' (expected one of {sorted(VARIANTS)})")
+    section, model_path, feature_names_path = VARIANTS[variant]
+
+    bundle = open_bundle(BUNDLE_PATH, section)
+    if bundle is not None:
+        # Memory-mapped bundle: no unpickling, no scaler object needed
+        return {'model': bundle.forest(section), 'scaler': None, 'layout': bundle.carbon_layout(section)}
+    require_bundle(BUNDLE_PATH, section)
+    if not os.path.exists(feature_names_path):
+        raise FileNotFoundError(f"{os.path.basename(feature_names_path)} not found.")
+    if variant == 'pruned' and not os.path.exists(model_path):
+        raise FileNotFoundError(f"{os.path.basename(model_path)} not found (run prune_carbon.py).")
+    import joblib
+    # Compiled carbon_emission_model.npz is used when present
+    model = load_model(model_path)
+    scaler = joblib.load(SCALER_PATH)
+    layout = CarbonFeatureLayout.from_files(feature_names_path, SCALER_FEATURE_NAMES_PATH, scaler)
+    return {'model': model, 'scaler': scaler, 'layout': layout}
+
+def load_artifacts():
+    """
+    Loads the model, scaler and the precompiled feature layout (once).
+    """
+    global _artifacts
+    if _artifacts is None:
+        start = time.perf_counter()
+        _artifacts = _load()
+        MODEL_LOAD_SECONDS.set(time.perf_counter() - start, 'carbon')
+    return _artifacts
+
+def artifacts_available():
+    if os.path.exists(BUNDLE_PATH):
+        return True
+    _, model_path, _ = VARIANTS.get(MODEL_VARIANT, VARIANTS['full'])
+    has_model = os.path.exists(model_path) or os.path.exists(compiled_path(model_path))
+    return has_model and os.path.exists(SCALER_PATH)
+
+def predict_one(data):
+    """
+    Returns the predicted carbon emission for one input dict.
+    """
+    key = prediction_cache.make_key(data, CATEGORICAL_INPUTS, NUMERIC_INPUTS)
+    hit, value = prediction_cache.get(key)
+    if hit:
+        return value
+
+    artifacts = load_artifacts()
+    # The layout applies the scaler while filling the row, so 'features'
+    # covers both feature building and scaling
+    with STAGE_SECONDS.time('carbon', 'features'):
+        X_final = artifacts['layout'].transform(data)
+    with STAGE_SECONDS.time('carbon', 'predict'):
+        value = float(artifacts['model'].predict(X_final)[0])
+    PREDICTIONS.inc('carbon')
+    prediction_cache.put(key, value)
+    return value
+
+def predict_many(records):
+    """
+    Returns one result dict per input record (in order), scoring all valid
+    records with a single vectorized model call.
+    """
+    artifacts = load_artifacts()
+    return predict_batch(artifacts['model'], artifacts['layout'], records)
 
 def predict():
     try:
@@ -47,133 +113,145 @@ def predict():
             print(json.dumps({"error": "No input data provided"}))
             return
 
-        data = json.loads(input_data)
+        # A single object, a JSON array or newline-delimited JSON
+        with STAGE_SECONDS.time('carbon', 'parse'):
+            records, is_batch = parse_records(input_data)
         
         # Load artifacts
-        if not os.path.exists(MODEL_PATH) or not os.path.exists(SCALER_PATH):
+        if not artifacts_available():
              print(json.dumps({"error": "Model or Scaler not found"}))
              return
 
-        model = joblib.load(MODEL_PATH)
-        scaler = joblib.load(SCALER_PATH)
-        model_feature_names = load_feature_names()
-
-        # Scaler expects these 17 features
-        scaler_feature_names = [
-            'product_weight_kg', 'handmade_level', 'material_quantity_kg', 
-            'recycled_material_percent', 'organic_material', 'production_time_hours', 
-            'units_per_batch', 'energy_used_kwh', 'renewable_energy_percent', 
-            'transport_distance_km', 'transport_load_kg', 'local_or_export', 
-            'packaging_weight_kg', 'recyclable_packaging', 'material_efficiency', 
-            'production_efficiency', 'total_recycled_material_kg'
-        ]
-
-        features = {}
-        
-        # --- 1. Inputs for SCALER (Numerical + Derived) ---
-        features['material_quantity_kg'] = float(data.get('material_quantity_kg', 0))
-        features['energy_used_kwh'] = float(data.get('energy_used_kwh', 0))
-        features['transport_distance_km'] = float(data.get('transport_distance_km', 0))
-        features['product_weight_kg'] = float(data.get('product_weight_kg', 0))
-        features['recycled_material_percent'] = float(data.get('recycled_material_percent', 0))
-        
-        # Derived for Scaler
-        features['organic_material'] = get_organic_score(data.get('primary_material', ''))
-        features['handmade_level'] = get_handmade_score(data.get('production_type', ''))
-        
-        try:
-            dist = float(features['transport_distance_km'])
-            features['local_or_export'] = 1.0 if dist > 1000 else 0.0
-        except:
-             features['local_or_export'] = 0.0
-        
-        # Defaults for Scaler
-        features['recyclable_packaging'] = 0.494
-        features['packaging_weight_kg'] = 0.5 
-        features['production_time_hours'] = 10.0
-        features['units_per_batch'] = 100.0
-        features['renewable_energy_percent'] = 20.0
-        features['transport_load_kg'] = 1000.0
-        
-        if features['material_quantity_kg'] > 0:
-            features['material_efficiency'] = features['product_weight_kg'] / features['material_quantity_kg']
-        else:
-            features['material_efficiency'] = 0.0
-            
-        if features['production_time_hours'] > 0:
-            features['production_efficiency'] = features['units_per_batch'] / features['production_time_hours']
-        else:
-            features['production_efficiency'] = 0.0
-            
-        features['total_recycled_material_kg'] = features['material_quantity_kg'] * (features['recycled_material_percent'] / 100.0)
-
-        # Create DataFrame for Scaler
-        df_scaler = pd.DataFrame([features])
-        df_scaler = df_scaler[scaler_feature_names] # Enforce order matching Scaler
-        
-        # Scale
-        X_scaled_all = scaler.transform(df_scaler) # Shape (1, 17)
-        X_scaled_14 = X_scaled_all[:, :14] # Keep first 14 if model logic omits last 3? 
-        # Wait, earlier debug showed model expects 1038 feats. 
-        # Scaler has 17. 
-        # User snippet showed many OHE columns.
-        
-        # --- 2. Inputs for MODEL (One-Hot Encoding) ---
-        # We need to constructing exactly the 1038 features the model expects.
-        # We start with the Scaled features (mapped by name if possible, or just first N columns)
-        # But wait - User snippet showed `product_weight_kg` scaled -1.9, etc.
-        # It implies the FINAL model input has:
-        # [Scaled Numerical Features] + [One-Hot Encoded Categorical Features] + [Product IDs?]
-        
-        # Let's map the scaled values to a dict first
-        scaled_values = dict(zip(scaler_feature_names, X_scaled_all[0]))
-        
-        final_input_dict = {name: 0.0 for name in model_feature_names}
-        
-        # A. Fill Numerical/Scaled Values (Match by name)
-        for name in scaler_feature_names:
-            if name in final_input_dict:
-                final_input_dict[name] = scaled_values[name]
-                
-        # B. Fill One-Hot Encoded 'primary_material'
-        # e.g., if primary_material='wood', look for 'primary_material_wood' in model_feature_names
-        p_mat = str(data.get('primary_material', '')).lower().strip()
-        if p_mat:
-            # Try exact match first
-            col_name = f"primary_material_{p_mat}"
-            if col_name in final_input_dict:
-                final_input_dict[col_name] = 1.0
-            else:
-                # Try partial? Or just ignore if unknown
-                pass
-
-        # C. Fill One-Hot Encoded 'production_type'
-        p_type = str(data.get('production_type', '')).lower().strip()
-        if p_type:
-            # User snippet: 'production_type_handmade'
-            # Input might be 'Handmade' -> 'production_type_handmade'
-            col_name = f"production_type_{p_type}"
-             # handle space to underscore just in case
-            col_name = col_name.replace(" ", "_")
-            if col_name in final_input_dict:
-                 final_input_dict[col_name] = 1.0
-        
-        # D. 'product_id' columns -> All 0 by default (Already set)
-        
-        # --- 3. Construct Final Vector ---
-        # Ensure exact order as model_feature_names
-        final_vector = [final_input_dict[name] for name in model_feature_names]
-        X_final = np.array([final_vector])
-        
-        # Predict
-        prediction = model.predict(X_final)
-        
-        print(json.dumps({"carbon_emission": prediction[0]}))
+        if not is_batch:
+            print(json.dumps({"carbon_emission": predict_one(records[0])}))
+            return
+
+        # Batch mode: one JSON line per input record, in input order
+        for result in predict_many(records):
+            sys.stdout.write(json.dumps(result) + "\n")
+        sys.stdout.flush()
 
     except Exception as e:
         import traceback
         error_msg = {"error": str(e), "trace": traceback.format_exc().splitlines()[-1]}
         print(json.dumps(error_msg))
 
+def handle_request(message):
+    """
+    Handles one worker request and returns (response, keep_running).
+
+    Requests look like {"id": 1, "data": {...}}, {"id": 2, "records": [...]}
+    or {"id": 3, "op": "ping" | "metrics" | "shutdown"}. A bare input object
+    without an "id" is scored as-is. The id is echoed back so pipelined responses can
+    be matched to their requests.
+    """
+    if not isinstance(message, dict):
+        return {"id": None, "error": "Request must be a JSON object"}, True
+
+    request_id = message.get('id')
+    op = message.get('op', 'predict')
+    try:
+        if op == 'shutdown':
+            return {"id": request_id, "status": "shutting_down"}, False
+        if op == 'ping':
+            return {"id": request_id, "status": "ok"}, True
+        if op == 'metrics':
+            # Prometheus text of this worker process
+            return {"id": request_id, "metrics": render_metrics()}, True
+        if op != 'predict':
+            return {"id": request_id, "error": f"Unknown op '{op}'"}, True
+
+        if 'records' in message:
+            return {"id": request_id, "results": predict_many(message['records'])}, True
+        data = message['data'] if 'data' in message else message
+        return {"id": request_id, "carbon_emission": predict_one(data)}, True
+    except Exception as e:
+        PREDICTION_ERRORS.inc('carbon')
+        return {"id": request_id, "error": str(e)}, True
+
+def handle_line(line):
+    try:
+        with STAGE_SECONDS.time('carbon', 'parse'):
+            message = json.loads(line)
+    except json.JSONDecodeError as e:
+        return {"id": None, "error": f"Invalid JSON: {e}"}, True
+    return handle_request(message)
+
+def serve_stdio():
+    """
+    Reads newline-delimited JSON requests from stdin until EOF or a
+    shutdown request, writing one JSON response per line.
+    """
+    for line in sys.stdin:
+        if not line.strip():
+            continue
+        response, keep_running = handle_line(line)
+        sys.stdout.write(json.dumps(response) + "\n")
+        sys.stdout.flush()
+        if not keep_running:
+            break
+
+def serve_socket(path):
+    """
+    Serves the same line protocol on a Unix domain socket, one thread per
+    connection. Stops on a shutdown request, SIGTERM or SIGINT.
+    """
+    import signal
+    import socketserver
+    import threading
+
+    class WorkerHandler(socketserver.StreamRequestHandler):
+        def handle(self):
+            for line in self.rfile:
+                if not line.strip():
+                    continue
+                response, keep_running = handle_line(line)
+                self.wfile.write((json.dumps(response) + "\n").encode())
+                self.wfile.flush()
+                if not keep_running:
+                    # shutdown() blocks until serve_forever returns, so it
+                    # cannot be called from a handler thread directly
+                    threading.Thread(target=server.shutdown).start()
+                    return
+
+    if os.path.exists(path):
+        os.unlink(path)
+    server = socketserver.ThreadingUnixStreamServer(path, WorkerHandler)
+    server.daemon_threads = True
+
+    def stop(signum, frame):
+        threading.Thread(target=server.shutdown).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+def serve(socket_path=None):
+    """
+    Persistent worker: loads the artifacts once, then answers requests.
+    """
+    load_artifacts()
+    print(f"predict_carbon worker ready (pid {os.getpid()})", file=sys.stderr, flush=True)
+    if socket_path:
+        serve_socket(socket_path)
+    else:
+        serve_stdio()
+
 if __name__ == "__main__":
-    predict()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Carbon emission prediction")
+    parser.add_argument('--serve', action='store_true',
+                        help="Run as a persistent worker reading JSON lines (stdin or --socket)")
+    parser.add_argument('--socket', help="Unix domain socket path for --serve")
+    args = parser.parse_args()
+
+    if args.serve:
+        serve(args.socket)
+    else:
+        predict()
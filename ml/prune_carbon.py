@@ -0,0 +1,292 @@
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+from carbon_features import load_names
+from compiled_forest import CompiledForest, FORMAT_VERSION
+
+# Feature-pruned carbon model. Of the model's 1037 inputs, the serving
+# feature layout only ever writes the scaled numeric block and the material /
+# production type one-hots: the product_id_* columns (1000 of them) and the
+# other categorical groups stay 0, and several scaled inputs are fixed
+# defaults. For those inputs every split in the forest always takes the same
+# branch, so it can be folded away:
+#
+#   python prune_carbon.py [--rows 10000] [--report prune_report.json]
+#
+# re-exports the forest with every split on an inference-constant feature
+# replaced by the branch that constant takes, drops the nodes that become
+# unreachable and renumbers the remaining features. For every input the
+# service can build, the pruned model returns exactly what the full model
+# returns; the report checks that and compares size, memory and latency.
+#
+# CARBON_MODEL_VARIANT=pruned serves it from predict_carbon and api/carbon
+# (model_bundle.py build packs it as the 'carbon_pruned' section).
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+PRUNED_MODEL_PATH = os.path.join(BASE_DIR, 'carbon_emission_model_pruned.npz')
+PRUNED_FEATURE_NAMES_PATH = os.path.join(BASE_DIR, 'feature_names_pruned.txt')
+REPORT_PATH = os.path.join(BASE_DIR, 'prune_report.json')
+
+def sample_records(layout, n_rows, seed=0):
+    """
+    Random carbon requests covering every material and production type the
+    layout knows, plus unknown and missing values.
+    """
+    rng = np.random.default_rng(seed)
+    materials = list(layout.material_columns) + ['jute', '']
+    production_types = list(layout.production_type_columns) + ['machine made', '']
+    return [{
+        'material_quantity_kg': float(rng.uniform(0.1, 8)),
+        'energy_used_kwh': float(rng.uniform(0.1, 12)),
+        'transport_distance_km': float(rng.uniform(1, 2000)),
+        'product_weight_kg': float(rng.uniform(0.1, 8)),
+        'recycled_material_percent': float(rng.uniform(0, 100)),
+        'primary_material': materials[i % len(materials)],
+        'production_type': production_types[rng.integers(len(production_types))],
+    } for i in range(n_rows)]
+
+def inference_constants(layout, records):
+    """
+    {column: value} for the model inputs that are the same for every
+    record, as the float32 the forest compares against.
+    """
+    X = layout.transform_many(records)[0].toarray().astype(np.float32)
+    constant = np.flatnonzero((X == X[0]).all(axis=0))
+    return {int(col): float(X[0, col]) for col in constant}
+
+def split_usage(forest):
+    """
+    Number of split nodes per feature.
+    """
+    is_split = forest.left != np.arange(len(forest.left))
+    return np.bincount(forest.feature[is_split], minlength=forest.n_features_in_)
+
+def prune_forest(forest, constants):
+    """
+    Folds splits on `constants` and drops unreachable nodes. Returns the
+    pruned forest arrays and the original indices of the features it keeps.
+    """
+    node_ids = np.arange(len(forest.left))
+    is_leaf = forest.left == node_ids
+
+    # Branch every constant split takes (float32 input <= float64 threshold)
+    fold_to = np.full(len(node_ids), -1, dtype=np.int64)
+    for col, value in constants.items():
+        nodes = np.flatnonzero((forest.feature == col) & ~is_leaf)
+        fold_to[nodes] = np.where(np.float32(value) <= forest.threshold[nodes], forest.left[nodes], forest.right[nodes])
+
+    def resolve(node):
+        while fold_to[node] >= 0:
+            node = fold_to[node]
+        return node
+
+    # Walk each tree from its (resolved) root, numbering kept nodes in order
+    old_ids, roots, depths = [], [], []
+    new_id = {}
+    for root in forest.roots:
+        stack = [(resolve(root), 0)]
+        roots.append(len(old_ids))
+        while stack:
+            node, depth = stack.pop()
+            new_id[node] = len(old_ids)
+            old_ids.append(node)
+            depths.append(depth)
+            if not is_leaf[node]:
+                stack.append((resolve(forest.right[node]), depth + 1))
+                stack.append((resolve(forest.left[node]), depth + 1))
+    old_ids = np.array(old_ids, dtype=np.int64)
+    kept_leaf = is_leaf[old_ids]
+
+    resolved = np.vectorize(resolve, otypes=[np.int64])
+    left = np.array([new_id[n] for n in resolved(forest.left[old_ids])], dtype=np.int32)
+    right = np.array([new_id[n] for n in resolved(forest.right[old_ids])], dtype=np.int32)
+    own = np.arange(len(old_ids), dtype=np.int32)
+    left = np.where(kept_leaf, own, left)
+    right = np.where(kept_leaf, own, right)
+
+    kept_features = np.unique(forest.feature[old_ids][~kept_leaf])
+    remap = np.zeros(forest.n_features_in_, dtype=np.int32)
+    remap[kept_features] = np.arange(len(kept_features))
+    feature = np.where(kept_leaf, 0, remap[forest.feature[old_ids]]).astype(np.int32)
+
+    arrays = {
+        'version': np.array(FORMAT_VERSION),
+        'feature': feature,
+        'threshold': forest.threshold[old_ids],
+        'left': left,
+        'right': right,
+        'value': forest.value[old_ids],
+        'missing_go_to_left': forest.missing_go_to_left[old_ids],
+        'roots': np.array(roots, dtype=np.int32),
+        'max_depth': np.array(max(depths)),
+        'n_features': np.array(len(kept_features)),
+        'average': np.array(forest.average),
+    }
+    return arrays, kept_features
+
+def forest_nbytes(forest):
+    return sum(a.nbytes for a in forest.to_arrays().values())
+
+def measure(model, layout, records, repeats=200):
+    """
+    Single-row latency (median of `repeats`, features + predict), batch
+    per-row latency and the peak memory of scoring the batch.
+    """
+    import tracemalloc
+
+    timings = []
+    for data in records[:repeats]:
+        start = time.perf_counter()
+        model.predict(layout.transform(data))
+        timings.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    start = time.perf_counter()
+    X = layout.transform_many(records)[0]
+    predictions = model.predict(X)
+    batch_seconds = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return predictions, {
+        'single_row_us': round(float(np.median(timings)) * 1e6, 1),
+        'batch_row_us': round(batch_seconds / len(records) * 1e6, 2),
+        'batch_peak_mb': round(peak / 1e6, 2),
+    }
+
+def evaluate(y_true, y_pred):
+    err = y_pred - y_true
+    ss_tot = float(np.sum((y_true - y_true.mean()) ** 2))
+    return {
+        'mae': round(float(np.mean(np.abs(err))), 4),
+        'rmse': round(float(np.sqrt(np.mean(err ** 2))), 4),
+        'r2': round(1 - float(np.sum(err ** 2)) / ss_tot, 4) if ss_tot else None,
+    }
+
+def labelled_accuracy(full, pruned, kept_features, feature_names, data_path, target):
+    """
+    Accuracy of both models against a labelled CSV in the model's input
+    columns (columns the CSV lacks are 0).
+    """
+    import pandas as pd
+
+    df = pd.read_csv(data_path)
+    X = df.reindex(columns=feature_names, fill_value=0).to_numpy(dtype=np.float32)
+    y = df[target].to_numpy(dtype=np.float64)
+    return {'full': evaluate(y, full.predict(X)), 'pruned': evaluate(y, pruned.predict(X[:, kept_features]))}
+
+def top_importances(n=15):
+    """
+    Largest impurity-based importances of the pickled sklearn model, when it
+    can be loaded.
+    """
+    import predict_carbon
+
+    try:
+        import joblib
+        model = joblib.load(predict_carbon.MODEL_PATH)
+    except Exception as e:
+        print(f"feature_importances_ unavailable ({e}); reporting split usage only")
+        return None
+    names = load_names(predict_carbon.FEATURE_NAMES_PATH)
+    order = np.argsort(-model.feature_importances_)[:n]
+    return {names[i]: round(float(model.feature_importances_[i]), 5) for i in order}
+
+def main(args):
+    import predict_carbon
+
+    full = predict_carbon._load('full')
+    model, layout = full['model'], full['layout']
+    if not isinstance(model, CompiledForest):
+        model = CompiledForest.from_model(model)
+    names = layout.feature_names
+
+    constants = inference_constants(layout, sample_records(layout, args.rows, seed=0))
+    arrays, kept = prune_forest(model, constants)
+    pruned_names = [names[i] for i in kept]
+
+    np.savez(args.out, **arrays)
+    with open(args.feature_names_out, 'w') as f:
+        f.write('\n'.join(pruned_names) + '\n')
+    print(f"Wrote {args.out} and {args.feature_names_out}")
+
+    pruned = CompiledForest.load(args.out)
+    pruned_layout = type(layout)(pruned_names, layout.scaler_feature_names, layout.mean, layout.scale)
+
+    # Fresh records, not the ones the constants were derived from
+    records = sample_records(layout, args.rows, seed=1)
+    full_pred, full_perf = measure(model, layout, records)
+    pruned_pred, pruned_perf = measure(pruned, pruned_layout, records)
+    mismatches = int(np.sum(full_pred != pruned_pred))
+
+    usage = split_usage(model)
+    group_of = lambda name: name.split('_P')[0] if name.startswith('product_id_') else name
+    constant_splits = {}
+    for col in constants:
+        if usage[col]:
+            group = group_of(names[col])
+            constant_splits[group] = constant_splits.get(group, 0) + int(usage[col])
+
+    report = {
+        'features': {
+            'full': len(names),
+            'pruned': len(pruned_names),
+            'kept': pruned_names,
+            'constant_at_inference': len(constants),
+        },
+        'splits': {
+            'full': int(usage.sum()),
+            'pruned': int(split_usage(pruned).sum()),
+            'folded_by_feature': dict(sorted(constant_splits.items(), key=lambda kv: -kv[1])),
+        },
+        'feature_importances': top_importances() if args.importances else None,
+        'accuracy': {
+            'rows': len(records),
+            'mismatches_vs_full': mismatches,
+            'max_abs_diff': float(np.max(np.abs(full_pred - pruned_pred))),
+        },
+        'size': {
+            'full_nodes': len(model.value),
+            'pruned_nodes': len(pruned.value),
+            'full_forest_mb': round(forest_nbytes(model) / 1e6, 2),
+            'pruned_forest_mb': round(forest_nbytes(pruned) / 1e6, 2),
+            'pruned_file_mb': round(os.path.getsize(args.out) / 1e6, 2),
+            'full_row_bytes': len(names) * 4,
+            'pruned_row_bytes': len(pruned_names) * 4,
+        },
+        'latency': {'full': full_perf, 'pruned': pruned_perf},
+    }
+    if args.data:
+        report['accuracy']['labelled'] = labelled_accuracy(model, pruned, kept, names, args.data, args.target)
+
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+
+    size = report['size']
+    print(f"Features: {len(names)} -> {len(pruned_names)} ({len(constants)} constant at inference)")
+    print(f"Splits:   {report['splits']['full']} -> {report['splits']['pruned']}; "
+          f"nodes {size['full_nodes']} -> {size['pruned_nodes']}")
+    print(f"Forest:   {size['full_forest_mb']} MB -> {size['pruned_forest_mb']} MB; "
+          f"dense row {size['full_row_bytes']} B -> {size['pruned_row_bytes']} B")
+    for key, label in (('single_row_us', 'single row us'), ('batch_row_us', 'batch us/row'), ('batch_peak_mb', 'batch peak MB')):
+        print(f"{label:<14} {full_perf[key]:>10} -> {pruned_perf[key]}")
+    print(f"Accuracy: {mismatches} mismatches over {len(records)} rows (max abs diff {report['accuracy']['max_abs_diff']})")
+    print(f"Report written to {args.report}")
+    return 0 if mismatches == 0 else 1
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Export a carbon model pruned to the features inference can vary")
+    parser.add_argument('--out', default=PRUNED_MODEL_PATH)
+    parser.add_argument('--feature-names-out', default=PRUNED_FEATURE_NAMES_PATH)
+    parser.add_argument('--report', default=REPORT_PATH)
+    parser.add_argument('--rows', type=int, default=10000, help="Sample requests for the constant analysis and the comparison")
+    parser.add_argument('--importances', action='store_true', help="Include sklearn feature_importances_ (unpickles the model)")
+    parser.add_argument('--data', help="Labelled CSV in the model's input columns, for an accuracy comparison")
+    parser.add_argument('--target', default='carbon_emission', help="Label column of --data")
+    args = parser.parse_args()
+    sys.exit(main(args))
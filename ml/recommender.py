@@ -0,0 +1,364 @@
+import csv
+import json
+import os
+import re
+import sys
+import threading
+import zlib
+
+import numpy as np
+
+from file_lock import locked
+
+# Content-based product recommendations. Every product becomes one float32
+# vector made of
+#   - hashed description/keyword tokens (HASH_DIM buckets)
+#   - one-hot Material, Category and Region (with spare slots per field)
+#   - standardized log size (L, W, H) and weight
+# Each block is L2-normalized and weighted, and the whole vector is
+# normalized, so cosine similarity is a single matrix-vector product.
+#
+#   python recommender.py build [--data CSV|JSON|JSONL] [--out INDEX]
+#   python recommender.py add products.jsonl [--index INDEX]
+#   python recommender.py query --product-id 42 [-k 5]
+#
+# Products can be added to a built index without a rebuild: new labels take
+# a spare one-hot slot and the numeric statistics stay those of the build.
+# add_and_save reloads the saved index under a file lock before adding, so
+# concurrent writers (gunicorn workers, the CLI) never drop each other's
+# products.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_PATH = os.path.join(BASE_DIR, 'data', 'artisan_dataset_10000_final.csv')
+INDEX_PATH = os.environ.get('RECOMMENDER_INDEX_PATH', os.path.join(BASE_DIR, 'models', 'recommender_index.npz'))
+
+INDEX_VERSION = 1
+HASH_DIM = 64
+CATEGORICAL_FIELDS = ['material', 'category', 'region']
+NUMERIC_FIELDS = ['size_l', 'size_w', 'size_h', 'weight_g']
+# Relative importance of each block in the similarity
+BLOCK_WEIGHTS = {'tokens': 1.0, 'material': 1.0, 'category': 1.0, 'region': 0.5, 'numeric': 0.5}
+# One-hot slots kept free for labels first seen after the build
+MIN_SPARE_SLOTS = 16
+# Rows scored per matrix product; bounds the temporary score arrays
+QUERY_CHUNK_ROWS = 262144
+
+TOKEN_RE = re.compile(r"[a-z0-9][a-z0-9\-]*")
+
+def tokenize(text):
+    return TOKEN_RE.findall(str(text or '').lower())
+
+def token_bucket(token):
+    # crc32 rather than hash(): stable across processes and restarts
+    return zlib.crc32(token.encode('utf-8')) % HASH_DIM
+
+def parse_dimensions(value):
+    parts = str(value or '').lower().split('x')
+    try:
+        if len(parts) == 3:
+            return [float(p) for p in parts]
+    except ValueError:
+        pass
+    return [0.0, 0.0, 0.0]
+
+def parse_number(value, field):
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid {field} {value!r}") from None
+    if not np.isfinite(number):
+        raise ValueError(f"Invalid {field} {value!r}")
+    return number
+
+def product_record(row, default_id=None):
+    """
+    Normalizes a training CSV row or an exported Product document
+    (server/models/Product.js) into the fields the index uses. Raises
+    ValueError for a weight or price that is not a number.
+    """
+    get = lambda *keys: next((row[k] for k in keys if row.get(k) not in (None, '')), None)
+    dims = parse_dimensions(get('Size(cm)', 'size_cm', 'dimensions'))
+    weight = parse_number(get('Weight(g)', 'weight_g') or 0, 'weight')
+    product_id = get('_id', 'id', 'product_id')
+    price = get('Price(INR)', 'price')
+    return {
+        'id': str(product_id if product_id is not None else default_id),
+        'name': get('Product_Name', 'name', 'product_name') or '',
+        'description': get('Description_Keywords', 'description', 'description_keywords') or '',
+        'material': get('Material', 'material') or '',
+        'category': get('Category', 'category') or '',
+        'region': get('Region', 'region') or '',
+        'price': parse_number(price, 'price') if price is not None else None,
+        'size_l': dims[0], 'size_w': dims[1], 'size_h': dims[2],
+        'weight_g': weight,
+    }
+
+def read_products(path, require_ids=False):
+    """
+    Products from the training CSV, a JSON array or JSON lines. Rows
+    without an id get their row number, unless require_ids is set
+    (adding to an index, where row numbers would replace its products).
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            rows = list(csv.DictReader(f))
+    else:
+        with open(path, encoding='utf-8') as f:
+            text = f.read().strip()
+        rows = json.loads(text) if text.startswith('[') else [json.loads(line) for line in text.splitlines() if line.strip()]
+    products = []
+    for i, row in enumerate(rows):
+        if require_ids and all(row.get(k) in (None, '') for k in ('_id', 'id', 'product_id')):
+            raise ValueError(f"{path}: product {i} has no '_id'")
+        try:
+            products.append(product_record(row, i))
+        except ValueError as e:
+            raise ValueError(f"{path}: product {i}: {e}") from None
+    return products
+
+def _normalize_label(value):
+    return str(value or '').strip().lower()
+
+class ProductIndex:
+    """
+    Growable float32 matrix of product vectors with exact cosine top-k.
+    """
+
+    def __init__(self, vocabularies, slots, numeric_mean, numeric_std):
+        # vocabularies: {field: {label: slot}}, slots: {field: block width}
+        self.vocabularies = vocabularies
+        self.slots = slots
+        self.numeric_mean = np.asarray(numeric_mean, dtype=np.float32)
+        self.numeric_std = np.asarray(numeric_std, dtype=np.float32)
+
+        self.offsets = {'tokens': 0}
+        dim = HASH_DIM
+        for field in CATEGORICAL_FIELDS:
+            self.offsets[field] = dim
+            dim += slots[field]
+        self.offsets['numeric'] = dim
+        self.dim = dim + len(NUMERIC_FIELDS)
+
+        self._vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.size = 0
+        self.products = []
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def build(cls, products):
+        vocabularies, slots = {}, {}
+        for field in CATEGORICAL_FIELDS:
+            labels = sorted({_normalize_label(p[field]) for p in products} - {''})
+            vocabularies[field] = {label: i for i, label in enumerate(labels)}
+            slots[field] = len(labels) + max(MIN_SPARE_SLOTS, len(labels))
+        # Clipped at 0 as in vectorize, so a negative weight can't make the log NaN
+        numeric = np.array([[p[f] for f in NUMERIC_FIELDS] for p in products], dtype=np.float64).reshape(-1, len(NUMERIC_FIELDS))
+        numeric = np.log1p(np.maximum(numeric, 0))
+        mean = numeric.mean(axis=0) if len(products) else np.zeros(len(NUMERIC_FIELDS))
+        std = numeric.std(axis=0) if len(products) else np.ones(len(NUMERIC_FIELDS))
+        index = cls(vocabularies, slots, mean, np.where(std > 0, std, 1.0))
+        index.add(products)
+        return index
+
+    def _slot(self, field, value):
+        label = _normalize_label(value)
+        if not label:
+            return None
+        vocab = self.vocabularies[field]
+        slot = vocab.get(label)
+        if slot is None:
+            # New label: next spare slot, or share one once the block is full
+            slot = len(vocab) if len(vocab) < self.slots[field] else zlib.crc32(label.encode('utf-8')) % self.slots[field]
+            vocab[label] = slot
+        return slot
+
+    def vectorize(self, products, register_labels=True):
+        """
+        (n, dim) float32 vectors. Query vectors pass register_labels=False
+        so unknown labels don't take slots.
+        """
+        X = np.zeros((len(products), self.dim), dtype=np.float32)
+        for i, p in enumerate(products):
+            for token in tokenize(p.get('description')) + tokenize(p.get('name')):
+                X[i, token_bucket(token)] += 1.0
+            for field in CATEGORICAL_FIELDS:
+                if register_labels:
+                    slot = self._slot(field, p.get(field))
+                else:
+                    slot = self.vocabularies[field].get(_normalize_label(p.get(field)))
+                if slot is not None:
+                    X[i, self.offsets[field] + slot] = 1.0
+        numeric = np.array([[p.get(f) or 0.0 for f in NUMERIC_FIELDS] for p in products], dtype=np.float32).reshape(-1, len(NUMERIC_FIELDS))
+        start = self.offsets['numeric']
+        X[:, start:] = (np.log1p(np.maximum(numeric, 0)) - self.numeric_mean) / self.numeric_std
+
+        # Normalize and weight each block, then the whole vector
+        blocks = [('tokens', 0, HASH_DIM)]
+        blocks += [(f, self.offsets[f], self.offsets[f] + self.slots[f]) for f in CATEGORICAL_FIELDS]
+        blocks += [('numeric', start, self.dim)]
+        for name, lo, hi in blocks:
+            norms = np.linalg.norm(X[:, lo:hi], axis=1, keepdims=True)
+            X[:, lo:hi] *= np.sqrt(BLOCK_WEIGHTS[name]) / np.where(norms > 0, norms, 1.0)
+        norms = np.linalg.norm(X, axis=1, keepdims=True)
+        X /= np.where(norms > 0, norms, 1.0)
+        return X
+
+    def add(self, products):
+        """
+        Appends products (normalized with product_record); amortized O(1)
+        per product. Re-adding an existing id replaces its vector.
+        """
+        with self._lock:
+            X = self.vectorize(products)
+            for p, vector in zip(products, X):
+                pos = self._positions.get(p['id'])
+                if pos is None:
+                    if self.size == len(self._vectors):
+                        grown = np.zeros((max(1024, 2 * len(self._vectors)), self.dim), dtype=np.float32)
+                        grown[:self.size] = self._vectors[:self.size]
+                        self._vectors = grown
+                    pos = self.size
+                    self._positions[p['id']] = pos
+                    self.products.append(p)
+                    self.size += 1
+                else:
+                    self.products[pos] = p
+                self._vectors[pos] = vector
+
+    def get(self, product_id):
+        pos = self._positions.get(str(product_id))
+        return None if pos is None else self.products[pos]
+
+    def query(self, product, k=5, exclude_ids=()):
+        """
+        Top-k (product, score) pairs by cosine similarity to `product`.
+        """
+        # Snapshot: rows appended concurrently are simply not scored yet
+        size, vectors = self.size, self._vectors
+        if size == 0 or k <= 0:
+            return []
+        q = self.vectorize([product], register_labels=False)[0]
+        exclude = {self._positions[str(i)] for i in exclude_ids if str(i) in self._positions}
+        want = k + len(exclude)
+
+        best_idx, best_scores = [], []
+        for lo in range(0, size, QUERY_CHUNK_ROWS):
+            scores = vectors[lo:min(size, lo + QUERY_CHUNK_ROWS)] @ q
+            top = np.argpartition(-scores, want - 1)[:want] if len(scores) > want else np.arange(len(scores))
+            best_idx.append(top + lo)
+            best_scores.append(scores[top])
+        idx = np.concatenate(best_idx)
+        scores = np.concatenate(best_scores)
+        order = np.argsort(-scores, kind='stable')
+        results = []
+        for j in order:
+            if idx[j] in exclude:
+                continue
+            results.append((self.products[idx[j]], float(scores[j])))
+            if len(results) == k:
+                break
+        return results
+
+    def save(self, path=INDEX_PATH):
+        with self._lock:
+            meta = {
+                'version': INDEX_VERSION,
+                'hash_dim': HASH_DIM,
+                'vocabularies': self.vocabularies,
+                'slots': self.slots,
+                'products': self.products,
+            }
+            tmp_path = path + '.tmp.npz'
+            np.savez(tmp_path, vectors=self._vectors[:self.size], numeric_mean=self.numeric_mean,
+                     numeric_std=self.numeric_std, meta=np.array(json.dumps(meta)))
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=INDEX_PATH):
+        with np.load(path) as data:
+            meta = json.loads(str(data['meta']))
+            if meta['version'] != INDEX_VERSION or meta['hash_dim'] != HASH_DIM:
+                raise ValueError(f"{path} was built by an incompatible recommender version")
+            index = cls(meta['vocabularies'], meta['slots'], data['numeric_mean'], data['numeric_std'])
+            vectors = data['vectors']
+        index._vectors = np.array(vectors, dtype=np.float32)
+        index.size = len(vectors)
+        index.products = meta['products']
+        index._positions = {p['id']: i for i, p in enumerate(index.products)}
+        return index
+
+def load_or_build(path=INDEX_PATH, data_path=DATA_PATH):
+    """
+    The saved index when there is one, else a fresh build from `data_path`
+    (not saved; run `python recommender.py build` to persist it).
+    """
+    if os.path.exists(path):
+        return ProductIndex.load(path)
+    return ProductIndex.build(read_products(data_path))
+
+def add_and_save(products, path=INDEX_PATH, data_path=DATA_PATH):
+    """
+    Adds products to the index saved at `path` and saves it. The saved
+    index is reloaded under a file lock first, so products another process
+    added meanwhile are kept. Returns the updated index.
+    """
+    with locked(path + '.lock'):
+        index = load_or_build(path, data_path)
+        index.add(products)
+        index.save(path)
+    return index
+
+def format_results(results):
+    return [{
+        'id': p['id'],
+        'name': p['name'],
+        'material': p['material'],
+        'category': p['category'],
+        'region': p['region'],
+        'price': p['price'],
+        'score': round(score, 4),
+    } for p, score in results]
+
+if __name__ == "__main__":
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(description="Build, extend or query the product recommendation index")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_build = sub.add_parser('build', help="Build the index from a catalogue")
+    p_build.add_argument('--data', default=DATA_PATH, help="Training CSV or exported products (JSON/JSONL)")
+    p_build.add_argument('--out', default=INDEX_PATH)
+    p_add = sub.add_parser('add', help="Insert products into an existing index")
+    p_add.add_argument('products', help="Products as JSON or JSONL")
+    p_add.add_argument('--index', default=INDEX_PATH)
+    p_query = sub.add_parser('query', help="Products similar to one in the index")
+    p_query.add_argument('--product-id', required=True)
+    p_query.add_argument('-k', type=int, default=5)
+    p_query.add_argument('--index', default=INDEX_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'build':
+        start = time.perf_counter()
+        index = ProductIndex.build(read_products(args.data))
+        with locked(args.out + '.lock'):
+            index.save(args.out)
+        print(f"Indexed {index.size} products ({index.dim} dims) in {time.perf_counter() - start:.2f}s -> {args.out}")
+    elif args.command == 'add':
+        if not os.path.exists(args.index):
+            print(f"Error: {args.index} not found; run build first")
+            sys.exit(1)
+        try:
+            products = read_products(args.products, require_ids=True)
+        except ValueError as e:
+            print(f"Error: {e}")
+            sys.exit(1)
+        index = add_and_save(products, args.index)
+        print(f"Added or updated {len(products)} products ({index.size} total) in {args.index}")
+    else:
+        index = load_or_build(args.index)
+        product = index.get(args.product_id)
+        if product is None:
+            print(f"Unknown product id {args.product_id}")
+            sys.exit(1)
+        print(json.dumps(format_results(index.query(product, args.k, exclude_ids=[args.product_id])), indent=2))
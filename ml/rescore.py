@@ -0,0 +1,279 @@
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from carbon_features import CATEGORICAL_INPUTS, NUMERIC_INPUTS
+
+# Catalogue-wide re-scoring after a model change: fresh carbonFootprint and
+# suggested price for every product in an export.
+#
+#   python rescore.py products.jsonl --out scores.jsonl [--workers 4] [--chunk-rows 2000]
+#   python rescore.py data/artisan_dataset_10000_final.csv --out scores.jsonl --models price
+#
+# Products (Product documents as JSON lines, or the training CSV) are read
+# as a stream and scored CHUNK_ROWS at a time on a process pool; every
+# worker loads the models once. Output is one JSON line per product, in
+# input order:
+#
+#   {"id": "...", "carbonFootprint": 4.21, "suggestedPrice": 1830.5}
+#
+# After each chunk is written, <out>.checkpoint records how many chunks and
+# output bytes are complete. Re-running the same command after an
+# interruption truncates anything written past the checkpoint and carries
+# on from the next chunk.
+
+CHUNK_ROWS = 2000
+CHECKPOINT_VERSION = 1
+MODELS = ['carbon', 'price']
+# Products without carbon inputs are assumed handmade (the marketplace default)
+DEFAULT_PRODUCTION_TYPE = 'handmade'
+
+def object_id(value):
+    # Plain ids or mongoexport's {"$oid": "..."}
+    if isinstance(value, dict):
+        value = value.get('$oid')
+    return None if value is None else str(value)
+
+class InvalidRecord:
+    """
+    Stands in for a JSON line that could not be parsed, so it is reported
+    as that row's error instead of stopping the job.
+    """
+
+    def __init__(self, message):
+        self.message = message
+
+def read_products(path):
+    """
+    Yields raw product dicts from a CSV or JSON lines file (an
+    InvalidRecord for each malformed line).
+    """
+    if path.endswith('.csv'):
+        with open(path, newline='', encoding='utf-8') as f:
+            yield from csv.DictReader(f)
+        return
+    with open(path, 'rb') as f:
+        for line in f:
+            if line.strip():
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    # JSONDecodeError and UnicodeDecodeError alike
+                    yield InvalidRecord(f"Malformed JSON: {e}")
+
+def read_chunks(path, chunk_rows, skip_chunks=0):
+    """
+    Yields (chunk_index, first_row_number, rows), starting at `skip_chunks`.
+    """
+    chunk, index, row_number = [], 0, 0
+    for row in read_products(path):
+        row_number += 1
+        if index < skip_chunks:
+            if row_number % chunk_rows == 0:
+                index += 1
+            continue
+        chunk.append(row)
+        if len(chunk) == chunk_rows:
+            yield index, row_number - chunk_rows, chunk
+            chunk, index = [], index + 1
+    if chunk:
+        yield index, row_number - len(chunk), chunk
+
+def model_inputs(raw):
+    """
+    (price input, carbon input) for a CSV row or a Product document.
+    """
+    from recommender import product_record
+
+    product = product_record(raw)
+    price = {
+        'product_name': product['name'],
+        'material': product['material'],
+        'category': product['category'],
+        'region': product['region'],
+        'size_cm': f"{product['size_l']:g}x{product['size_w']:g}x{product['size_h']:g}",
+        'weight_g': product['weight_g'],
+    }
+
+    given = raw.get('carbonInputs') if isinstance(raw.get('carbonInputs'), dict) else raw
+    if any(k in given for k in NUMERIC_INPUTS):
+        carbon = {k: given[k] for k in NUMERIC_INPUTS + CATEGORICAL_INPUTS if k in given}
+        carbon.setdefault('primary_material', product['material'].lower())
+    else:
+        # Estimated from weight and size like data_generator.carbon_payloads;
+        # transport and recycled share are unknown and left at 0
+        weight_kg = product['weight_g'] / 1000
+        volume_l = product['size_l'] * product['size_w'] * product['size_h'] / 1000
+        carbon = {
+            'material_quantity_kg': round(weight_kg * 1.15, 3),
+            'energy_used_kwh': round(0.5 + volume_l * 0.05, 3),
+            'product_weight_kg': round(weight_kg, 3),
+            'primary_material': product['material'].lower(),
+            'production_type': raw.get('production_type', DEFAULT_PRODUCTION_TYPE),
+        }
+    return price, carbon
+
+# Per-process model state, set by init_worker
+_models = ()
+
+def init_worker(models):
+    global _models
+    _models = tuple(models)
+    if 'carbon' in _models:
+        import predict_carbon
+        predict_carbon.load_artifacts()
+    if 'price' in _models:
+        import custom_price_model
+        if custom_price_model.model is None:
+            raise RuntimeError("Price model artifacts could not be loaded")
+
+def score_chunk(index, first_row, rows):
+    """
+    Scores one chunk; returns (index, output lines, error count).
+    """
+    results, valid, price_inputs, carbon_inputs = [], [], [], []
+    for i, raw in enumerate(rows):
+        # Rows without an id are named by their position in the input
+        result = {'id': str(first_row + i)}
+        results.append(result)
+        if isinstance(raw, InvalidRecord):
+            result['error'] = raw.message
+            continue
+        if not isinstance(raw, dict):
+            result['error'] = f"Expected a JSON object, got {type(raw).__name__}"
+            continue
+        try:
+            result['id'] = object_id(raw.get('_id', raw.get('id'))) or result['id']
+            price, carbon = model_inputs(raw)
+        except (TypeError, ValueError, AttributeError) as e:
+            result['error'] = f"Invalid product: {e}"
+            continue
+        valid.append(i)
+        price_inputs.append(price)
+        carbon_inputs.append(carbon)
+
+    if 'carbon' in _models and valid:
+        import predict_carbon
+        for i, result in zip(valid, predict_carbon.predict_many(carbon_inputs)):
+            if 'error' in result:
+                results[i]['carbonError'] = result['error']
+            else:
+                results[i]['carbonFootprint'] = round(result['carbon_emission'], 4)
+    if 'price' in _models and valid:
+        import custom_price_model
+        prices, errors = custom_price_model.predict_many(price_inputs, return_errors=True, use_cache=False)
+        for pos, i in enumerate(valid):
+            if pos in errors:
+                results[i]['priceError'] = errors[pos]
+            else:
+                results[i]['suggestedPrice'] = round(float(prices[pos]), 2)
+
+    errors = sum(1 for r in results if any(k in r for k in ('error', 'carbonError', 'priceError')))
+    return index, [json.dumps(r) + "\n" for r in results], errors
+
+def input_signature(path):
+    st = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': st.st_size, 'mtime_ns': st.st_mtime_ns}
+
+def load_checkpoint(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def save_checkpoint(path, state):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(tmp_path, path)
+
+def rescore(input_path, out_path, models=MODELS, workers=None, chunk_rows=CHUNK_ROWS, restart=False):
+    checkpoint_path = out_path + '.checkpoint'
+    signature = input_signature(input_path)
+    state = None if restart else load_checkpoint(checkpoint_path)
+    if state is not None:
+        expected = {'version': CHECKPOINT_VERSION, 'input': signature, 'models': list(models), 'chunk_rows': chunk_rows}
+        if {k: state.get(k) for k in expected} != expected:
+            print(f"Error: {checkpoint_path} belongs to a different input, model set or chunk size; use --restart")
+            return 1
+        if state.get('complete'):
+            print(f"{out_path} is already complete ({state['rows']} rows); use --restart to score again")
+            return 0
+        print(f"Resuming after chunk {state['chunks'] - 1} ({state['rows']} rows done)")
+    else:
+        state = {'version': CHECKPOINT_VERSION, 'input': signature, 'models': list(models),
+                 'chunk_rows': chunk_rows, 'chunks': 0, 'rows': 0, 'errors': 0, 'out_bytes': 0}
+
+    if state['chunks'] and not os.path.exists(out_path):
+        print(f"Error: {checkpoint_path} exists but {out_path} does not; use --restart")
+        return 1
+    workers = workers or os.cpu_count() or 1
+    out = open(out_path, 'r+b' if state['chunks'] else 'wb')
+    # Anything past the checkpoint is from a chunk that was never recorded
+    out.truncate(state['out_bytes'])
+    out.seek(state['out_bytes'])
+
+    start = time.perf_counter()
+    rows_this_run = 0
+    done = {}
+    chunks = read_chunks(input_path, chunk_rows, state['chunks'])
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(models,)) as pool:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a couple of chunks per worker in flight
+                while not exhausted and len(pending) < 2 * workers:
+                    chunk = next(chunks, None)
+                    if chunk is None:
+                        exhausted = True
+                    else:
+                        pending.add(pool.submit(score_chunk, *chunk))
+                if not pending:
+                    break
+                finished, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    index, lines, errors = future.result()
+                    done[index] = (lines, errors)
+
+                # Written strictly in input order, then checkpointed
+                while state['chunks'] in done:
+                    lines, errors = done.pop(state['chunks'])
+                    out.write(''.join(lines).encode('utf-8'))
+                    out.flush()
+                    os.fsync(out.fileno())
+                    state['chunks'] += 1
+                    state['rows'] += len(lines)
+                    state['errors'] += errors
+                    state['out_bytes'] = out.tell()
+                    save_checkpoint(checkpoint_path, state)
+                    rows_this_run += len(lines)
+
+                elapsed = time.perf_counter() - start
+                print(f"  {state['rows']:,} rows scored ({rows_this_run / elapsed:,.0f} rows/s, {state['errors']} with errors)")
+    finally:
+        out.close()
+
+    state['complete'] = True
+    save_checkpoint(checkpoint_path, state)
+    elapsed = time.perf_counter() - start
+    print(f"Scored {rows_this_run:,} rows in {elapsed:.1f}s ({rows_this_run / max(elapsed, 1e-9):,.0f} rows/s, "
+          f"{workers} workers); {state['rows']:,} rows in {out_path}")
+    return 0
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Re-score a product catalogue with the carbon and price models")
+    parser.add_argument('input', help="Products as JSON lines or CSV")
+    parser.add_argument('--out', required=True, help="Output JSON lines file")
+    parser.add_argument('--models', nargs='+', choices=MODELS, default=MODELS)
+    parser.add_argument('--workers', type=int, help="Scoring processes (default: one per core)")
+    parser.add_argument('--chunk-rows', type=int, default=CHUNK_ROWS)
+    parser.add_argument('--restart', action='store_true', help="Ignore an existing checkpoint and start over")
+    args = parser.parse_args()
+    sys.exit(rescore(args.input, args.out, args.models, args.workers, args.chunk_rows, args.restart))
@@ -0,0 +1,20 @@
+import filecmp
+import os
+
+# api/carbon.py deploys without the rest of the project, so the ml/ modules
+# it imports are copied into api/ml/. They must match their originals.
+#
+#   python test_api_copies.py
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_ML_DIR = os.path.join(os.path.dirname(BASE_DIR), 'api', 'ml')
+COPIED_MODULES = ['carbon_features', 'compiled_forest', 'metrics', 'model_bundle', 'prediction_cache', 'profiling']
+
+def test_api_copies_match():
+    stale = [name for name in COPIED_MODULES
+             if not filecmp.cmp(os.path.join(BASE_DIR, f"{name}.py"), os.path.join(API_ML_DIR, f"{name}.py"), shallow=False)]
+    assert not stale, f"api/ml/ copies differ from ml/: {', '.join(stale)}"
+    print("api/ml module copies: OK")
+
+if __name__ == "__main__":
+    test_api_copies_match()
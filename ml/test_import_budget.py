@@ -0,0 +1,125 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from carbon_features import load_names
+from model_bundle import write_bundle
+
+# Import-time budget for inference-only startup (ML_INFERENCE_ONLY=1 with a
+# model bundle). Runs a fresh interpreter under `python -X importtime`,
+# loads both models and predicts once, then fails if any forbidden module
+# was imported or the imports took longer than the budget.
+#
+#   python test_import_budget.py [--budget-ms 1000]
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+API_DIR = os.path.join(os.path.dirname(BASE_DIR), 'api')
+
+FORBIDDEN_MODULES = ['pandas', 'sklearn', 'joblib']
+DEFAULT_BUDGET_MS = float(os.environ.get('IMPORT_BUDGET_MS', 1000))
+
+STARTUP_SCRIPT = f"""
+import sys
+sys.path.insert(0, {API_DIR!r})
+import carbon
+import custom_price_model
+import predict_carbon
+assert custom_price_model.model is not None
+predict_carbon.predict_one({{'material_quantity_kg': 1.8, 'energy_used_kwh': 5.5, 'primary_material': 'wood'}})
+custom_price_model.predict({{'product_name': 'Vase', 'material': 'Clay', 'size_cm': '10x10x20', 'weight_g': 500}})
+"""
+
+def stump_forest(n_features):
+    """
+    Compiled-forest arrays for one depth-1 tree; enough to exercise loading.
+    """
+    return {
+        'version': np.array(1),
+        'feature': np.array([0, 0, 0], dtype=np.int32),
+        'threshold': np.array([0.5, -2.0, -2.0]),
+        'left': np.array([1, 1, 2], dtype=np.int32),
+        'right': np.array([2, 1, 2], dtype=np.int32),
+        'value': np.array([2.0, 1.0, 3.0]),
+        'missing_go_to_left': np.zeros(3, dtype=bool),
+        'roots': np.array([0], dtype=np.int32),
+        'max_depth': np.array(1),
+        'n_features': np.array(n_features),
+        'average': np.array(True),
+    }
+
+def write_test_bundle(path):
+    feature_names = load_names(os.path.join(BASE_DIR, 'feature_names.txt'))
+    scaler_feature_names = load_names(os.path.join(BASE_DIR, 'scaler_feature_names.txt'))
+    price_features = ['Product_Name', 'Material', 'Category', 'Region', 'Weight(g)', 'Size_L', 'Size_W', 'Size_H']
+
+    arrays = {f'carbon/forest/{k}': v for k, v in stump_forest(len(feature_names)).items()}
+    arrays.update({f'price/forest/{k}': v for k, v in stump_forest(len(price_features)).items()})
+    arrays['carbon/scaler_mean'] = np.zeros(len(scaler_feature_names))
+    arrays['carbon/scaler_scale'] = np.ones(len(scaler_feature_names))
+    meta = {
+        'carbon': {'feature_names': feature_names, 'scaler_feature_names': scaler_feature_names},
+        'price': {
+            'feature_names': price_features,
+            'labels': {'Product_Name': ['Vase'], 'Material': ['Clay'], 'Category': ['Decor'], 'Region': ['Delhi']},
+        },
+    }
+    write_bundle(path, arrays, meta, 'import-budget-test')
+
+def parse_importtime(stderr):
+    """
+    {module: cumulative microseconds} from `-X importtime` output.
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        parts = line[len('import time:'):].split('|')
+        if len(parts) != 3 or not parts[1].strip().isdigit():
+            continue  # column header
+        # Nested imports keep their extra indentation
+        modules[parts[2].rstrip()[1:]] = int(parts[1])
+    return modules
+
+def run_startup(bundle_path):
+    env = dict(os.environ, MODEL_BUNDLE_PATH=bundle_path, ML_INFERENCE_ONLY='1')
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', STARTUP_SCRIPT],
+        cwd=BASE_DIR, env=env, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Inference-only startup failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr)
+
+def test_import_budget(budget_ms=DEFAULT_BUDGET_MS):
+    with tempfile.TemporaryDirectory() as tmp:
+        bundle_path = os.path.join(tmp, 'model_bundle.bin')
+        write_test_bundle(bundle_path)
+        modules = run_startup(bundle_path)
+
+    # Top-level imports only: their cumulative time includes the submodules
+    top_level = {name: us for name, us in modules.items() if not name.startswith(' ')}
+    total_ms = sum(top_level.values()) / 1000
+    slowest = sorted(top_level.items(), key=lambda item: -item[1])[:5]
+    print(f"Inference-only startup imported {len(modules)} modules in {total_ms:.0f} ms (budget {budget_ms:.0f} ms)")
+    for name, us in slowest:
+        print(f"  {name:<24} {us / 1000:8.1f} ms")
+
+    loaded = sorted({name.strip().split('.')[0] for name in modules} & set(FORBIDDEN_MODULES))
+    assert not loaded, f"Inference-only startup imported {', '.join(loaded)}"
+    assert total_ms <= budget_ms, f"Imports took {total_ms:.0f} ms, over the {budget_ms:.0f} ms budget"
+    print("Import budget OK")
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Check the import-time budget of inference-only startup")
+    parser.add_argument('--budget-ms', type=float, default=DEFAULT_BUDGET_MS)
+    args = parser.parse_args()
+    try:
+        test_import_budget(args.budget_ms)
+    except AssertionError as e:
+        print(f"FAILED: {e}")
+        sys.exit(1)
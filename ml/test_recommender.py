@@ -0,0 +1,59 @@
+import os
+import shutil
+import tempfile
+
+# Set before app.py (and profiling.py) read them
+TMP_DIR = tempfile.mkdtemp()
+os.environ['ML_ADMIN_TOKEN'] = 'test-token'
+os.environ['RECOMMENDER_INDEX_PATH'] = os.path.join(TMP_DIR, 'recommender_index.npz')
+
+import numpy as np
+
+import recommender
+from recommender import ProductIndex, product_record
+
+# The recommendation index and the endpoint that writes to it.
+#
+#   python test_recommender.py
+
+PRODUCTS = [
+    {'_id': 'p1', 'name': 'Bamboo Basket', 'material': 'Bamboo', 'category': 'Home Decor', 'region': 'Assam',
+     'dimensions': '30x20x15', 'weight_g': 450, 'price': 1200},
+    {'_id': 'p2', 'name': 'Silk Scarf', 'material': 'Silk', 'category': 'Clothing', 'region': 'Varanasi',
+     'dimensions': '180x60x1', 'weight_g': 120, 'price': 2500},
+    {'_id': 'p3', 'name': 'Clay Pot', 'material': 'Clay', 'category': 'Home Decor', 'region': 'Rajasthan',
+     'dimensions': '20x20x25', 'weight_g': 900, 'price': 800},
+]
+
+def test_negative_weight():
+    products = [product_record(p) for p in PRODUCTS]
+    products[1]['weight_g'] = -5.0
+    index = ProductIndex.build(products)
+    assert np.isfinite(index.numeric_mean).all() and np.isfinite(index.numeric_std).all()
+    results = index.query(products[0], k=2, exclude_ids=['p1'])
+    assert len(results) == 2 and all(np.isfinite(score) for _, score in results)
+    print("Negative weight keeps scores finite: OK")
+
+def test_adding_products_needs_admin_token():
+    import app
+
+    ProductIndex.build([product_record(p) for p in PRODUCTS]).save(recommender.INDEX_PATH)
+    client = app.app.test_client()
+    new = {'products': [{'_id': 'p4', 'name': 'Jute Bag', 'material': 'Jute', 'category': 'Bags',
+                         'region': 'West Bengal', 'weight_g': 300}]}
+
+    assert client.post('/recommend/products', json=new).status_code == 403
+    assert client.post('/recommend/products', json=new, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert ProductIndex.load(recommender.INDEX_PATH).size == 3
+
+    response = client.post('/recommend/products', json=new, headers={'X-Admin-Token': 'test-token'})
+    assert response.status_code == 200, response.json
+    assert ProductIndex.load(recommender.INDEX_PATH).size == 4
+    print("Adding products needs the admin token: OK")
+
+if __name__ == "__main__":
+    test_negative_weight()
+    try:
+        test_adding_products_needs_admin_token()
+    finally:
+        shutil.rmtree(TMP_DIR)
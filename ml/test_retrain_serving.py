@@ -0,0 +1,104 @@
+import os
+import tempfile
+
+import joblib
+import numpy as np
+import pandas as pd
+
+import custom_price_model
+import data_generator
+from model_bundle import price_section, write_bundle
+from train_model import train, train_incremental
+
+# A retrained price model has to reach serving: the compiled forest and the
+# model bundle, which serving loads before the joblib artifacts, must follow
+# both a full and an incremental retrain.
+#
+#   python test_retrain_serving.py
+
+RECORDS = [
+    {'product_name': 'Bamboo Basket', 'material': 'Bamboo', 'category': 'Home Decor', 'region': 'Assam',
+     'size_cm': '30x20x15', 'weight_g': 450},
+    {'product_name': 'Terracotta Vase', 'material': 'Clay', 'category': 'Home Decor', 'region': 'Rajasthan',
+     'size_cm': '15x15x30', 'weight_g': 1200},
+]
+
+def served(model_dir):
+    """
+    Prices from the artifacts serving would load out of `model_dir`.
+    """
+    artifacts = custom_price_model.load_artifacts(
+        os.path.join(model_dir, 'model_bundle.bin'),
+        os.path.join(model_dir, 'price_prediction_model.joblib'),
+        os.path.join(model_dir, 'label_encoders.joblib'),
+        os.path.join(model_dir, 'feature_names.joblib'),
+    )
+    X, errors = custom_price_model.encode_many(RECORDS, artifacts)
+    assert not errors, errors
+    return artifacts, custom_price_model._predict_matrix(X, artifacts)
+
+def expected(model_dir):
+    # Straight from the sklearn forest just written
+    model = joblib.load(os.path.join(model_dir, 'price_prediction_model.joblib'))
+    artifacts = custom_price_model.load_artifacts(
+        os.path.join(model_dir, 'none.bin'),
+        os.path.join(model_dir, 'price_prediction_model.joblib'),
+        os.path.join(model_dir, 'label_encoders.joblib'),
+        os.path.join(model_dir, 'feature_names.joblib'),
+    )
+    X, _ = custom_price_model.encode_many(RECORDS, artifacts)
+    return model.predict(pd.DataFrame(X, columns=artifacts.feature_names))
+
+def test_retrain_reaches_serving():
+    with tempfile.TemporaryDirectory() as tmp:
+        base_csv = os.path.join(tmp, 'base.csv')
+        new_csv = os.path.join(tmp, 'new.csv')
+        data_generator.generate(base_csv, 2000, seed=1)
+        data_generator.generate(new_csv, 2000, seed=2)
+        model_dir = os.path.join(tmp, 'models')
+        cache_dir = os.path.join(tmp, 'cache')
+
+        train(base_csv, model_dir, n_jobs=1, n_estimators=10, cache_dir=cache_dir)
+        arrays, meta = price_section(*(os.path.join(model_dir, name) for name in
+                                       ('price_prediction_model.joblib', 'label_encoders.joblib', 'feature_names.joblib')))
+        write_bundle(os.path.join(model_dir, 'model_bundle.bin'), arrays, {'price': meta}, 'test')
+        artifacts, before = served(model_dir)
+        assert artifacts.model.n_trees == 10
+
+        # A full retrain with different settings
+        train(base_csv, model_dir, n_jobs=1, n_estimators=12, cache_dir=cache_dir)
+        artifacts, after_full = served(model_dir)
+        assert artifacts.model.n_trees == 12
+        assert not np.allclose(before, after_full)
+        assert np.array_equal(after_full, expected(model_dir))
+
+        train_incremental(new_csv, model_dir, n_jobs=1, new_trees=5)
+        artifacts, after_incremental = served(model_dir)
+        assert artifacts.model.n_trees == 17
+        assert not np.allclose(after_full, after_incremental)
+        assert np.array_equal(after_incremental, expected(model_dir))
+    print("Retrain reaches serving: OK")
+
+def test_stale_artifacts_are_not_served():
+    with tempfile.TemporaryDirectory() as tmp:
+        csv_path = os.path.join(tmp, 'base.csv')
+        data_generator.generate(csv_path, 1000, seed=3)
+        model_dir = os.path.join(tmp, 'models')
+        train(csv_path, model_dir, n_jobs=1, n_estimators=8, cache_dir=os.path.join(tmp, 'cache'))
+        arrays, meta = price_section(*(os.path.join(model_dir, name) for name in
+                                       ('price_prediction_model.joblib', 'label_encoders.joblib', 'feature_names.joblib')))
+        write_bundle(os.path.join(model_dir, 'model_bundle.bin'), arrays, {'price': meta}, 'test')
+
+        # Rewritten behind the bundle's and the compiled forest's back
+        model = joblib.load(os.path.join(model_dir, 'price_prediction_model.joblib'))
+        model.estimators_ = model.estimators_[:4]
+        model.n_estimators = 4
+        joblib.dump(model, os.path.join(model_dir, 'price_prediction_model.joblib'))
+        artifacts, prices = served(model_dir)
+        assert len(artifacts.model.estimators_) == 4
+        assert np.array_equal(prices, expected(model_dir))
+    print("Stale bundle and compiled forest ignored: OK")
+
+if __name__ == "__main__":
+    test_retrain_reaches_serving()
+    test_stale_artifacts_are_not_served()
@@ -0,0 +1,133 @@
+import json
+import os
+import random
+import shutil
+import tempfile
+from datetime import date, timedelta
+
+# Set before app.py (and profiling.py) read them
+TMP_DIR = tempfile.mkdtemp()
+os.environ['ML_ADMIN_TOKEN'] = 'test-token'
+os.environ['TRENDS_STATE_PATH'] = os.path.join(TMP_DIR, 'trends_state.json')
+
+import trends
+from trends import TrendStore
+
+# Incremental trend aggregation must not depend on arrival order: orders
+# ingested late, in small batches, duplicated or later cancelled have to end
+# in the same state as one ingest of the final order set.
+#
+#   python test_trends.py
+
+CATEGORIES = ['Home Decor', 'Clothing', 'Kitchenware']
+
+def make_orders(n, seed=7):
+    rng = random.Random(seed)
+    products = [{'_id': f"p{i}", 'category': CATEGORIES[i % len(CATEGORIES)]} for i in range(30)]
+    orders = []
+    for i in range(n):
+        day = date(2024, 1, 1) + timedelta(days=rng.randrange(200))
+        items = [{'product': f"p{rng.randrange(30)}", 'quantity': rng.randint(1, 3), 'price': rng.randint(100, 5000)}
+                 for _ in range(rng.randint(1, 3))]
+        orders.append({'_id': f"o{i}", 'items': items, 'status': 'Paid', 'createdAt': day.isoformat() + 'T10:00:00.000Z'})
+    return products, orders
+
+def final_state(store):
+    return store.buckets, store.summaries
+
+def test_late_and_duplicate_orders():
+    products, orders = make_orders(2000)
+    cancelled = [dict(o, status='Cancelled') for o in orders[:100]]
+
+    reference = TrendStore()
+    reference.add_products(products)
+    reference.ingest(orders[100:])
+
+    rng = random.Random(1)
+    shuffled = orders + orders[500:700] + cancelled
+    rng.shuffle(shuffled)
+    # Cancellations have to come after the orders they cancel
+    shuffled = [o for o in shuffled if o['status'] != 'Cancelled'] + cancelled
+
+    incremental = TrendStore()
+    incremental.add_products(products)
+    for i in range(0, len(shuffled), 37):
+        incremental.ingest(shuffled[i:i + 37])
+
+    assert incremental.latest_period == reference.latest_period
+    for category in CATEGORIES:
+        a, b = incremental.summaries[category], reference.summaries[category]
+        assert a['units'] == b['units'] and a['rolling'] == b['rolling'], category
+        assert a['forecast'] == b['forecast'], category
+    print("Late, duplicate and cancelled orders: OK")
+
+def test_file_resume():
+    products, orders = make_orders(500)
+    with tempfile.TemporaryDirectory() as tmp:
+        orders_path = os.path.join(tmp, 'orders.jsonl')
+        state_path = os.path.join(tmp, 'state.json')
+        with open(orders_path, 'w') as f:
+            f.writelines(json.dumps(o) + "\n" for o in orders[:300])
+            # A line still being written is left for the next ingest
+            f.write(json.dumps(orders[300])[:20])
+
+        store = TrendStore()
+        store.add_products(products)
+        assert store.ingest_file(orders_path) == 300
+        store.save(state_path)
+
+        with open(orders_path, 'w') as f:
+            f.writelines(json.dumps(o) + "\n" for o in orders)
+        store = TrendStore.load(state_path)
+        assert store.ingest_file(orders_path) == 200
+
+        reference = TrendStore()
+        reference.add_products(products)
+        reference.ingest(orders)
+        assert final_state(store) == final_state(reference)
+    print("Resumed file ingest: OK")
+
+def test_rejected_batch():
+    products, orders = make_orders(200)
+    store = TrendStore()
+    store.add_products(products)
+    store.ingest(orders[:100])
+    before = json.dumps(final_state(store), sort_keys=True)
+
+    # The bad order comes last, after orders that would change the aggregates
+    for bad in (dict(orders[0], _id='bad', createdAt='not a date'),
+                dict(orders[0], _id='bad', items=['abc']),
+                dict(orders[0], _id='bad', items=5)):
+        try:
+            store.ingest(orders[100:] + [bad])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError(f"Expected the batch to be rejected: {bad}")
+        assert json.dumps(final_state(store), sort_keys=True) == before
+        assert len(store.orders) == 100
+    print("Rejected batch leaves the store unchanged: OK")
+
+def test_posting_orders_needs_admin_token():
+    import app
+
+    _, orders = make_orders(50)
+    orders = [dict(o, items=[dict(i, category='Home Decor') for i in o['items']]) for o in orders]
+    client = app.app.test_client()
+    assert client.post('/trends/orders', json={'orders': orders}).status_code == 403
+    assert client.post('/trends/orders', json={'orders': orders}, headers={'X-Admin-Token': 'wrong'}).status_code == 403
+    assert not os.path.exists(trends.STATE_PATH)
+
+    response = client.post('/trends/orders', json={'orders': orders}, headers={'X-Admin-Token': 'test-token'})
+    assert response.status_code == 200, response.json
+    assert len(TrendStore.load(trends.STATE_PATH).orders) == 50
+    print("Posting orders needs the admin token: OK")
+
+if __name__ == "__main__":
+    test_late_and_duplicate_orders()
+    test_file_resume()
+    test_rejected_batch()
+    try:
+        test_posting_orders_needs_admin_token()
+    finally:
+        shutil.rmtree(TMP_DIR)
@@ -5,92 +5,516 @@ from sklearn.ensemble import RandomForestRegressor
 from sklearn.preprocessing import LabelEncoder
 from sklearn.metrics import mean_absolute_error, mean_squared_error
 import joblib
+import itertools
+import json
 import os
+import resource
+import shutil
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import contextmanager
+
+from compiled_forest import file_sha256
 
 # Define paths
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DATA_PATH = os.path.join(BASE_DIR, 'data', 'artisan_dataset_10000_final.csv')
 MODEL_DIR = os.path.join(BASE_DIR, 'models')
+# Encoded X/y matrices, keyed by CSV content hash and PREPROCESS_VERSION
+FEATURE_CACHE_DIR = os.environ.get('FEATURE_CACHE_DIR', os.path.join(BASE_DIR, 'cache', 'features'))
 
-# Create models directory if it doesn't exist
-if not os.path.exists(MODEL_DIR):
-    os.makedirs(MODEL_DIR)
+CATEGORICAL_COLS = ['Product_Name', 'Material', 'Category', 'Region']
+# Model columns in the order the serving code expects
+FEATURE_NAMES = CATEGORICAL_COLS + ['Weight(g)', 'Size_L', 'Size_W', 'Size_H']
+TARGET_COL = 'Price(INR)'
 
-def train():
-    print("Loading dataset...")
-    if not os.path.exists(DATA_PATH):
-        print(f"Error: Dataset not found at {DATA_PATH}")
-        return
+# Bump whenever read_dataset/encode_categoricals change what they produce,
+# so stale feature caches are not reused
+PREPROCESS_VERSION = 3
+
+# Hyperparameter grid for --search (override with --grid '{...}')
+DEFAULT_GRID = {
+    'n_estimators': [100, 200],
+    'max_depth': [None, 16],
+    'min_samples_leaf': [1, 5],
+    'max_features': [1.0, 0.5],
+}
+
+# Only the columns the model uses are read, with compact dtypes: categoricals
+# as pandas categories (int codes + one copy of each label), numerics as
+# float32 so fractional and blank values still parse. Description_Keywords
+# and Image_URL are never loaded.
+CSV_DTYPES = {
+    'Product_Name': 'category',
+    'Material': 'category',
+    'Category': 'category',
+    'Region': 'category',
+    'Size(cm)': 'string',
+    'Weight(g)': 'float32',
+    TARGET_COL: 'float32',
+}
+
+# Rows parsed per chunk while streaming the CSV
+DEFAULT_CHUNKSIZE = 200000
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == 'darwin' else rss / 1024
+
+class StageTimer:
+    """
+    Wall time and process peak RSS after each training stage.
+    """
+
+    def __init__(self):
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        print(f"{name}...")
+        start = time.perf_counter()
+        yield
+        self.stages.append((name, time.perf_counter() - start, peak_rss_mb()))
+
+    def report(self):
+        print("Stage timings:")
+        for name, seconds, rss in self.stages:
+            print(f"  {name:<34} {seconds:8.2f} s   peak RSS {rss:8.1f} MB")
+        print(f"  {'total':<34} {sum(s for _, s, _ in self.stages):8.2f} s")
+
+def split_sizes(sizes):
+    """
+    Vectorized 'LxWxH' parsing into float32 Size_L/Size_W/Size_H columns.
+    Anything that is not exactly three numbers becomes 0, 0, 0.
+    """
+    parts = sizes.astype('string').str.lower().str.split('x', expand=True)
+    out = pd.DataFrame(0.0, index=sizes.index, columns=['Size_L', 'Size_W', 'Size_H'], dtype=np.float32)
+    if parts.shape[1] < 3:
+        return out
+    dims = parts.iloc[:, :3].apply(lambda col: pd.to_numeric(col.str.strip(), errors='coerce'))
+    valid = dims.notna().all(axis=1)
+    if parts.shape[1] > 3:
+        valid &= parts.iloc[:, 3:].isna().all(axis=1)
+    out.loc[valid, :] = dims[valid].to_numpy(dtype=np.float32)
+    return out
+
+def read_dataset(path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    Streams the CSV in chunks, parsing sizes per chunk so the raw text
+    column is never held for the whole file. Categories are unioned (and
+    sorted, matching LabelEncoder's code order) across chunks.
+    """
+    chunks = []
+    reader = pd.read_csv(path, usecols=list(CSV_DTYPES), dtype=CSV_DTYPES, chunksize=chunksize)
+    dropped = 0
+    for chunk in reader:
+        # A row without a price can't be trained on; a blank weight stays NaN
+        missing = chunk[TARGET_COL].isna()
+        if missing.any():
+            dropped += int(missing.sum())
+            chunk = chunk[~missing]
+        sizes = split_sizes(chunk.pop('Size(cm)'))
+        for col in CATEGORICAL_COLS:
+            # Missing labels are encoded as the string 'nan', as before
+            if chunk[col].isna().any():
+                chunk[col] = chunk[col].cat.add_categories(['nan']).fillna('nan')
+        chunks.append(pd.concat([chunk, sizes], axis=1))
+    chunks = [c for c in chunks if len(c)]
+    if dropped:
+        print(f"Skipped {dropped} rows without {TARGET_COL} in {path}", file=sys.stderr)
+    if not chunks:
+        raise ValueError(f"{path} has no rows")
+
+    for col in CATEGORICAL_COLS:
+        categories = pd.api.types.union_categoricals([c[col] for c in chunks], sort_categories=True).categories
+        for chunk in chunks:
+            chunk[col] = chunk[col].cat.set_categories(categories)
+    return pd.concat(chunks, ignore_index=True)
 
-    df = pd.read_csv(DATA_PATH)
-    
-    # Preprocessing
-    print("Preprocessing data...")
-    
-    # 1. Handle Size(cm) -> Split into L, W, H
-    # Assuming format is "LxWxH"
-    def parse_size(size_str):
-        try:
-            parts = size_str.lower().split('x')
-            if len(parts) == 3:
-                return float(parts[0]), float(parts[1]), float(parts[2])
-            return 0.0, 0.0, 0.0
-        except:
-            return 0.0, 0.0, 0.0
-
-    df[['Size_L', 'Size_W', 'Size_H']] = df['Size(cm)'].apply(lambda x: pd.Series(parse_size(str(x))))
-    
-    # 2. Drop unused columns
-    # Description_Keywords and Image_URL might not be useful for a simple regression model without NLP/CV
-    drop_cols = ['Size(cm)', 'Description_Keywords', 'Image_URL']
-    df = df.drop(columns=[c for c in drop_cols if c in df.columns])
-    
-    # 3. Encode Categorical Variables
-    categorical_cols = ['Product_Name', 'Material', 'Category', 'Region']
+def encode_categoricals(df):
+    """
+    Replaces each categorical column with its int32 codes and returns the
+    fitted LabelEncoders (classes_ in code order) the serving code loads.
+    Each also records its most frequent label as most_frequent_, for the
+    'most_frequent' unseen label policy.
+    """
     encoders = {}
-    
-    for col in categorical_cols:
-        if col in df.columns:
-            le = LabelEncoder()
-            df[col] = le.fit_transform(df[col].astype(str))
-            encoders[col] = le
-            
-    # 4. Handle Target
-    target_col = 'Price(INR)'
-    if target_col not in df.columns:
-        print(f"Error: Target column '{target_col}' not found.")
+    for col in CATEGORICAL_COLS:
+        if col not in df.columns:
+            continue
+        le = LabelEncoder()
+        le.classes_ = np.asarray(df[col].cat.categories.astype(str), dtype=object)
+        le.most_frequent_ = str(df[col].value_counts().idxmax())
+        df[col] = df[col].cat.codes.astype(np.int32)
+        encoders[col] = le
+    return encoders
+
+def feature_cache_path(data_path, cache_dir=FEATURE_CACHE_DIR):
+    return os.path.join(cache_dir, f"{file_sha256(data_path)[:24]}-v{PREPROCESS_VERSION}")
+
+def build_features(data_path, chunksize=DEFAULT_CHUNKSIZE):
+    """
+    (X float32 matrix in FEATURE_NAMES order, y float32, encoders) from the CSV.
+    """
+    df = read_dataset(data_path, chunksize)
+    encoders = encode_categoricals(df)
+    return df[FEATURE_NAMES].to_numpy(dtype=np.float32), df[TARGET_COL].to_numpy(dtype=np.float32), encoders
+
+def save_features(path, X, y, encoders):
+    """
+    Writes X.npy, y.npy and meta.json (feature names, encoder classes) into
+    the directory `path`. Built next to it and renamed into place, so a
+    concurrent run never reads a partial cache.
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+    np.save(os.path.join(tmp_path, 'X.npy'), X)
+    np.save(os.path.join(tmp_path, 'y.npy'), y)
+    with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+        json.dump({
+            'preprocess_version': PREPROCESS_VERSION,
+            'feature_names': FEATURE_NAMES,
+            'classes': {col: [str(c) for c in le.classes_] for col, le in encoders.items()},
+            'most_frequent': {col: le.most_frequent_ for col, le in encoders.items()},
+        }, f)
+    try:
+        os.replace(tmp_path, path)
+    except OSError:
+        # Another run cached the same CSV first
+        shutil.rmtree(tmp_path, ignore_errors=True)
+
+def load_cached_features(path, mmap_mode=None):
+    """
+    Reads a feature cache back as (X, y, encoders). With mmap_mode='r' the
+    matrices are memory-mapped, so search workers share one copy.
+    """
+    X = np.load(os.path.join(path, 'X.npy'), mmap_mode=mmap_mode)
+    y = np.load(os.path.join(path, 'y.npy'), mmap_mode=mmap_mode)
+    with open(os.path.join(path, 'meta.json')) as f:
+        meta = json.load(f)
+    encoders = {}
+    for col, classes in meta['classes'].items():
+        le = LabelEncoder()
+        le.classes_ = np.asarray(classes, dtype=object)
+        le.most_frequent_ = meta['most_frequent'][col]
+        encoders[col] = le
+    return X, y, encoders
+
+def load_features(data_path=DATA_PATH, chunksize=DEFAULT_CHUNKSIZE, cache_dir=FEATURE_CACHE_DIR, use_cache=True):
+    """
+    Returns (X, y, encoders, cache_path), reusing the feature cache of this
+    exact CSV when there is one. cache_path is None with use_cache=False.
+    """
+    if not use_cache:
+        return build_features(data_path, chunksize) + (None,)
+    path = feature_cache_path(data_path, cache_dir)
+    if os.path.exists(os.path.join(path, 'meta.json')):
+        print(f"Using cached features from {path}")
+        return load_cached_features(path) + (path,)
+    X, y, encoders = build_features(data_path, chunksize)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_features(path, X, y, encoders)
+    print(f"Cached features in {path}")
+    return X, y, encoders, path
+
+def save_price_artifacts(model, encoders, feature_names, model_dir):
+    """
+    Writes the joblib artifacts, then refreshes the copies serving prefers
+    over them: the compiled forest and, when there is one, the price
+    section of the model bundle.
+    """
+    from compiled_forest import compiled_path, export_forest
+    import model_bundle
+
+    # Serving loads the model single-threaded
+    model.n_jobs = None
+    model_path = os.path.join(model_dir, 'price_prediction_model.joblib')
+    encoders_path = os.path.join(model_dir, 'label_encoders.joblib')
+    feature_names_path = os.path.join(model_dir, 'feature_names.joblib')
+    joblib.dump(model, model_path)
+    joblib.dump(encoders, encoders_path)
+    joblib.dump(feature_names, feature_names_path)
+    export_forest(model, compiled_path(model_path), model_path)
+
+    same_dir = os.path.abspath(model_dir) == os.path.abspath(MODEL_DIR)
+    bundle_path = model_bundle.DEFAULT_BUNDLE_PATH if same_dir else os.path.join(model_dir, 'model_bundle.bin')
+    if os.path.exists(bundle_path):
+        arrays, meta = model_bundle.price_section(model_path, encoders_path, feature_names_path)
+        model_bundle.replace_section(bundle_path, 'price', arrays, meta)
+        print(f"Updated the price section of {bundle_path}")
+
+def train(data_path=DATA_PATH, model_dir=MODEL_DIR, n_jobs=-1, n_estimators=100, chunksize=DEFAULT_CHUNKSIZE,
+          params=None, cache_dir=FEATURE_CACHE_DIR, use_cache=True, publish=False, shadow_percent=None):
+    timer = StageTimer()
+    if not os.path.exists(data_path):
+        print(f"Error: Dataset not found at {data_path}")
         return
-        
-    X = df.drop(columns=[target_col])
-    y = df[target_col]
-    
-    # Save feature names
-    feature_names = X.columns.tolist()
-    
-    # Split data
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    
-    # Train Model
-    print("Training Random Forest Regressor...")
-    model = RandomForestRegressor(n_estimators=100, random_state=42)
-    model.fit(X_train, y_train)
-    
-    # Evaluate
-    y_pred = model.predict(X_test)
-    mae = mean_absolute_error(y_test, y_pred)
-    rmse = np.sqrt(mean_squared_error(y_test, y_pred))
-    
+    os.makedirs(model_dir, exist_ok=True)
+
+    with timer.stage("Loading features"):
+        X, y, encoders, _ = load_features(data_path, chunksize, cache_dir, use_cache)
+    print(f"Loaded {len(y)} rows ({(X.nbytes + y.nbytes) / 1e6:.1f} MB of features)")
+
+    with timer.stage("Splitting"):
+        feature_names = list(FEATURE_NAMES)
+        X = pd.DataFrame(X, columns=feature_names)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+
+    # Trees are built in parallel; random_state keeps the forest identical
+    # whatever n_jobs is
+    params = {'n_estimators': n_estimators, **(params or {})}
+    with timer.stage(f"Training ({params['n_estimators']} trees, n_jobs={n_jobs})"):
+        model = RandomForestRegressor(random_state=42, n_jobs=n_jobs, **params)
+        model.fit(X_train, y_train)
+
+    with timer.stage("Evaluating"):
+        y_pred = model.predict(X_test)
+        mae = mean_absolute_error(y_test, y_pred)
+        rmse = np.sqrt(mean_squared_error(y_test, y_pred))
+
     print(f"Model Performance:")
     print(f"MAE: {mae:.2f}")
     print(f"RMSE: {rmse:.2f}")
-    
-    # Save Artifacts
-    print("Saving model and artifacts...")
-    joblib.dump(model, os.path.join(MODEL_DIR, 'price_prediction_model.joblib'))
-    joblib.dump(encoders, os.path.join(MODEL_DIR, 'label_encoders.joblib'))
-    joblib.dump(feature_names, os.path.join(MODEL_DIR, 'feature_names.joblib'))
-    
+
+    with timer.stage("Saving model and artifacts"):
+        save_price_artifacts(model, encoders, feature_names, model_dir)
+
+    if publish:
+        import model_registry
+        with timer.stage("Publishing to the model registry"):
+            version = model_registry.publish_price(model_dir, meta={
+                'data': os.path.abspath(data_path), 'rows': int(len(y)), 'params': params,
+                'mae': round(float(mae), 4), 'rmse': round(float(rmse), 4),
+            }, candidate_percent=shadow_percent)
+        state = f"shadowing {shadow_percent:g}% of traffic" if shadow_percent else "now current"
+        print(f"Published price version {version} ({state})")
+
+    timer.report()
     print("Training complete!")
 
+def extend_encoders(df, encoders):
+    """
+    Encodes the categorical columns of `df` (in place) with existing
+    LabelEncoders, appending labels they have not seen to the end of
+    classes_ so every old code keeps its meaning. Returns the extended
+    encoders and {column: [new labels]}. The most frequent label of the
+    original training data is kept (that of `df` for a new column).
+    """
+    extended, added = {}, {}
+    for col in CATEGORICAL_COLS:
+        classes = [str(c) for c in encoders[col].classes_] if col in encoders else []
+        most_frequent = getattr(encoders.get(col), 'most_frequent_', None) or str(df[col].value_counts().idxmax())
+        index = {label: code for code, label in enumerate(classes)}
+        categories = [str(c) for c in df[col].cat.categories]
+        new = [c for c in categories if c not in index]
+        for label in new:
+            index[label] = len(classes)
+            classes.append(label)
+        remap = np.array([index[c] for c in categories] or [0], dtype=np.int32)
+        df[col] = remap[df[col].cat.codes.to_numpy()]
+        le = LabelEncoder()
+        le.classes_ = np.asarray(classes, dtype=object)
+        le.most_frequent_ = most_frequent
+        extended[col] = le
+        if new:
+            added[col] = new
+    return extended, added
+
+def holdout_scores(model, X, y):
+    y_pred = model.predict(X)
+    return mean_absolute_error(y, y_pred), np.sqrt(mean_squared_error(y, y_pred))
+
+def train_incremental(new_data_path, model_dir=MODEL_DIR, n_jobs=-1, new_trees=20, max_trees=None,
+                      chunksize=DEFAULT_CHUNKSIZE, compare_full=False, base_data_path=DATA_PATH,
+                      publish=False, shadow_percent=None):
+    """
+    Updates the saved forest with a window of new rows instead of refitting:
+    `new_trees` trees fitted on the window are appended (warm_start), then
+    the oldest trees are retired down to `max_trees`. Encoders are extended,
+    never refitted. 20% of the window is held out to score the model before
+    and after the update and, with compare_full, a full refit on the base
+    data plus the rest of the window.
+    """
+    timer = StageTimer()
+    for path in (new_data_path, os.path.join(model_dir, 'price_prediction_model.joblib')):
+        if not os.path.exists(path):
+            print(f"Error: {path} not found")
+            return
+
+    with timer.stage("Loading current model"):
+        model = joblib.load(os.path.join(model_dir, 'price_prediction_model.joblib'))
+        encoders = joblib.load(os.path.join(model_dir, 'label_encoders.joblib'))
+        feature_names = joblib.load(os.path.join(model_dir, 'feature_names.joblib'))
+    if feature_names != FEATURE_NAMES:
+        print(f"Error: saved model uses features {feature_names}, expected {FEATURE_NAMES}; run a full training")
+        return
+    trees_before = len(model.estimators_)
+
+    with timer.stage("Encoding new rows"):
+        df = read_dataset(new_data_path, chunksize)
+        encoders, added = extend_encoders(df, encoders)
+        X = pd.DataFrame(df[FEATURE_NAMES].to_numpy(dtype=np.float32), columns=feature_names)
+        y = df[TARGET_COL].to_numpy(dtype=np.float32)
+        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    print(f"Loaded {len(y)} new rows; new labels: "
+          + (', '.join(f"{col} +{len(labels)}" for col, labels in added.items()) or "none"))
+
+    scores = {'before': holdout_scores(model, X_test, y_test)}
+
+    with timer.stage(f"Appending {new_trees} trees (n_jobs={n_jobs})"):
+        start = time.perf_counter()
+        model.set_params(warm_start=True, n_estimators=trees_before + new_trees, n_jobs=n_jobs)
+        model.fit(X_train, y_train)
+        if max_trees and len(model.estimators_) > max_trees:
+            # Oldest first: estimators_ keeps fit order
+            model.estimators_ = model.estimators_[-max_trees:]
+            model.n_estimators = max_trees
+        model.set_params(warm_start=False, n_jobs=None)
+        incremental_seconds = time.perf_counter() - start
+    scores['incremental'] = holdout_scores(model, X_test, y_test)
+
+    full_seconds = None
+    if compare_full:
+        with timer.stage("Full refit for comparison"):
+            base = read_dataset(base_data_path, chunksize)
+            extend_encoders(base, encoders)
+            X_full = pd.concat([pd.DataFrame(base[FEATURE_NAMES].to_numpy(dtype=np.float32), columns=feature_names),
+                                X_train], ignore_index=True)
+            y_full = np.concatenate([base[TARGET_COL].to_numpy(dtype=np.float32), y_train])
+            start = time.perf_counter()
+            full = RandomForestRegressor(random_state=42, n_jobs=n_jobs, n_estimators=len(model.estimators_),
+                                         **{k: v for k, v in model.get_params().items()
+                                            if k in ('max_depth', 'min_samples_leaf', 'max_features')})
+            full.fit(X_full, y_full)
+            full_seconds = time.perf_counter() - start
+        scores['full refit'] = holdout_scores(full, X_test, y_test)
+
+    print(f"Trees: {trees_before} -> {len(model.estimators_)}")
+    print(f"Holdout ({len(y_test)} new rows):")
+    for name, (mae, rmse) in scores.items():
+        fit = {'incremental': incremental_seconds, 'full refit': full_seconds}.get(name)
+        print(f"  {name:<12} MAE {mae:8.2f}   RMSE {rmse:8.2f}" + (f"   fit {fit:6.2f} s" if fit else ""))
+
+    with timer.stage("Saving model and artifacts"):
+        save_price_artifacts(model, encoders, feature_names, model_dir)
+
+    if publish:
+        import model_registry
+        mae, rmse = scores['incremental']
+        with timer.stage("Publishing to the model registry"):
+            version = model_registry.publish_price(model_dir, meta={
+                'data': os.path.abspath(new_data_path), 'rows': int(len(y)), 'incremental': True,
+                'trees': len(model.estimators_), 'mae': round(float(mae), 4), 'rmse': round(float(rmse), 4),
+            }, candidate_percent=shadow_percent)
+        state = f"shadowing {shadow_percent:g}% of traffic" if shadow_percent else "now current"
+        print(f"Published price version {version} ({state})")
+
+    timer.report()
+    print("Incremental update complete!")
+    return scores
+
+def expand_grid(grid):
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+
+def cv_task(cache_path, config_index, params, fold, folds):
+    """
+    Fits one (config, fold) pair in a worker process; returns its scores.
+    """
+    from sklearn.model_selection import KFold
+
+    X, y, _ = load_cached_features(cache_path, mmap_mode='r')
+    train_idx, test_idx = list(KFold(n_splits=folds, shuffle=True, random_state=42).split(X))[fold]
+    start = time.perf_counter()
+    model = RandomForestRegressor(random_state=42, n_jobs=1, **params)
+    model.fit(X[train_idx], y[train_idx])
+    y_pred = model.predict(X[test_idx])
+    return {
+        'config': config_index,
+        'fold': fold,
+        'mae': float(mean_absolute_error(y[test_idx], y_pred)),
+        'rmse': float(np.sqrt(mean_squared_error(y[test_idx], y_pred))),
+        'fit_seconds': time.perf_counter() - start,
+    }
+
+def search(data_path=DATA_PATH, grid=None, folds=5, workers=None, chunksize=DEFAULT_CHUNKSIZE,
+           cache_dir=FEATURE_CACHE_DIR, out_path=None):
+    """
+    K-fold cross-validation of every config in `grid`. Each (config, fold)
+    fit is a separate task on a process pool; workers memory-map the
+    feature cache instead of receiving a copy of the data.
+    """
+    timer = StageTimer()
+    configs = expand_grid(grid or DEFAULT_GRID)
+    with timer.stage("Loading features"):
+        _, y, _, cache_path = load_features(data_path, chunksize, cache_dir)
+
+    tasks = len(configs) * folds
+    scores = {i: [] for i in range(len(configs))}
+    with timer.stage(f"Cross-validating {len(configs)} configs x {folds} folds"):
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(cv_task, cache_path, i, params, fold, folds)
+                       for i, params in enumerate(configs) for fold in range(folds)]
+            for done, future in enumerate(as_completed(futures), 1):
+                result = future.result()
+                scores[result['config']].append(result)
+                print(f"  [{done}/{tasks}] config {result['config']} fold {result['fold']}: MAE {result['mae']:.2f}")
+
+    results = []
+    for i, params in enumerate(configs):
+        mae = [r['mae'] for r in scores[i]]
+        results.append({
+            'params': params,
+            'mae_mean': float(np.mean(mae)),
+            'mae_std': float(np.std(mae)),
+            'rmse_mean': float(np.mean([r['rmse'] for r in scores[i]])),
+            'fit_seconds_mean': float(np.mean([r['fit_seconds'] for r in scores[i]])),
+        })
+    results.sort(key=lambda r: r['mae_mean'])
+
+    print(f"Cross-validation on {len(y)} rows ({folds} folds), best first:")
+    for r in results:
+        print(f"  MAE {r['mae_mean']:8.2f} +/- {r['mae_std']:6.2f}   RMSE {r['rmse_mean']:8.2f}   "
+              f"fit {r['fit_seconds_mean']:6.2f} s   {json.dumps(r['params'])}")
+    timer.report()
+    print(f"Best: python train_model.py --params '{json.dumps(results[0]['params'])}'")
+    if out_path:
+        with open(out_path, 'w') as f:
+            json.dump({'data': data_path, 'rows': len(y), 'folds': folds, 'results': results}, f, indent=2)
+        print(f"Wrote {out_path}")
+    return results
+
 if __name__ == "__main__":
-    train()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train the price prediction model")
+    parser.add_argument('--data', default=DATA_PATH, help="Training CSV")
+    parser.add_argument('--model-dir', default=MODEL_DIR, help="Where the artifacts are written")
+    parser.add_argument('--n-jobs', type=int, default=-1, help="Cores used to build trees (-1 = all)")
+    parser.add_argument('--n-estimators', type=int, default=100)
+    parser.add_argument('--chunksize', type=int, default=DEFAULT_CHUNKSIZE, help="CSV rows parsed per chunk")
+    parser.add_argument('--params', type=json.loads, help="Extra RandomForestRegressor parameters as JSON")
+    parser.add_argument('--cache-dir', default=FEATURE_CACHE_DIR, help="Feature cache directory")
+    parser.add_argument('--no-cache', action='store_true', help="Re-encode the CSV and don't write a cache")
+    parser.add_argument('--publish', action='store_true', help="Publish the trained model to the model registry")
+    parser.add_argument('--shadow-percent', type=float, help="With --publish: shadow this share of traffic instead of activating")
+    parser.add_argument('--incremental', metavar='NEW_CSV', help="Update the saved model with new rows instead of retraining")
+    parser.add_argument('--new-trees', type=int, default=20, help="With --incremental: trees fitted on the new rows")
+    parser.add_argument('--max-trees', type=int, help="With --incremental: retire the oldest trees beyond this many")
+    parser.add_argument('--compare-full', action='store_true', help="With --incremental: also time and score a full refit")
+    parser.add_argument('--search', action='store_true', help="Cross-validate a hyperparameter grid instead of training")
+    parser.add_argument('--grid', type=json.loads, help="Grid for --search as JSON, {param: [values]}")
+    parser.add_argument('--folds', type=int, default=5)
+    parser.add_argument('--workers', type=int, help="Search worker processes (default: one per core)")
+    parser.add_argument('--search-out', help="Write --search results to this JSON file")
+    args = parser.parse_args()
+    if args.incremental:
+        train_incremental(args.incremental, args.model_dir, args.n_jobs, args.new_trees, args.max_trees,
+                          args.chunksize, args.compare_full, args.data, args.publish, args.shadow_percent)
+    elif args.search:
+        search(args.data, args.grid, args.folds, args.workers, args.chunksize, args.cache_dir, args.search_out)
+    else:
+        train(args.data, args.model_dir, args.n_jobs, args.n_estimators, args.chunksize,
+              args.params, args.cache_dir, not args.no_cache, args.publish, args.shadow_percent)
@@ -0,0 +1,316 @@
+import json
+import os
+import sys
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+
+from file_lock import locked
+
+# Per-category demand trends from order history, kept as pre-aggregated
+# (category, period) buckets that are updated as orders are ingested:
+#
+#   python trends.py ingest orders.jsonl --products products.jsonl
+#   python trends.py show --category "Home Decor"
+#
+# Orders are exported Order documents (server/models/Order.js), one per line.
+# Item categories come from the item itself, a populated `product`, or the
+# --products export (Product documents with _id and category).
+#
+# Each order's contribution is remembered by id, so re-ingesting an order
+# (a duplicate line, a status change to Cancelled) replaces it instead of
+# double counting, and a late order simply lands in its own past period.
+# Only the categories an ingest touches are re-summarized (rolling windows
+# and a Holt exponential-smoothing forecast over the last HISTORY_PERIODS),
+# so a /trends lookup is a dict read.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATE_PATH = os.environ.get('TRENDS_STATE_PATH', os.path.join(BASE_DIR, 'models', 'trends_state.json'))
+
+STATE_VERSION = 1
+PERIOD_DAYS = int(os.environ.get('TRENDS_PERIOD_DAYS', 7))
+# Periods are counted from a Monday, so weekly periods run Monday-Sunday
+PERIOD_ORIGIN = date(1970, 1, 5)
+HISTORY_PERIODS = 52
+ROLLING_WINDOWS = (4, 12)
+FORECAST_HORIZON = 5
+# Holt's linear smoothing: level and trend factors
+SMOOTHING_LEVEL = 0.5
+SMOOTHING_TREND = 0.2
+EXCLUDED_STATUSES = {'Cancelled'}
+UNKNOWN_CATEGORY = 'Uncategorized'
+INGEST_BATCH = 10000
+
+def object_id(value):
+    # Plain strings or mongoexport's {"$oid": "..."}
+    if isinstance(value, dict):
+        value = value.get('$oid', value.get('_id'))
+    return None if value is None else str(value)
+
+def parse_date(value):
+    """
+    createdAt as an ISO string, epoch milliseconds or mongoexport's
+    {"$date": ...}.
+    """
+    if isinstance(value, dict):
+        value = value.get('$date')
+        if isinstance(value, dict):
+            value = int(value.get('$numberLong'))
+    if isinstance(value, (int, float)):
+        return datetime.fromtimestamp(value / 1000, tz=timezone.utc).date()
+    if isinstance(value, str):
+        return datetime.fromisoformat(value.replace('Z', '+00:00')).date()
+    raise ValueError(f"Unrecognized createdAt {value!r}")
+
+def period_of(day):
+    return (day - PERIOD_ORIGIN).days // PERIOD_DAYS
+
+def period_start(period):
+    return (PERIOD_ORIGIN + timedelta(days=period * PERIOD_DAYS)).isoformat()
+
+def holt_forecast(series, horizon=FORECAST_HORIZON, alpha=SMOOTHING_LEVEL, beta=SMOOTHING_TREND):
+    """
+    Holt's linear exponential smoothing; returns (forecast, level, trend).
+    """
+    if not series:
+        return [0.0] * horizon, 0.0, 0.0
+    level, trend = float(series[0]), 0.0
+    if len(series) > 1:
+        trend = float(series[1] - series[0])
+    for value in series[1:]:
+        previous = level
+        level = alpha * value + (1 - alpha) * (level + trend)
+        trend = beta * (level - previous) + (1 - beta) * trend
+    forecast = [max(0.0, level + h * trend) for h in range(1, horizon + 1)]
+    return forecast, level, trend
+
+def read_json_records(path):
+    """
+    A JSON array or JSON lines.
+    """
+    with open(path, encoding='utf-8') as f:
+        text = f.read().strip()
+    if text.startswith('['):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+class TrendStore:
+    def __init__(self):
+        # category -> {period: [units, revenue, orders]}
+        self.buckets = {}
+        # order id -> [[category, period, units, revenue], ...] as last ingested
+        self.orders = {}
+        self.product_categories = {}
+        # file path -> byte offset already ingested
+        self.sources = {}
+        self.latest_period = None
+        self.summaries = {}
+        self._lookup = {}
+        self._lock = threading.Lock()
+
+    def add_products(self, products):
+        for p in products:
+            pid = object_id(p.get('_id', p.get('id')))
+            if pid is not None and p.get('category'):
+                self.product_categories[pid] = p['category']
+
+    def _item_category(self, item):
+        product = item.get('product')
+        if isinstance(product, dict) and product.get('category'):
+            return product['category']
+        return item.get('category') or self.product_categories.get(object_id(product)) or UNKNOWN_CATEGORY
+
+    def contributions(self, order):
+        """
+        The (category, period) amounts an order adds; none when cancelled.
+        """
+        if order.get('status') in EXCLUDED_STATUSES:
+            return []
+        period = period_of(parse_date(order.get('createdAt')))
+        items = order.get('items') or []
+        if not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            raise ValueError(f"Order {object_id(order.get('_id', order.get('id')))}: 'items' must be a list of objects")
+        totals = {}
+        for item in items:
+            category = self._item_category(item)
+            quantity = float(item.get('quantity', 1) or 0)
+            units, revenue = totals.get(category, (0.0, 0.0))
+            totals[category] = (units + quantity, revenue + quantity * float(item.get('price') or 0))
+        return [[category, period, units, revenue] for category, (units, revenue) in sorted(totals.items())]
+
+    def _apply(self, contributions, sign):
+        for category, period, units, revenue in contributions:
+            bucket = self.buckets.setdefault(category, {}).setdefault(period, [0.0, 0.0, 0])
+            bucket[0] += sign * units
+            bucket[1] += sign * revenue
+            bucket[2] += sign
+            if bucket[2] == 0:
+                del self.buckets[category][period]
+
+    def ingest(self, orders):
+        """
+        Adds or replaces orders and re-summarizes the categories they touch.
+        Returns the number of orders that changed the aggregates.
+        """
+        # Every order is validated before any is applied, so a bad one
+        # leaves the store untouched
+        updates = [(object_id(order.get('_id', order.get('id'))), self.contributions(order)) for order in orders]
+        with self._lock:
+            dirty = set()
+            changed = 0
+            latest = self.latest_period
+            for oid, new in updates:
+                old = self.orders.get(oid, []) if oid is not None else []
+                if new == old:
+                    continue
+                self._apply(old, -1)
+                self._apply(new, 1)
+                if oid is not None:
+                    if new:
+                        self.orders[oid] = new
+                    else:
+                        self.orders.pop(oid, None)
+                dirty.update(c[0] for c in old + new)
+                for c in new:
+                    latest = c[1] if latest is None else max(latest, c[1])
+                changed += 1
+            if latest != self.latest_period:
+                # The window moved: every category's series shifts
+                self.latest_period = latest
+                dirty = set(self.buckets)
+            for category in dirty:
+                self._summarize(category)
+            return changed
+
+    def ingest_file(self, path):
+        """
+        Ingests the lines appended to an orders JSONL since the last call.
+        """
+        key = os.path.abspath(path)
+        offset = self.sources.get(key, 0)
+        if os.path.getsize(path) < offset:
+            # Truncated or replaced; re-reading is safe since orders are keyed by id
+            offset = 0
+        changed, batch = 0, []
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            for line in f:
+                if not line.endswith(b'\n'):
+                    # Partially written last line; picked up next time
+                    break
+                offset += len(line)
+                if line.strip():
+                    batch.append(json.loads(line))
+                if len(batch) >= INGEST_BATCH:
+                    changed += self.ingest(batch)
+                    batch = []
+        changed += self.ingest(batch)
+        self.sources[key] = offset
+        return changed
+
+    def _summarize(self, category):
+        buckets = self.buckets.get(category)
+        if not buckets:
+            self.summaries.pop(category, None)
+            self._lookup.pop(category.lower(), None)
+            return
+        first = self.latest_period - HISTORY_PERIODS + 1
+        history = [buckets.get(p, (0.0, 0.0, 0)) for p in range(first, self.latest_period + 1)]
+        units = [round(b[0], 2) for b in history]
+        # Fit from the category's first sale, not from leading empty periods
+        start = next((i for i, b in enumerate(history) if b[2]), len(history))
+        forecast, level, trend = holt_forecast(units[start:])
+        self.summaries[category] = {
+            'category': category,
+            'period_days': PERIOD_DAYS,
+            'period_start': period_start(first),
+            'latest_period_start': period_start(self.latest_period),
+            'units': units,
+            'revenue': [round(b[1], 2) for b in history],
+            'rolling': {
+                str(w): {
+                    'units': round(sum(b[0] for b in history[-w:]), 2),
+                    'revenue': round(sum(b[1] for b in history[-w:]), 2),
+                    'orders': sum(b[2] for b in history[-w:]),
+                } for w in ROLLING_WINDOWS
+            },
+            'forecast': [round(v, 2) for v in forecast],
+            'level': round(level, 4),
+            'trend': round(trend, 4),
+        }
+        self._lookup[category.lower()] = self.summaries[category]
+
+    def get(self, category):
+        return self._lookup.get(str(category).lower())
+
+    def categories(self):
+        return sorted(self.summaries)
+
+    def save(self, path=STATE_PATH):
+        with self._lock:
+            state = {
+                'version': STATE_VERSION,
+                'period_days': PERIOD_DAYS,
+                'latest_period': self.latest_period,
+                'buckets': {c: {str(p): b for p, b in periods.items()} for c, periods in self.buckets.items()},
+                'orders': self.orders,
+                'product_categories': self.product_categories,
+                'sources': self.sources,
+            }
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f, separators=(',', ':'))
+            os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=STATE_PATH):
+        with open(path, encoding='utf-8') as f:
+            state = json.load(f)
+        if state['version'] != STATE_VERSION or state['period_days'] != PERIOD_DAYS:
+            raise ValueError(f"{path} was built with a different version or period; re-ingest the orders")
+        store = cls()
+        store.latest_period = state['latest_period']
+        store.buckets = {c: {int(p): b for p, b in periods.items()} for c, periods in state['buckets'].items()}
+        store.orders = state['orders']
+        store.product_categories = state['product_categories']
+        store.sources = state['sources']
+        for category in store.buckets:
+            store._summarize(category)
+        return store
+
+def load_store(path=STATE_PATH):
+    return TrendStore.load(path) if os.path.exists(path) else TrendStore()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Aggregate order history into per-category trends")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_ingest = sub.add_parser('ingest', help="Ingest new lines of an orders JSONL export")
+    p_ingest.add_argument('orders')
+    p_ingest.add_argument('--products', help="Products export (JSON/JSONL) mapping _id to category")
+    p_ingest.add_argument('--state', default=STATE_PATH)
+    p_show = sub.add_parser('show', help="Print the trend summary of a category")
+    p_show.add_argument('--category')
+    p_show.add_argument('--state', default=STATE_PATH)
+    args = parser.parse_args()
+
+    if args.command == 'ingest':
+        start = time.perf_counter()
+        # Loaded under the lock so orders posted to the service meanwhile are kept
+        with locked(args.state + '.lock'):
+            store = load_store(args.state)
+            if args.products:
+                store.add_products(read_json_records(args.products))
+            changed = store.ingest_file(args.orders)
+            store.save(args.state)
+        print(f"Ingested {changed} new or updated orders in {time.perf_counter() - start:.2f}s "
+              f"({len(store.orders)} orders, {len(store.summaries)} categories) -> {args.state}")
+    elif args.category:
+        summary = load_store(args.state).get(args.category)
+        if summary is None:
+            print(f"No orders for category {args.category}")
+            sys.exit(1)
+        print(json.dumps(summary, indent=2))
+    else:
+        print('\n'.join(load_store(args.state).categories()))